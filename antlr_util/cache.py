@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+
+from antlr4.error.Errors import ParseCancellationException, RecognitionException
+
+# メモリ上のキャッシュの大きさの上限(バイト，おおよそ)
+MAX_BYTES = 64 * 1024 * 1024
+# トークン1つあたりのタプルなどのおおよそのバイト数
+TOKEN_OVERHEAD = 120
+# 同じ入力なら必ず同じように失敗する(入力の字句・構文の誤りによる)例外．これだけを失敗として保存する
+# 再帰の深さやメモリ不足，バグなど他の例外は保存せず，次に同じ入力が来たら解析し直す
+DETERMINISTIC_FAILURES = (ParseCancellationException, RecognitionException, SyntaxError)
+
+
+class CachedFailure(Exception):
+    """
+    以前に失敗した入力をもう一度解析せずに失敗させるための例外
+    """
+
+
+class TokenCache():
+    """
+    (文法, 言語, 解析方法, コード)のハッシュをキーにしてトークン列を保存するキャッシュ
+    メモリ上のLRUと，複数プロセスで共有できるsqliteのファイルの2段で持つ
+    入力の誤りで失敗した入力(DETERMINISTIC_FAILURES)も保存し，同じ入力をもう一度解析しない
+
+    stats: {"memory_hits", "disk_hits", "misses", "failure_hits"} の回数
+    複数のスレッドから使ってよい(sqliteの接続はスレッドごとに作る)
+    """
+    def __init__(self, max_bytes=MAX_BYTES, path=None):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.stats = Counter()
+        # {キー: (トークン列またはCachedFailure, おおよそのバイト数)}
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # スレッドごとのsqliteの接続(connection)と，それを作ったプロセスの番号(pid)
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # 別プロセスに渡すときはロックと接続を持たせない
+        state = dict(self.__dict__)
+        del state["_lock"], state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def key(self, tokenizer, code, kind="tokens"):
+        version = "%s:%s:%s:%s:%s:%s:%s:%s" % (kind, tokenizer.LANGUAGE, tokenizer.grammarHash(),
+                                               tokenizer.START_RULE, tokenizer.LEXER_ONLY, tokenizer.SKIP_HTML,
+                                               tokenizer.PREPROCESS, tokenizer.SKIP_IF0)
+        digest = hashlib.sha1(version.encode("utf-8"))
+        digest.update(code.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def get_tokens(self, tokenizer, code, make_tokens, kind="tokens"):
+        """
+        キャッシュにあればそれを，なければmake_tokens(code)の結果を保存して返す
+        kind: 作り方の違うトークン列(getTokensの"tokens", getLexerTokensの"lexer")を別のキーにする
+        """
+        key = self.key(tokenizer, code, kind)
+        value = self._get_memory(key)
+        if value is not None:
+            self._count("memory_hits")
+        else:
+            value = self._get_disk(key)
+            if value is not None:
+                self._count("disk_hits")
+                self._put_memory(key, value)
+        if value is None:
+            self._count("misses")
+            try:
+                value = make_tokens(code)
+            except DETERMINISTIC_FAILURES as e:
+                self._put(key, CachedFailure(repr(e)))
+                raise
+            self._put(key, value)
+        elif isinstance(value, CachedFailure):
+            self._count("failure_hits")
+            raise value
+        return list(value)
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["failure_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _put(self, key, value):
+        self._put_memory(key, value)
+        self._put_disk(key, value)
+
+    def _get_memory(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _put_memory(self, key, value):
+        if isinstance(value, CachedFailure):
+            size = TOKEN_OVERHEAD
+        else:
+            size = sum(len(token[0]) + TOKEN_OVERHEAD for token in value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+
+    def _db(self):
+        if self.path is None:
+            return None
+        # fork後の子プロセスでは接続を作り直す
+        local = self._local
+        if getattr(local, "connection", None) is None or local.pid != os.getpid():
+            local.connection = sqlite3.connect(self.path, timeout=30)
+            local.connection.execute("PRAGMA journal_mode=WAL")
+            local.connection.execute(
+                "CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, tokens TEXT, error TEXT)")
+            local.pid = os.getpid()
+        return local.connection
+
+    def _get_disk(self, key):
+        db = self._db()
+        if db is None:
+            return None
+        row = db.execute("SELECT tokens, error FROM tokens WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None:
+            return CachedFailure(row[1])
+        return [tuple(token) for token in json.loads(row[0])]
+
+    def _put_disk(self, key, value):
+        db = self._db()
+        if db is None:
+            return
+        if isinstance(value, CachedFailure):
+            row = (key, None, str(value))
+        else:
+            row = (key, json.dumps(value, ensure_ascii=False), None)
+        with db:
+            db.execute("INSERT OR REPLACE INTO tokens VALUES (?, ?, ?)", row)
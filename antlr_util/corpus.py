@@ -0,0 +1,268 @@
+import random
+import re
+
+# 言語ごとの合成コードの部品
+# header/footer: ファイルの先頭と末尾，line: 1行の文(iは通し番号)，blocks: 複数行の文のひな形
+# single: 1行だけのファイル
+TEMPLATES = {
+    "Python": {
+        "header": [],
+        "footer": [],
+        "line": "value_{i} = {a} * {b} + {i}",
+        "blocks": [
+            "def func_{i}(x, y={a}):\n"
+            "    total = 0\n"
+            "    for j in range(x):\n"
+            "        if j % {b} == 0:\n"
+            "            total += j * y\n"
+            "        else:\n"
+            "            total -= {a}\n"
+            "    return total\n",
+            "class Item_{i}(object):\n"
+            "    def __init__(self, name):\n"
+            "        self.name = name\n"
+            "        self.values = [k * {a} for k in range({b})]\n"
+            "\n"
+            "    def size(self):\n"
+            "        return len(self.values) + {i}\n",
+            "while value_{i} > {b}:\n"
+            "    value_{i} = value_{i} // 2\n",
+            "try:\n"
+            "    result_{i} = data[{a}] / {b}\n"
+            "except (KeyError, ZeroDivisionError) as e:\n"
+            "    result_{i} = None\n",
+        ],
+        "single": "value = {a} * {b}",
+    },
+    "Java": {
+        "header": ["public class Generated {"],
+        "footer": ["}"],
+        "line": "    private int value_{i} = {a} * {b} + {i};",
+        "blocks": [
+            "    public int func_{i}(int x, int y) {{\n"
+            "        int total = 0;\n"
+            "        for (int j = 0; j < x; j++) {{\n"
+            "            if (j % {b} == 0) {{\n"
+            "                total += j * y;\n"
+            "            }} else {{\n"
+            "                total -= {a};\n"
+            "            }}\n"
+            "        }}\n"
+            "        return total;\n"
+            "    }}\n",
+            "    static String name_{i}(String prefix) {{\n"
+            "        StringBuilder builder = new StringBuilder(prefix);\n"
+            "        builder.append(\"item_{i}\").append({a});\n"
+            "        return builder.toString();\n"
+            "    }}\n",
+            "    private java.util.List<Integer> list_{i} = new java.util.ArrayList<>({b});\n",
+        ],
+        "single": "class A {{ int value = {a} * {b}; }}",
+    },
+    "JavaScript": {
+        "header": [],
+        "footer": [],
+        "line": "var value_{i} = {a} * {b} + {i};",
+        "blocks": [
+            "function func_{i}(x, y) {{\n"
+            "    var total = 0;\n"
+            "    for (var j = 0; j < x; j++) {{\n"
+            "        if (j % {b} === 0) {{\n"
+            "            total += j * y;\n"
+            "        }} else {{\n"
+            "            total -= {a};\n"
+            "        }}\n"
+            "    }}\n"
+            "    return total;\n"
+            "}}\n",
+            "var item_{i} = {{\n"
+            "    name: \"item_{i}\",\n"
+            "    size: function () {{ return {a} + {b}; }}\n"
+            "}};\n",
+            "while (value_{i} > {b}) {{\n"
+            "    value_{i} = Math.floor(value_{i} / 2);\n"
+            "}}\n",
+        ],
+        "single": "var value = {a} * {b};",
+    },
+    "CPP": {
+        "header": ["#include <vector>", ""],
+        "footer": [],
+        "line": "int value_{i} = {a} * {b} + {i};",
+        "blocks": [
+            "int func_{i}(int x, int y) {{\n"
+            "    int total = 0;\n"
+            "    for (int j = 0; j < x; j++) {{\n"
+            "        if (j % {b} == 0) {{\n"
+            "            total += j * y;\n"
+            "        }} else {{\n"
+            "            total -= {a};\n"
+            "        }}\n"
+            "    }}\n"
+            "    return total;\n"
+            "}}\n",
+            "struct Item_{i} {{\n"
+            "    int size;\n"
+            "    std::vector<int> values;\n"
+            "    int get() const {{ return size * {a} + {b}; }}\n"
+            "}};\n",
+        ],
+        "single": "int value = {a} * {b};",
+    },
+    "PHP": {
+        "header": ["<?php"],
+        "footer": ["?>"],
+        "line": "$value_{i} = {a} * {b} + {i};",
+        "blocks": [
+            "function func_{i}($x, $y) {{\n"
+            "    $total = 0;\n"
+            "    for ($j = 0; $j < $x; $j++) {{\n"
+            "        if ($j % {b} == 0) {{\n"
+            "            $total += $j * $y;\n"
+            "        }} else {{\n"
+            "            $total -= {a};\n"
+            "        }}\n"
+            "    }}\n"
+            "    return $total;\n"
+            "}}\n",
+            "class Item_{i} {{\n"
+            "    public $name = \"item_{i}\";\n"
+            "    public function size() {{ return {a} + {b}; }}\n"
+            "}}\n",
+            "$list_{i} = array({a}, {b}, {i});\n",
+        ],
+        "single": "<?php $value = {a} * {b}; ?>",
+    },
+}
+
+
+def generate(language, lines, seed=0):
+    """
+    言語languageのちょうどlines行の合成コードを作る．同じ引数なら同じコードになる
+    """
+    templates = TEMPLATES[language]
+    rng = random.Random("%s:%d:%d" % (language, lines, seed))
+    if lines <= len(templates["header"]) + len(templates["footer"]):
+        return templates["single"].format(a=rng.randint(1, 99), b=rng.randint(1, 99)) + "\n"
+    body = []
+    remaining = lines - len(templates["header"]) - len(templates["footer"])
+    i = 0
+    while remaining > 0:
+        block = rng.choice(templates["blocks"]).format(i=i, a=rng.randint(1, 99), b=rng.randint(2, 99))
+        size = block.count("\n")
+        if size > remaining:
+            block = templates["line"].format(i=i, a=rng.randint(1, 99), b=rng.randint(1, 99)) + "\n"
+            size = 1
+        body.append(block)
+        remaining -= size
+        i += 1
+    return "".join(line + "\n" for line in templates["header"]) + "".join(body) + \
+        "".join(line + "\n" for line in templates["footer"])
+
+
+def mutate(code, rate=0.05, seed=0):
+    """
+    数値リテラルのうち割合rate(少なくとも1つ)を別の数に置き換えたコード(差分の計測用)
+    """
+    rng = random.Random(seed)
+    numbers = list(re.finditer(r"\b\d+\b", code))
+    if not numbers:
+        return code
+    chosen = sorted(rng.sample(range(len(numbers)), max(1, round(len(numbers) * rate))))
+    pieces = []
+    end = 0
+    for index in chosen:
+        match = numbers[index]
+        pieces.append(code[end:match.start()])
+        pieces.append(str(rng.randint(100, 999)))
+        end = match.end()
+    pieces.append(code[end:])
+    return "".join(pieces)
+
+
+def generate_nested(depth, blocks=1, seed=0, indent="    "):
+    """
+    深さdepthまで入れ子にしたif文をblocks個並べたPythonのコード
+    各ブロックの最後の行の後で一度にdepth段のインデントを閉じる(DEDENTがまとめて出る)
+    空行やコメントだけの行，括弧の中の改行も混ぜる
+    """
+    rng = random.Random("nested:%d:%d:%d" % (depth, blocks, seed))
+    lines = []
+    for i in range(blocks):
+        for level in range(depth):
+            prefix = indent * level
+            lines.append("%sif value_%d > %d:" % (prefix, i, rng.randint(1, 99)))
+            choice = rng.random()
+            if choice < 0.05:
+                lines.append("")
+            elif choice < 0.1:
+                lines.append("%s# level %d" % (prefix + indent, level + 1))
+            elif choice < 0.15:
+                lines.append("%stotal = (%d +" % (prefix + indent, rng.randint(1, 99)))
+                lines.append("%d)" % rng.randint(1, 99))
+        lines.append("%stotal += %d" % (indent * depth, rng.randint(1, 99)))
+    return "\n".join(lines) + "\n"
+
+
+# HTMLが大部分を占めるPHPのテンプレートの部品(HTMLの行, PHPを含む行)
+HTML_LINES = [
+    "<div class=\"row row-{i}\" id=\"item-{i}\">",
+    "  <span class=\"label\">Item {i}</span> <b>{a}</b> items, {b}% off",
+    "</div>",
+    "<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit {a}.</p>",
+    "<ul><li><a href=\"/page/{i}\">Page {i}</a></li><li>#{b} in stock</li></ul>",
+    "<!-- block {i}: <?php echo 'not php'; ?> -->",
+    "<input type=\"text\" name=\"field_{i}\" value=\"{a}\" />",
+    "<style>.c{i} {{ color: #{b}{b}{b}; }}</style>",
+    "<STYLE>.u{i} {{ margin: {a}px; }}</STYLE>",
+    "",
+]
+PHP_IN_HTML_LINES = [
+    "<h2><?= $title_{i} ?></h2>",
+    "<a href=\"<?php echo $url_{i}; ?>\">link {i}</a>",
+    "<?php if ($count_{i} > {a}): ?>",
+    "<?php endif; ?>",
+    "<script>var total_{i} = <?php echo {a} * {b}; ?>;</script>",
+    "<SCRIPT>var count_{i} = <?php echo $count_{i}; ?>;</SCRIPT>",
+    "<?php\n$rows_{i} = array({a}, {b});\nforeach ($rows_{i} as $row) {{ echo $row; }}\n?>",
+]
+
+
+def generate_template(lines, php_rate=0.2, seed=0):
+    """
+    HTMLの中にPHPが埋め込まれたテンプレート(およそlines行)．PHPを含む行の割合はphp_rate
+    """
+    rng = random.Random("template:%d:%s:%d" % (lines, php_rate, seed))
+    body = ["<!DOCTYPE html>", "<html>", "<body>"]
+    i = 0
+    while len(body) < lines - 2:
+        pool = PHP_IN_HTML_LINES if rng.random() < php_rate else HTML_LINES
+        body.extend(rng.choice(pool).format(i=i, a=rng.randint(1, 99), b=rng.randint(1, 9)).split("\n"))
+        i += 1
+    body.extend(["</body>", "</html>"])
+    return "\n".join(body) + "\n"
+
+
+# 前処理の行とコメントが多いC++のヘッダの部品
+CPP_MACRO_PARTS = [
+    "#define FIELD_{i}(type, name) \\\n    type name##_{i}; \\\n    type get_##name##_{i}() const {{ return name##_{i}; }}",
+    "#ifndef GUARD_{i}\n#define GUARD_{i} {a}\n#endif",
+    "/*\n * block {i}: {a} * {b}\n * #include \"not_a_directive.h\"\n */",
+    "#if 0\nold_code_{i}( {{ unbalanced [\nprintf(\"%d\", {a})\n#endif",
+    "#if defined(USE_{i}) && USE_{i} > {b}\n#  include <module_{i}.h>\n#elif {a} > {b}\n#  pragma message(\"fallback {i}\")\n#endif",
+    "int value_{i} = {a} * {b}; // value {i}",
+    "#if 1\nint enabled_{i}(int x) {{ return x + {a}; }}\n#else\nint enabled_{i}(int x) {{ return x - {b}; }}\n#endif",
+]
+
+
+def generate_macro_header(lines, seed=0):
+    """
+    前処理の行・ブロックコメント・#if 0の分岐が多いC++のヘッダ(およそlines行)
+    """
+    rng = random.Random("macro:%d:%d" % (lines, seed))
+    body = ["#pragma once", "#include <vector>"]
+    i = 0
+    while len(body) < lines:
+        body.extend(rng.choice(CPP_MACRO_PARTS).format(i=i, a=rng.randint(1, 99), b=rng.randint(1, 99)).split("\n"))
+        i += 1
+    return "\n".join(body) + "\n"
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import pickle
+import sys
+
+from antlr4.atn.ATNSimulator import ATNSimulator
+from antlr4.atn.ATNState import ATNState
+from antlr4.atn.SemanticContext import SemanticContext
+from antlr4.PredictionContext import PredictionContext
+
+# DFAは深い参照を持つので，pickle中だけ再帰上限を上げる
+PICKLE_RECURSION_LIMIT = 20000
+
+
+def runtime_version():
+    # importlib.metadataは読み込みに時間がかかるので，スナップショットを使うときだけ読み込む
+    from importlib import metadata
+    try:
+        return metadata.version("antlr4-python3-runtime")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def grammar_hash(recognizer_class):
+    """
+    生成されたモジュールのserializedATN()から文法のハッシュを求める
+    """
+    module = sys.modules[recognizer_class.__module__]
+    return hashlib.sha1(module.serializedATN().encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class _DFAPickler(pickle.Pickler):
+    """
+    ATNの状態と実行時の単一インスタンスは番号だけを書き出し，
+    読み込み側のクラスが持つATNのオブジェクトに差し戻す
+    """
+    def persistent_id(self, obj):
+        if isinstance(obj, ATNState):
+            return ("state", obj.stateNumber)
+        if obj is SemanticContext.NONE:
+            return ("semantic_none",)
+        if obj is PredictionContext.EMPTY:
+            return ("context_empty",)
+        # 予測の失敗を表すDFAの状態．シミュレータは同じオブジェクトかどうかで判定する
+        if obj is ATNSimulator.ERROR:
+            return ("dfa_error",)
+        return None
+
+
+class _DFAUnpickler(pickle.Unpickler):
+    def __init__(self, file, atn):
+        super().__init__(file)
+        self.atn = atn
+
+    def persistent_load(self, pid):
+        if pid[0] == "state":
+            return self.atn.states[pid[1]]
+        if pid[0] == "semantic_none":
+            return SemanticContext.NONE
+        if pid[0] == "context_empty":
+            return PredictionContext.EMPTY
+        if pid[0] == "dfa_error":
+            return ATNSimulator.ERROR
+        raise pickle.UnpicklingError("unknown persistent id: %r" % (pid,))
+
+
+def dump_dfa(recognizer_class, file):
+    """
+    recognizer_class.decisionsToDFAに溜まったDFAの状態を書き出す
+    DFA._statesの辞書は読み込み時に組み立て直すので，状態の一覧として保存する
+    """
+    dfas = [(dfa.decision, dfa.s0, list(dfa._states), dfa.precedenceDfa)
+            for dfa in recognizer_class.decisionsToDFA if dfa.s0 is not None or dfa._states]
+    header = {"grammar": grammar_hash(recognizer_class), "runtime": runtime_version()}
+    pickle.dump(header, file, protocol=pickle.HIGHEST_PROTOCOL)
+    _DFAPickler(file, protocol=pickle.HIGHEST_PROTOCOL).dump(dfas)
+
+
+def load_dfa(recognizer_class, file):
+    """
+    dump_dfaで書き出したDFAをrecognizer_class.decisionsToDFAへ戻す
+    文法やランタイムが違うときは何もせずFalseを返す
+    """
+    header = pickle.load(file)
+    if header != {"grammar": grammar_hash(recognizer_class), "runtime": runtime_version()}:
+        return False
+    dfas = _DFAUnpickler(file, recognizer_class.atn).load()
+    for decision, s0, states, precedence_dfa in dfas:
+        # シミュレータはこのリストを共有しているので，要素を差し替える
+        dfa = recognizer_class.decisionsToDFA[decision]
+        dfa.s0 = s0
+        dfa._states = {state: state for state in states}
+        dfa.precedenceDfa = precedence_dfa
+    return True
+
+
+def save_snapshot(path, lexer_class, parser_class=None):
+    """
+    字句解析器と(あれば)構文解析器のDFAを1つのファイルに保存する
+    """
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, PICKLE_RECURSION_LIMIT))
+    try:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(parser_class is not None, f)
+            dump_dfa(lexer_class, f)
+            if parser_class is not None:
+                dump_dfa(parser_class, f)
+        os.replace(tmp_path, path)
+    finally:
+        sys.setrecursionlimit(limit)
+
+
+def load_snapshot(path, lexer_class, parser_class=None):
+    """
+    save_snapshotで保存したDFAを読み込む．読み込めたかどうかを返す
+    """
+    if not os.path.exists(path):
+        return False
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, PICKLE_RECURSION_LIMIT))
+    try:
+        with open(path, "rb") as f:
+            has_parser = pickle.load(f)
+            if not load_dfa(lexer_class, f):
+                return False
+            if parser_class is not None and has_parser:
+                return load_dfa(parser_class, f)
+        return True
+    except (pickle.UnpicklingError, EOFError, IndexError):
+        return False
+    finally:
+        sys.setrecursionlimit(limit)
@@ -0,0 +1,270 @@
+from bisect import bisect_left
+from difflib import SequenceMatcher
+
+# histogramで候補にする要素の出現回数の上限．これを超える要素しかなければMyersに任せる
+MAX_CHAIN_LENGTH = 64
+
+
+def encode_tokens(a, b):
+    """
+    2つのトークン列を，同じ文字列が同じ番号になる整数列に変換する
+    """
+    ids = {}
+    return ([ids.setdefault(x, len(ids)) for x in a],
+            [ids.setdefault(x, len(ids)) for x in b])
+
+
+def get_opcodes(a, b, engine="difflib"):
+    """
+    difflib.SequenceMatcher.get_opcodes()と同じ形の(tag, i1, i2, j1, j2)のリストを返す
+    engine: "difflib", "myers", "patience", "histogram"
+    """
+    if engine not in DIFF_ENGINES:
+        raise ValueError("Unknown diff engine: %s" % engine)
+    if engine == "difflib":
+        return SequenceMatcher(None, a, b).get_opcodes()
+    a, b = encode_tokens(a, b)
+    matches = []
+    DIFF_ENGINES[engine](a, b, 0, len(a), 0, len(b), matches)
+    return matches_to_opcodes(matches, len(a), len(b))
+
+
+def matches_to_opcodes(matches, n, m):
+    """
+    一致区間(i, j, 長さ)のリストからopcodeを作る．隣り合う一致区間はまとめる
+    """
+    opcodes = []
+    i = j = 0
+    for ai, bj, size in sorted(matches) + [(n, m, 0)]:
+        if i < ai and j < bj:
+            opcodes.append(("replace", i, ai, j, bj))
+        elif i < ai:
+            opcodes.append(("delete", i, ai, j, bj))
+        elif j < bj:
+            opcodes.append(("insert", i, ai, j, bj))
+        if size:
+            if opcodes and opcodes[-1][0] == "equal":
+                opcodes[-1] = ("equal", opcodes[-1][1], ai + size, opcodes[-1][3], bj + size)
+            else:
+                opcodes.append(("equal", ai, ai + size, bj, bj + size))
+        i, j = ai + size, bj + size
+    return opcodes
+
+
+def _trim(a, b, alo, ahi, blo, bhi, matches):
+    """
+    共通の先頭と末尾を一致区間として取り除き，残りの範囲を返す
+    """
+    start = alo
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        alo += 1
+        blo += 1
+    if alo > start:
+        matches.append((start, blo - (alo - start), alo - start))
+    end = ahi
+    while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+    if ahi < end:
+        matches.append((ahi, bhi, end - ahi))
+    return alo, ahi, blo, bhi
+
+
+def _middle_snake(a, b, alo, ahi, blo, bhi):
+    """
+    前後から同時に編集グラフを探索し，最短編集経路上の分割点を返す(Myersの線形空間版)
+    見つからなければNoneを返す
+    """
+    n = ahi - alo
+    m = bhi - blo
+    max_d = (n + m + 1) // 2
+    offset = max_d
+    length = 2 * max_d + 2
+    forward = [-1] * length
+    backward = [-1] * length
+    forward[offset + 1] = 0
+    backward[offset + 1] = 0
+    delta = n - m
+    odd = delta % 2 != 0
+    k1start = k1end = k2start = k2end = 0
+    for d in range(max_d):
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = offset + k1
+            if k1 == -d or (k1 != d and forward[k1_offset - 1] < forward[k1_offset + 1]):
+                x1 = forward[k1_offset + 1]
+            else:
+                x1 = forward[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            forward[k1_offset] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif odd:
+                k2_offset = offset + delta - k1
+                if 0 <= k2_offset < length and backward[k2_offset] != -1:
+                    if x1 >= n - backward[k2_offset]:
+                        return x1, y1
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = offset + k2
+            if k2 == -d or (k2 != d and backward[k2_offset - 1] < backward[k2_offset + 1]):
+                x2 = backward[k2_offset + 1]
+            else:
+                x2 = backward[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[ahi - 1 - x2] == b[bhi - 1 - y2]:
+                x2 += 1
+                y2 += 1
+            backward[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not odd:
+                k1_offset = offset + delta - k2
+                if 0 <= k1_offset < length and forward[k1_offset] != -1:
+                    x1 = forward[k1_offset]
+                    if x1 >= n - x2:
+                        return x1, x1 - (k1_offset - offset)
+    return None
+
+
+def myers(a, b, alo, ahi, blo, bhi, matches):
+    """
+    MyersのO(ND)差分．範囲内の一致区間をmatchesに追加する
+    再帰せずにスタックで分割統治する
+    """
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        alo, ahi, blo, bhi = _trim(a, b, *stack.pop(), matches)
+        if alo == ahi or blo == bhi:
+            continue
+        snake = _middle_snake(a, b, alo, ahi, blo, bhi)
+        if snake is None or snake in [(0, 0), (ahi - alo, bhi - blo)]:
+            continue
+        x, y = snake
+        stack.append((alo + x, ahi, blo + y, bhi))
+        stack.append((alo, alo + x, blo, blo + y))
+
+
+def _unique_anchors(a, b, alo, ahi, blo, bhi):
+    """
+    両方の範囲でちょうど1回ずつ現れる要素の組のうち，最長増加部分列をなすものを返す
+    """
+    counts = {}
+    for i in range(alo, ahi):
+        counts[a[i]] = -1 if a[i] in counts else i
+    positions = {}
+    for j in range(blo, bhi):
+        x = b[j]
+        if counts.get(x, -1) >= 0:
+            positions[x] = -1 if x in positions else j
+    pairs = sorted((counts[x], j) for x, j in positions.items() if j >= 0)
+    # 忍耐ソートでjの最長増加部分列を求める
+    tails = []
+    tail_indexes = []
+    previous = [-1] * len(pairs)
+    for index, (i, j) in enumerate(pairs):
+        k = bisect_left(tails, j)
+        if k == len(tails):
+            tails.append(j)
+            tail_indexes.append(index)
+        else:
+            tails[k] = j
+            tail_indexes[k] = index
+        previous[index] = tail_indexes[k - 1] if k > 0 else -1
+    anchors = []
+    index = tail_indexes[-1] if tail_indexes else -1
+    while index >= 0:
+        anchors.append(pairs[index])
+        index = previous[index]
+    anchors.reverse()
+    return anchors
+
+
+def patience(a, b, alo, ahi, blo, bhi, matches):
+    """
+    patience diff．両方で1回だけ現れる要素を目印に分割し，目印がなければMyersに任せる
+    """
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        alo, ahi, blo, bhi = _trim(a, b, *stack.pop(), matches)
+        if alo == ahi or blo == bhi:
+            continue
+        anchors = _unique_anchors(a, b, alo, ahi, blo, bhi)
+        if not anchors:
+            myers(a, b, alo, ahi, blo, bhi, matches)
+            continue
+        i0, j0 = alo, blo
+        for i, j in anchors:
+            matches.append((i, j, 1))
+            stack.append((i0, i, j0, j))
+            i0, j0 = i + 1, j + 1
+        stack.append((i0, ahi, j0, bhi))
+
+
+def _histogram_split(a, b, alo, ahi, blo, bhi):
+    """
+    aの範囲で出現回数が最も少ない要素から伸ばした一致区間を返す(同じ回数なら長いもの)
+    """
+    occurrences = {}
+    for i in range(alo, ahi):
+        occurrences.setdefault(a[i], []).append(i)
+    best = None
+    best_count = MAX_CHAIN_LENGTH + 1
+    j = blo
+    while j < bhi:
+        positions = occurrences.get(b[j])
+        next_j = j + 1
+        if positions is None or len(positions) > best_count:
+            j = next_j
+            continue
+        for i in positions:
+            start_i, start_j = i, j
+            while start_i > alo and start_j > blo and a[start_i - 1] == b[start_j - 1]:
+                start_i -= 1
+                start_j -= 1
+            end_i, end_j = i + 1, j + 1
+            count = len(occurrences[a[i]])
+            while end_i < ahi and end_j < bhi and a[end_i] == b[end_j]:
+                count = min(count, len(occurrences[a[end_i]]))
+                end_i += 1
+                end_j += 1
+            size = end_i - start_i
+            if best is None or count < best_count or (count == best_count and size > best[2]):
+                best = (start_i, start_j, size)
+                best_count = count
+            next_j = max(next_j, end_j)
+        j = next_j
+    return best
+
+
+def histogram(a, b, alo, ahi, blo, bhi, matches):
+    """
+    histogram diff(gitと同じ考え方)．出現回数の少ない要素の一致区間で分割し，
+    候補がなければMyersに任せる
+    """
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        alo, ahi, blo, bhi = _trim(a, b, *stack.pop(), matches)
+        if alo == ahi or blo == bhi:
+            continue
+        split = _histogram_split(a, b, alo, ahi, blo, bhi)
+        if split is None:
+            myers(a, b, alo, ahi, blo, bhi, matches)
+            continue
+        i, j, size = split
+        matches.append(split)
+        stack.append((i + size, ahi, j + size, bhi))
+        stack.append((alo, i, blo, j))
+
+
+DIFF_ENGINES = {
+    "difflib": None,
+    "myers": myers,
+    "patience": patience,
+    "histogram": histogram,
+}
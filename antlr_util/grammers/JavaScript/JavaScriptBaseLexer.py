@@ -1,20 +1,25 @@
 
+import sys
 from antlr4 import *
 
 
 class JavaScriptBaseLexer(Lexer):
-    """Stores values of nested modes. By default mode is strict or
-    defined externally (useStrictDefault)"""
-    scopeStrictModes = []
-    lastToken: Token = None
+    def __init__(self, input=None, output=sys.stdout):
+        super().__init__(input, output)
+        # All state is per instance so that lexers can run in several threads.
 
-    """Default value of strict mode
-    Can be defined externally by setUseStrictDefault"""
-    useStrictDefault = False
+        """Stores values of nested modes. By default mode is strict or
+        defined externally (useStrictDefault)"""
+        self.scopeStrictModes = []
+        self.lastToken: Token = None
 
-    """Current value of strict mode
-    Can be defined during parsing, see StringFunctions.js and StringGlobal.js samples"""
-    useStrictCurrent = False
+        """Default value of strict mode
+        Can be defined externally by setUseStrictDefault"""
+        self.useStrictDefault = False
+
+        """Current value of strict mode
+        Can be defined during parsing, see StringFunctions.js and StringGlobal.js samples"""
+        self.useStrictCurrent = False
 
     def getStrictDefault(self) -> bool:
         return self.useStrictDefault
@@ -26,6 +31,12 @@ class JavaScriptBaseLexer(Lexer):
     def IsSrictMode(self):
         return self.useStrictCurrent
 
+    def reset(self):
+        super().reset()
+        self.lastToken = None
+        self.useStrictCurrent = self.useStrictDefault
+        self.scopeStrictModes = []
+
     def nextToken(self) -> Token:
         """Return the next token from the character stream and records this last
         token in case it resides on the default channel. This recorded token
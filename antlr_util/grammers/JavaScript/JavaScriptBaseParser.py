@@ -1,34 +1,102 @@
-
 from antlr4 import *
 
+if __name__ is not None and "." in __name__:
+    from .JavaScriptLexer import JavaScriptLexer
+else:
+    from JavaScriptLexer import JavaScriptLexer
+
+# Bits of the per-token flags computed by precedingLineTerminator.
+# A LineTerminator on the HIDDEN channel directly precedes the token (here(LineTerminator)).
+HIDDEN_LINE_TERMINATOR = 1
+# A line terminator, or a multi line comment containing one, precedes the token (lineTerminatorAhead()).
+LINE_TERMINATOR_AHEAD = 2
+
+
+def precedingLineTerminator(tokens, index: int) -> int:
+    """
+    Returns the HIDDEN_LINE_TERMINATOR / LINE_TERMINATOR_AHEAD flags of
+    tokens[index]. Only the tokens before index are looked at, so the
+    flags of a token can be computed as soon as it is fetched.
+    """
+    if index < 1:
+        return 0
+    ahead = tokens[index - 1]
+    if ahead.channel != Token.HIDDEN_CHANNEL:
+        # We're only interested in tokens on the HIDDEN channel.
+        return 0
+    if ahead.type == JavaScriptLexer.LineTerminator:
+        return HIDDEN_LINE_TERMINATOR | LINE_TERMINATOR_AHEAD
+    if ahead.type == JavaScriptLexer.WhiteSpaces:
+        # Look at the token ahead of the whitespaces.
+        if index < 2:
+            return 0
+        ahead = tokens[index - 2]
+    if ahead.type == JavaScriptLexer.LineTerminator:
+        return LINE_TERMINATOR_AHEAD
+    if ahead.type == JavaScriptLexer.MultiLineComment:
+        text = ahead.text
+        if "\r" in text or "\n" in text:
+            return LINE_TERMINATOR_AHEAD
+    return 0
+
+
+class JavaScriptTokenStream(CommonTokenStream):
+    """
+    A CommonTokenStream that computes the line terminator flags of every
+    token once, when the token is fetched from the lexer. The parser
+    predicates then only index lineTerminatorFlags.
+    """
+    def __init__(self, lexer: Lexer, channel: int = Token.DEFAULT_CHANNEL):
+        super().__init__(lexer, channel)
+        self.lineTerminatorFlags = bytearray()
+
+    def fetch(self, n: int):
+        fetched = super().fetch(n)
+        tokens = self.tokens
+        flags = self.lineTerminatorFlags
+        for i in range(len(flags), len(tokens)):
+            flags.append(precedingLineTerminator(tokens, i))
+        return fetched
+
+    def setTokenSource(self, tokenSource: Lexer):
+        super().setTokenSource(tokenSource)
+        self.lineTerminatorFlags = bytearray()
+
 
 class JavaScriptBaseParser(Parser):
     def p(self, s: str) -> bool:
         return self.prev(s)
 
     def prev(self, s: str) -> bool:
-        return self._input.LT(-1).getText().equals(s)
+        token = self._input.LT(-1)
+        return token is not None and token.text == s
 
     def n(self, s: str) -> bool:
         return self.next(s)
 
     def next(self, s: str) -> bool:
-        return self._input.LT(1).getText().equals(s)
+        return self._input.LT(1).text == s
 
     def notLineTerminator(self) -> bool:
-        from .JavaScriptParser import JavaScriptParser
-        return not self.here(JavaScriptParser.LineTerminator)
+        return not self.lineTerminatorFlags() & HIDDEN_LINE_TERMINATOR
 
     def notOpenBraceAndNotFunction(self) -> bool:
-        from .JavaScriptParser import JavaScriptParser
-
         nextTokenType = self._input.LT(1).type
-        return nextTokenType != JavaScriptParser.OpenBrace and nextTokenType != JavaScriptParser.Function
+        return nextTokenType != JavaScriptLexer.OpenBrace and nextTokenType != JavaScriptLexer.Function
 
     def closeBrace(self) -> bool:
-        from .JavaScriptParser import JavaScriptParser
+        return self._input.LT(1).type == JavaScriptLexer.CloseBrace
 
-        return self._input.LT(1).type == JavaScriptParser.CloseBrace
+    def lineTerminatorFlags(self) -> int:
+        """
+        Returns the line terminator flags of the current token, from the
+        table of a JavaScriptTokenStream when there is one.
+        """
+        index = self._input.LT(1).tokenIndex
+        flags = getattr(self._input, "lineTerminatorFlags", None)
+        if flags is not None and index < len(flags):
+            return flags[index]
+        return precedingLineTerminator(self._input.tokens, index)
 
     def here(self, tokenType: int) -> bool:
         """
@@ -42,14 +110,17 @@ class JavaScriptBaseParser(Parser):
             token stream a token of the given {@code type} exists on the
             {@code HIDDEN} channel.
         """
+        if tokenType == JavaScriptLexer.LineTerminator:
+            return bool(self.lineTerminatorFlags() & HIDDEN_LINE_TERMINATOR)
         # Get the token ahead of the current index.
-        assert isinstance(self.getCurrentToken(), Token)
-        possibleIndexEosToken: Token = self.getCurrentToken().tokenIndex - 1
-        ahead = self._input.get(possibleIndexEosToken)
+        index = self._input.LT(1).tokenIndex
+        if index < 1:
+            return False
+        ahead = self._input.get(index - 1)
 
         # Check if the token resides on the HIDDEN channel and if it's of the
         # provided type.
-        return (ahead.channel == Lexer.HIDDEN) and (ahead.type == tokenType)
+        return (ahead.channel == Token.HIDDEN_CHANNEL) and (ahead.type == tokenType)
 
     def lineTerminatorAhead(self) -> bool:
         """
@@ -63,29 +134,4 @@ class JavaScriptBaseParser(Parser):
         either is a line terminator, or is a multi line comment that
         contains a line terminator.
         """
-        from .JavaScriptParser import JavaScriptParser
-
-        # Get the token ahead of the current index.
-        possibleIndexEosToken: Token = self.getCurrentToken().tokenIndex - 1
-        ahead: Token = self._input.get(possibleIndexEosToken)
-
-        if ahead.channel != Lexer.HIDDEN:
-            # We're only interested in tokens on the HIDDEN channel.
-            return False
-
-        if ahead.type == JavaScriptParser.LineTerminator:
-            # There is definitely a line terminator ahead.
-            return True
-
-        if ahead.type == JavaScriptParser.WhiteSpaces:
-            # Get the token ahead of the current whitespaces.
-            possibleIndexEosToken = self.getCurrentToken().tokenIndex - 2
-            ahead = self._input.get(possibleIndexEosToken)
-
-        # Get the token's text and type.
-        text = ahead.text
-        tokenType = ahead.type
-
-        # Check if the token is, or contains a line terminator.
-        return ((tokenType == JavaScriptParser.MultiLineComment and (text.contains("\r") or text.contains("\n"))) or
-                (tokenType == JavaScriptParser.LineTerminator))
+        return bool(self.lineTerminatorFlags() & LINE_TERMINATOR_AHEAD)
@@ -24,21 +24,50 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
+import re
+import sys
 from antlr4 import *
 from antlr4.Token import CommonToken
 
+# Where plain HTML text ends for the HTML fast path: a PHP or ASP open tag
+# (also <?xml), a script or style tag, a comment or a DTD.
+# Case-sensitive on purpose: HtmlScriptOpen/HtmlStyleOpen in PhpLexer.g4 only
+# match lower-case 'script'/'style', so <SCRIPT> is an ordinary tag there too.
+_HTML_STOP = re.compile(r"<(?:[?%!]|script|style)")
+_SEA_WHITESPACE = re.compile(r"[ \t\r\n]+")
+
 
 class PhpBaseLexer(Lexer):
-    AspTags = True
-    _scriptTag = False
-    _styleTag = False
-    _heredocIdentifier = None
-    _prevTokenType = 0
-    _htmlNameText = None
-    _phpScript = False
-    _insideString = False
+    def __init__(self, input=None, output=sys.stdout):
+        super(PhpBaseLexer, self).__init__(input, output)
+        # All state is per instance so that lexers can run in several threads.
+        self.AspTags = True
+        self._scriptTag = False
+        self._styleTag = False
+        self._heredocIdentifier = None
+        self._prevTokenType = 0
+        self._htmlNameText = None
+        self._phpScript = False
+        self._insideString = False
+        # Emit plain HTML between PHP blocks as one coarse token instead of
+        # running the ATN lexer over every tag and attribute (see SkipHtmlText).
+        self.SkipHtml = False
+
+    def reset(self):
+        super(PhpBaseLexer, self).reset()
+        self._scriptTag = False
+        self._styleTag = False
+        self._heredocIdentifier = None
+        self._prevTokenType = 0
+        self._htmlNameText = None
+        self._phpScript = False
+        self._insideString = False
 
     def nextToken(self):
+        if self.SkipHtml and self._mode == self.DEFAULT_MODE and not self._modeStack:
+            token = self.SkipHtmlText()
+            if token is not None:
+                return token
         token = super(PhpBaseLexer, self).nextToken()
 
         if token.type == self.PHPEnd or token.type == self.PHPEndSingleLineComment:
@@ -88,6 +117,45 @@ class PhpBaseLexer(Lexer):
 
         return token
 
+    def SkipHtmlText(self):
+        """
+        Fast path for template-heavy files. In the top-level HTML mode, the
+        text up to the next PHP open tag, script or style tag, comment or DTD
+        is emitted as one HtmlText token (or SeaWhitespace if it is only
+        whitespace), and the ATN lexer takes over from there. If that point
+        is inside a tag (e.g. <a href="<?php ...), the tag is left to the ATN
+        lexer too, so PHP blocks are lexed exactly as without the fast path.
+        Returns None when the ATN lexer should run at the current position.
+        """
+        text = self._input.strdata
+        start = self._input.index
+        if start == 0 and text.startswith("#"):
+            # Leave a shebang line to the Shebang rule.
+            return None
+        stop = _HTML_STOP.search(text, start)
+        end = stop.start() if stop is not None else len(text)
+        tag = text.rfind("<", start, end)
+        if tag != -1 and text.find(">", tag, end) == -1:
+            end = tag
+        if end <= start:
+            return None
+
+        interp = self._interp
+        line, column = interp.line, interp.column
+        newlines = text.count("\n", start, end)
+        if newlines:
+            interp.line += newlines
+            interp.column = end - text.rfind("\n", start, end) - 1
+        else:
+            interp.column += end - start
+        self._input.seek(end)
+        if _SEA_WHITESPACE.fullmatch(text, start, end):
+            token_type, channel = self.SeaWhitespace, self.HIDDEN
+        else:
+            token_type, channel = self.HtmlText, Token.DEFAULT_CHANNEL
+        return self._factory.create(self._tokenFactorySourcePair, token_type, None, channel,
+                                    start, end - 1, line, column)
+
     def GetHeredocEnd(self, text):
         return text.strip().rstrip(';')
 
@@ -118,7 +186,7 @@ class PhpBaseLexer(Lexer):
     def PopModeOnCurlyBracketClose(self):
         if self._insideString:
             self._insideString = False
-            self.channel(SkipChannel)
+            self._channel = self.SkipChannel
             self.popMode()
 
     def ShouldPushHereDocMode(self, pos):
@@ -5,15 +5,12 @@ from typing.io import TextIO
 import sys
 
 
-from antlr4.Token import CommonToken
-import re
-import importlib
-
-# Allow languages to extend the lexer and parser, by loading the parser dynamically
-module_path = __name__[:-5]
-language_name = __name__.split('.')[-1]
-language_name = language_name[:-5]  # Remove Lexer from name
-LanguageParser = getattr(importlib.import_module('{}Parser'.format(module_path)), '{}Parser'.format(language_name))
+# In a combined grammar the superClass option only applies to the parser,
+# so the lexer picks up its base class by rebinding the name Lexer.
+if __name__ is not None and "." in __name__:
+    from .Python3LexerBase import Python3LexerBase as Lexer
+else:
+    from Python3LexerBase import Python3LexerBase as Lexer
 
 
 
@@ -699,96 +696,10 @@ class Python3Lexer(Lexer):
         self._predicates = None
 
 
-    @property
-    def tokens(self):
-        try:
-            return self._tokens
-        except AttributeError:
-            self._tokens = []
-            return self._tokens
-
-    @property
-    def indents(self):
-        try:
-            return self._indents
-        except AttributeError:
-            self._indents = []
-            return self._indents
-
-    @property
-    def opened(self):
-        try:
-            return self._opened
-        except AttributeError:
-            self._opened = 0
-            return self._opened
-
-    @opened.setter
-    def opened(self, value):
-        self._opened = value
-
-    @property
-    def lastToken(self):
-        try:
-            return self._lastToken
-        except AttributeError:
-            self._lastToken = None
-            return self._lastToken
-
-    @lastToken.setter
-    def lastToken(self, value):
-        self._lastToken = value
-
-    def reset(self):
-        super().reset()
-        self.tokens = []
-        self.indents = []
-        self.opened = 0
-        self.lastToken = None
-
-    def emitToken(self, t):
-        super().emitToken(t)
-        self.tokens.append(t)
-
-    def nextToken(self):
-        if self._input.LA(1) == Token.EOF and self.indents:
-            for i in range(len(self.tokens)-1,-1,-1):
-                if self.tokens[i].type == Token.EOF:
-                    self.tokens.pop(i)
-
-            self.emitToken(self.commonToken(LanguageParser.NEWLINE, '\n'))
-            while self.indents:
-                self.emitToken(self.createDedent())
-                self.indents.pop()
-
-            self.emitToken(self.commonToken(LanguageParser.EOF, "<EOF>"))
-        next = super().nextToken()
-        if next.channel == Token.DEFAULT_CHANNEL:
-            self.lastToken = next
-        return next if not self.tokens else self.tokens.pop(0)
-
-    def createDedent(self):
-        dedent = self.commonToken(LanguageParser.DEDENT, "")
-        dedent.line = self.lastToken.line
-        return dedent
-
-    def commonToken(self, type, text, indent=0):
-        stop = self.getCharIndex()-1-indent
-        start = (stop - len(text) + 1) if text else stop
-        return CommonToken(self._tokenFactorySourcePair, type, super().DEFAULT_TOKEN_CHANNEL, start, stop)
-
-    @staticmethod
-    def getIndentationCount(spaces):
-        count = 0
-        for ch in spaces:
-            if ch == '\t':
-                count += 8 - (count % 8)
-            else:
-                count += 1
-        return count
-
-    def atStartOfInput(self):
-        return Lexer.column.fget(self) == 0 and Lexer.line.fget(self) == 1
+    # The Python target does not give the lexer the types from tokens { INDENT, DEDENT },
+    # so they are spelled out here (same values as Python3.tokens) instead of importing the parser.
+    INDENT = 98
+    DEDENT = 99
 
 
     def action(self, localctx:RuleContext, ruleIndex:int, actionIndex:int):
@@ -811,33 +722,7 @@ class Python3Lexer(Lexer):
 
     def NEWLINE_action(self, localctx:RuleContext , actionIndex:int):
         if actionIndex == 0:
-
-            tempt = Lexer.text.fget(self)
-            newLine = re.sub("[^\r\n\f]+", "", tempt)
-            spaces = re.sub("[\r\n\f]+", "", tempt)
-            la_char = ""
-            try:
-                la = self._input.LA(1)
-                la_char = chr(la)       # Python does not compare char to ints directly
-            except ValueError:          # End of file
-                pass
-
-            if self.opened > 0 or la_char == '\r' or la_char == '\n' or la_char == '\f' or la_char == '#':
-                self.skip()
-            else:
-                indent = self.getIndentationCount(spaces)
-                previous = self.indents[-1] if self.indents else 0
-                self.emitToken(self.commonToken(self.NEWLINE, newLine, indent=indent))      # NEWLINE is actually the '\n' char
-                if indent == previous:
-                    self.skip()
-                elif indent > previous:
-                    self.indents.append(indent)
-                    self.emitToken(self.commonToken(LanguageParser.INDENT, spaces))
-                else:
-                    while self.indents and self.indents[-1] > indent:
-                        self.emitToken(self.createDedent())
-                        self.indents.pop()
-                
+            self.onNewline()
      
 
     def OPEN_PAREN_action(self, localctx:RuleContext , actionIndex:int):
@@ -0,0 +1,110 @@
+import sys
+from collections import deque
+from antlr4 import *
+from antlr4.Token import CommonToken
+
+# 改行の次がこれらの文字(空行，コメントだけの行)ならNEWLINEを出さない
+_BLANK_LINE_LOOKAHEAD = frozenset([ord("\r"), ord("\n"), ord("\f"), ord("#")])
+
+
+class Python3LexerBase(Lexer):
+    """
+    インデントからINDENT/DEDENTを作るPythonの字句解析器の基底クラス
+    tokens: まだ返していないトークンの待ち行列
+    indents: 開いているブロックのインデントの幅のスタック
+    opened: 開いている括弧の数(括弧の中の改行は無視する)
+    lastToken: 最後に字句解析した既定チャンネルのトークン
+    INDENT, DEDENTの種類は生成された字句解析器のクラスが持つ
+    """
+    def __init__(self, input=None, output=sys.stdout):
+        super().__init__(input, output)
+        self.tokens = deque()
+        self.indents = []
+        self.opened = 0
+        self.lastToken = None
+
+    def reset(self):
+        super().reset()
+        self.tokens = deque()
+        self.indents = []
+        self.opened = 0
+        self.lastToken = None
+
+    def emitToken(self, t):
+        # Lexer.emitTokenは_tokenに入れるだけ
+        self._token = t
+        self.tokens.append(t)
+
+    def nextToken(self):
+        if self.indents and self._input.LA(1) == Token.EOF:
+            self.closeIndents()
+        token = super().nextToken()
+        if token.channel == Token.DEFAULT_CHANNEL:
+            self.lastToken = token
+        tokens = self.tokens
+        return tokens.popleft() if tokens else token
+
+    def closeIndents(self):
+        """
+        入力の終わりで，待っているEOFを捨ててNEWLINEと開いているブロックの数だけDEDENTを出し，EOFで終える
+        """
+        tokens = self.tokens
+        if any(t.type == Token.EOF for t in tokens):
+            self.tokens = tokens = deque(t for t in tokens if t.type != Token.EOF)
+        self.emitToken(self.commonToken(self.NEWLINE, "\n"))
+        for _ in range(len(self.indents)):
+            self.emitToken(self.createDedent())
+        self.indents.clear()
+        self.emitToken(self.commonToken(Token.EOF, "<EOF>"))
+
+    def onNewline(self):
+        """
+        NEWLINEの規則の動作．行頭の空白の幅を直前のブロックと比べてINDENT/DEDENTを出す
+        括弧の中，空行，コメントだけの行の改行は読み飛ばす
+        """
+        if self.opened > 0 or self._input.LA(1) in _BLANK_LINE_LOOKAHEAD:
+            self.skip()
+            return
+        text = self.text
+        # 改行の文字の後に行頭の空白が続く(入力の先頭では空白だけ)
+        spaces = text.lstrip("\r\n\f")
+        newline = text[:len(text) - len(spaces)]
+        indent = self.getIndentationCount(spaces)
+        indents = self.indents
+        previous = indents[-1] if indents else 0
+        # NEWLINEの位置は改行の文字
+        self.emitToken(self.commonToken(self.NEWLINE, newline, indent=indent))
+        if indent == previous:
+            self.skip()
+        elif indent > previous:
+            indents.append(indent)
+            self.emitToken(self.commonToken(self.INDENT, spaces))
+        else:
+            while indents and indents[-1] > indent:
+                self.emitToken(self.createDedent())
+                indents.pop()
+
+    def createDedent(self):
+        dedent = self.commonToken(self.DEDENT, "")
+        dedent.line = self.lastToken.line
+        return dedent
+
+    def commonToken(self, type, text, indent=0):
+        stop = self.getCharIndex() - 1 - indent
+        start = (stop - len(text) + 1) if text else stop
+        return CommonToken(self._tokenFactorySourcePair, type, Token.DEFAULT_CHANNEL, start, stop)
+
+    @staticmethod
+    def getIndentationCount(spaces):
+        if "\t" not in spaces:
+            return len(spaces)
+        count = 0
+        for ch in spaces:
+            if ch == "\t":
+                count += 8 - (count % 8)
+            else:
+                count += 1
+        return count
+
+    def atStartOfInput(self):
+        return self._interp.column == 0 and self._interp.line == 1
@@ -0,0 +1,149 @@
+from antlr4 import Token, TerminalNode, CommonTokenStream
+from antlr4.ListTokenSource import ListTokenSource
+from antlr4.atn.PredictionMode import PredictionMode
+from antlr4.error.ErrorStrategy import BailErrorStrategy
+from antlr4.error.Errors import ParseCancellationException
+
+
+def node_span(node):
+    """
+    ノードが覆う文字の範囲[start, stop]．空の規則ならNone
+    """
+    if isinstance(node, TerminalNode):
+        return node.symbol.start, node.symbol.stop
+    if node.start is None or node.stop is None or node.stop.tokenIndex < node.start.tokenIndex:
+        return None
+    return node.start.start, node.stop.stop
+
+
+def enclosing_path(tree, start, stop):
+    """
+    文字の範囲[start, stop)を含む規則のノードを，根から深い順に返す
+    子は開始位置の順に並んでいるので，二分探索で降りる
+    """
+    path = []
+    node = tree
+    while node is not None and not isinstance(node, TerminalNode):
+        path.append(node)
+        children = node.children or []
+        low, high = 0, len(children)
+        while low < high:
+            middle = (low + high) // 2
+            span = node_span(children[middle])
+            if span is not None and span[0] > start:
+                high = middle
+            else:
+                low = middle + 1
+        node = None
+        for child in reversed(children[:low]):
+            span = node_span(child)
+            if span is None:
+                continue
+            if span[0] <= start and stop <= span[1] + 1:
+                node = child
+            break
+    return path
+
+
+def replace_text(stream, start, stop, text):
+    """
+    InputStreamの中身をその場で書き換える
+    同じ文書のトークンはこのストリームを共有しているので，位置をずらせば文字列も正しく取り出せる
+    """
+    stream.strdata = stream.strdata[:start] + text + stream.strdata[stop:]
+    stream.data[start:stop] = [ord(c) for c in text]
+    stream._size = len(stream.data)
+
+
+def relex_region(lexer, tokens, first, last, delta):
+    """
+    tokens[first..last]の範囲を書き換え後のストリームから字句解析し直す
+    範囲の次のトークン(位置はdeltaだけずれる)と同じトークンが同じ位置に現れたら，
+    字句解析器の状態が元に戻ったとみなす
+    :return: (新しいトークンのリスト, 範囲の次のトークンに対応する新しいトークン)．戻らなければNone
+    """
+    if last + 1 >= len(tokens):
+        return None
+    following = tokens[last + 1]
+    target = following.start + delta
+    # 範囲の末尾で，次のトークンと同じ位置にあるトークン(PythonのDEDENTなど)の数
+    tail = 0
+    while last - tail >= first and tokens[last - tail].start == following.start:
+        tail += 1
+    region = []
+    at_target = 0
+    while True:
+        token = lexer.nextToken()
+        if token.start > target:
+            return None
+        if token.start == target:
+            at_target += 1
+            if at_target > tail:
+                if token.type == following.type and token.channel == following.channel and \
+                        token.stop == following.stop + delta:
+                    return region, token
+                return None
+        if token.type == Token.EOF:
+            return None
+        region.append(token)
+
+
+def parse_region(parser, rule, region):
+    """
+    トークン列だけを規則ruleで解析する．構文エラーなく全てのトークンをちょうど使い切ったときだけ構文木を返す
+    SLL予測で失敗したらLL予測で試す
+    """
+    for mode in [PredictionMode.SLL, PredictionMode.LL]:
+        parser.setInputStream(CommonTokenStream(ListTokenSource(region)))
+        parser._interp.predictionMode = mode
+        parser._errHandler = BailErrorStrategy()
+        try:
+            ctx = getattr(parser, rule)()
+        except ParseCancellationException:
+            continue
+        if parser.getCurrentToken().type == Token.EOF:
+            return ctx
+    return None
+
+
+def splice(tokens, old_ctx, new_ctx, region, following, matched, delta):
+    """
+    古いノードを新しいノードに差し替え，トークン列とその後ろのトークンの位置を更新する
+    """
+    first = old_ctx.start.tokenIndex
+    last = old_ctx.stop.tokenIndex
+    parent = old_ctx.parentCtx
+    new_ctx.parentCtx = parent
+    new_ctx.invokingState = old_ctx.invokingState
+    for i, child in enumerate(parent.children):
+        if child is old_ctx:
+            parent.children[i] = new_ctx
+            break
+    old_first, old_last = tokens[first], tokens[last]
+    node = parent
+    while node is not None:
+        if node.start is old_first:
+            node.start = region[0]
+        if node.stop is old_last:
+            node.stop = region[-1]
+        node = node.parentCtx
+
+    tokens[first:last + 1] = region
+    count_delta = len(region) - (last - first + 1)
+    for i in range(first, first + len(region)):
+        tokens[i].tokenIndex = i
+    after = first + len(region)
+    line_delta = matched.line - following.line
+    column_delta = matched.column - following.column
+    end_line = following.line
+    if not (delta or line_delta or column_delta or count_delta):
+        return
+    # 後ろのトークンは木からも参照されているので，同じオブジェクトの位置を1回の走査でずらす
+    for i in range(after, len(tokens)):
+        token = tokens[i]
+        if token.line == end_line:
+            token.column += column_delta
+        token.start += delta
+        token.stop += delta
+        token.line += line_delta
+        token.tokenIndex = i
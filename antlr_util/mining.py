@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from .tokenizer import Tokenizer
+from .parallel import TASKS_PER_JOB
+from .stats import PhaseStats
+
+# 1つのタスクにまとめる組の数
+PAIRS_PER_TASK = 64
+# チェックポイントを書く間隔(入力の行数)
+CHECKPOINT_INTERVAL = 1000
+# 組ごとに呼ぶTokenizerのメソッド
+MODES = {"abstract": "get_abstract_tree_diff", "change_set": "make_change_set"}
+
+# ワーカープロセスごとに使い回すTokenizer {言語: Tokenizer}
+_TOKENIZERS = {}
+_TOKENIZER_OPTIONS = {}
+
+
+def pair_key(language, before, after):
+    """
+    重複を見分けるための組のハッシュ(8バイトの整数にして辞書を小さく保つ)
+    """
+    digest = hashlib.sha1()
+    for text in (language, before, after):
+        encoded = text.encode("utf-8", "surrogatepass")
+        digest.update(len(encoded).to_bytes(8, "little"))
+        digest.update(encoded)
+    return int.from_bytes(digest.digest()[:8], "little")
+
+
+def read_pairs(path, start_line=0, dedupe=True, language="Python"):
+    """
+    JSONLの各行{"before", "after", "language"}を(行番号, 言語, before, after, 重複元の行番号)として返す
+    重複した組は中身をNoneにして最初に現れた行番号を付ける．読めない行は中身をNoneにして返す
+    start_lineより前の行は返さないが，重複の判定には使う(再開しても同じ結果になる)
+    """
+    seen = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f):
+            try:
+                pair = json.loads(line)
+                entry = (line_number, pair.get("language", language), pair["before"], pair["after"], None)
+                # 言語・before・afterが文字列でない行も読めない行とする(pair_keyでも使う)
+                if not all(isinstance(value, str) for value in entry[1:4]):
+                    raise TypeError("pair fields must be strings")
+            except (ValueError, KeyError, TypeError, AttributeError):
+                entry = (line_number, None, None, None, None)
+            if dedupe and entry[1] is not None:
+                key = pair_key(*entry[1:4])
+                first = seen.setdefault(key, line_number)
+                if first != line_number:
+                    entry = (line_number, entry[1], None, None, first)
+            if line_number >= start_line:
+                yield entry
+
+
+def make_tasks(entries, pairs_per_task=PAIRS_PER_TASK):
+    task = []
+    for entry in entries:
+        task.append(entry)
+        if len(task) >= pairs_per_task:
+            yield task
+            task = []
+    if task:
+        yield task
+
+
+def init_worker(tokenizer_options=None):
+    # オプションが変わったかもしれないので，作ったTokenizerは捨てる
+    _TOKENIZERS.clear()
+    _TOKENIZER_OPTIONS.clear()
+    _TOKENIZER_OPTIONS.update(tokenizer_options or {})
+
+
+def get_tokenizer(language):
+    if language not in _TOKENIZERS:
+        _TOKENIZERS[language] = Tokenizer(language, **_TOKENIZER_OPTIONS)
+    return _TOKENIZERS[language]
+
+
+def diff_task(entries, mode="abstract", with_stats=False):
+    """
+    :return: 組ごとの{"line", "language", "diff", "error"}．重複なら{"line", "duplicate_of"}
+    with_statsなら(結果, このタスクで集計したPhaseStats)を返す
+    """
+    results = []
+    for line_number, language, before, after, duplicate_of in entries:
+        if duplicate_of is not None:
+            results.append({"line": line_number, "duplicate_of": duplicate_of})
+            continue
+        if language is None:
+            results.append({"line": line_number, "language": None, "diff": None,
+                            "error": "invalid pair record"})
+            continue
+        try:
+            diff = getattr(get_tokenizer(language), MODES[mode])(before, after)
+            results.append({"line": line_number, "language": language, "diff": diff, "error": None})
+        except Exception as e:
+            results.append({"line": line_number, "language": language, "diff": None, "error": repr(e)})
+    if not with_stats:
+        return results
+    stats = _TOKENIZER_OPTIONS["stats"]
+    snapshot = PhaseStats()
+    snapshot.merge(stats)
+    stats.clear()
+    return results, snapshot
+
+
+def diff_pairs(entries, jobs=1, mode="abstract", pairs_per_task=PAIRS_PER_TASK, **tokenizer_options):
+    """
+    read_pairsの組をプロセスプールで差分にし，入力の順に返す
+    同時に投入するタスクはjobs * TASKS_PER_JOBまでで，結果を受け取るまで入力を先読みしない
+    tokenizer_optionsにstats(PhaseStats)を渡すと，各プロセスの集計をそこにまとめる
+    """
+    if mode not in MODES:
+        raise ValueError("Unknown mode: %s" % mode)
+    tasks = make_tasks(entries, pairs_per_task)
+    if jobs <= 1:
+        init_worker(tokenizer_options)
+        for task in tasks:
+            yield from diff_task(task, mode)
+        return
+
+    stats = tokenizer_options.get("stats")
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                             initargs=(tokenizer_options,)) as executor:
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(diff_task, task, mode, stats is not None))
+            if len(pending) >= jobs * TASKS_PER_JOB:
+                yield from _result(pending.popleft(), stats)
+        while pending:
+            yield from _result(pending.popleft(), stats)
+
+
+def _result(future, stats):
+    results = future.result()
+    if stats is not None:
+        results, worker_stats = results
+        stats.merge(worker_stats)
+    return results
+
+
+def load_checkpoint(path):
+    """
+    :return: {"line": 次に処理する入力の行番号, "offset": それまでの出力のバイト数}
+    """
+    if path is None or not os.path.exists(path):
+        return {"line": 0, "offset": 0}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, state):
+    # 書きかけのファイルが残らないよう，一時ファイルから置き換える
+    temporary = path + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def mine_pairs(input_path, output_path, jobs=1, mode="abstract", checkpoint=None,
+               checkpoint_interval=CHECKPOINT_INTERVAL, dedupe=True, language="Python",
+               **tokenizer_options):
+    """
+    before/afterの組のJSONLから差分を1組1行のJSONLに書き出す
+    checkpointを渡すと一定の行数ごとに進み具合を保存し，次に同じ引数で呼んだときは続きから処理する
+    (チェックポイントより後に書かれた出力は切り捨ててから再開する)
+    :return: 今回処理した組の数
+    """
+    state = load_checkpoint(checkpoint)
+    if state["line"] and state.get("input") not in (None, input_path):
+        raise ValueError("checkpoint %s was made for %s" % (checkpoint, state["input"]))
+    if state["offset"] and os.path.exists(output_path):
+        output = open(output_path, "r+b")
+        output.truncate(state["offset"])
+        output.seek(state["offset"])
+    else:
+        output = open(output_path, "wb")
+    count = 0
+    line_number = state["line"]
+    try:
+        entries = read_pairs(input_path, state["line"], dedupe, language)
+        for record in diff_pairs(entries, jobs, mode, **tokenizer_options):
+            output.write(json.dumps(record, ensure_ascii=False).encode("utf-8"))
+            output.write(b"\n")
+            count += 1
+            line_number = record["line"] + 1
+            if checkpoint is not None and count % checkpoint_interval == 0:
+                _checkpoint(checkpoint, output, input_path, line_number)
+        if checkpoint is not None:
+            _checkpoint(checkpoint, output, input_path, line_number)
+    finally:
+        output.close()
+    return count
+
+
+def _checkpoint(path, output, input_path, line_number):
+    output.flush()
+    os.fsync(output.fileno())
+    save_checkpoint(path, {"input": input_path, "line": line_number, "offset": output.tell()})
@@ -0,0 +1,144 @@
+import glob
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from .tokenizer import Tokenizer, detect_language, LANGUAGE_EXTENSIONS
+from .stats import PhaseStats
+
+# 1つのタスクにまとめるファイルの合計サイズ(バイト)
+CHUNK_BYTES = 256 * 1024
+# プロセス数あたりの同時に投入しておくタスク数
+TASKS_PER_JOB = 4
+
+# ワーカープロセスごとに使い回すTokenizer {言語: Tokenizer}
+_TOKENIZERS = {}
+_TOKENIZER_OPTIONS = {}
+
+
+def find_files(target, language="auto"):
+    """
+    ディレクトリ，globパターン，ファイルのいずれかから対象ファイルを列挙する
+    ディレクトリとglobでは，対象言語の拡張子を持つファイルだけを返す
+    """
+    if os.path.isfile(target):
+        yield target
+        return
+    if os.path.isdir(target):
+        paths = (os.path.join(root, name)
+                 for root, dirs, names in os.walk(target) for name in sorted(names))
+    else:
+        paths = iter(sorted(glob.iglob(target, recursive=True)))
+    for path in paths:
+        if not os.path.isfile(path):
+            continue
+        if language == "auto":
+            if detect_language(path) is None:
+                continue
+        elif os.path.splitext(path)[1].lower() not in LANGUAGE_EXTENSIONS[language]:
+            continue
+        yield path
+
+
+def make_chunks(paths, chunk_bytes=CHUNK_BYTES):
+    """
+    小さなファイルをまとめ，合計サイズがchunk_bytes程度になるようにタスクを作る
+    """
+    chunk = []
+    size = 0
+    for path in paths:
+        chunk.append(path)
+        size += os.path.getsize(path)
+        if size >= chunk_bytes:
+            yield chunk
+            chunk = []
+            size = 0
+    if chunk:
+        yield chunk
+
+
+def init_worker(language="auto", tokenizer_options=None):
+    # オプションが変わったかもしれないので，作ったTokenizerは捨てる
+    _TOKENIZERS.clear()
+    _TOKENIZER_OPTIONS.clear()
+    _TOKENIZER_OPTIONS.update(tokenizer_options or {})
+    if language != "auto":
+        get_tokenizer(language)
+
+
+def get_tokenizer(language):
+    if language not in _TOKENIZERS:
+        _TOKENIZERS[language] = Tokenizer(language, whole_file=True, **_TOKENIZER_OPTIONS)
+    return _TOKENIZERS[language]
+
+
+def tokenize_file(path, language="auto"):
+    """
+    :return: (path, language, tokens, error)
+    """
+    if language == "auto":
+        language = detect_language(path)
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            code = f.read()
+        return path, language, get_tokenizer(language).getTokens(code), None
+    except Exception as e:
+        return path, language, None, repr(e)
+
+
+def tokenize_chunk(paths, language="auto", with_stats=False):
+    """
+    with_statsなら(結果, このタスクで集計したPhaseStats)を返し，ワーカーの集計は空に戻す
+    """
+    results = [tokenize_file(path, language) for path in paths]
+    if not with_stats:
+        return results
+    stats = _TOKENIZER_OPTIONS["stats"]
+    snapshot = PhaseStats()
+    snapshot.merge(stats)
+    stats.clear()
+    return results, snapshot
+
+
+def tokenize_files(paths, jobs=1, language="auto", ordered=True,
+                   chunk_bytes=CHUNK_BYTES, **tokenizer_options):
+    """
+    ファイルをプロセスプールでトークン化し，ファイルごとの結果を順に返す
+    ordered=Falseなら終わったものから返す．同時に投入するタスク数は
+    jobs * TASKS_PER_JOB までに抑え，ファイル一覧全体をメモリに載せない
+    tokenizer_optionsにstats(PhaseStats)を渡すと，各プロセスの集計をそこにまとめる
+    """
+    chunks = make_chunks(paths, chunk_bytes)
+    if jobs <= 1:
+        init_worker(language, tokenizer_options)
+        for chunk in chunks:
+            yield from tokenize_chunk(chunk, language)
+        return
+
+    stats = tokenizer_options.get("stats")
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                             initargs=(language, tokenizer_options)) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(tokenize_chunk, chunk, language, stats is not None))
+            if len(pending) >= jobs * TASKS_PER_JOB:
+                yield from _collect(pending, ordered, stats)
+        while pending:
+            yield from _collect(pending, ordered, stats)
+
+
+def _collect(pending, ordered, stats=None):
+    """
+    投入済みのタスクを少なくとも1つ待ち，その結果を返す
+    """
+    if ordered:
+        done = [pending.popleft()]
+    else:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.remove(future)
+    for future in done:
+        results = future.result()
+        if stats is not None:
+            results, worker_stats = results
+            stats.merge(worker_stats)
+        yield from results
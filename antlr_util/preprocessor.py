@@ -0,0 +1,164 @@
+import re
+from bisect import bisect_right
+from antlr4 import CommonTokenStream, InputStream, Token
+
+# 前処理の行・コメントを見つけるための正規表現
+# 文字列・文字リテラルの中の"//"や"#"を見誤らないよう，リテラルも読み飛ばす対象として一緒に探す
+_SCAN = re.compile(r"""
+    (?P<raw>(?:u8|[uUL])?R"(?P<delimiter>[^()\\\s"]{0,16})\([\s\S]*?\)(?P=delimiter)")
+  | (?P<string>(?:u8|[uUL])?"(?:[^"\\\n]|\\[\s\S])*")
+  | (?P<char>(?:u8|[uUL])?'(?:[^'\\\n]|\\[\s\S])*')
+  | (?P<line_comment>//[^\r\n]*)
+  | (?P<block_comment>/\*[\s\S]*?\*/)
+  | (?P<directive>^[ \t]*\#(?:[^\n\\/"]|\\\r?\n|\\.|"(?:[^"\\\n]|\\.)*"|"|/\*[\s\S]*?\*/|//[^\n]*|/)*)
+""", re.MULTILINE | re.VERBOSE)
+# 条件の指令 #if, #elif などの名前と条件
+_CONDITIONAL = re.compile(r"[ \t]*#[ \t]*(if|ifdef|ifndef|elif|else|endif)\b(.*)", re.DOTALL)
+# 値が分かる#if・#elifの条件
+_CONSTANTS = {"0": False, "false": False, "1": True, "true": True}
+_COMMENT = re.compile(r"/\*[\s\S]*?\*/|//.*")
+
+# #ifの入れ子1段の状態
+# TAKEN: 条件が真の分岐を残している．後の#elif・#elseは捨てる
+# UNKNOWN: 条件が分からないので，全ての分岐を残す
+# SKIP: 条件が偽の分岐を捨てている．後の#elif・#elseは残すかもしれない
+# DONE: 残す分岐を通り過ぎたので，#endifまで捨てる
+# NESTED: 捨てている部分の中の入れ子なので，#endifまで捨てる
+TAKEN, UNKNOWN, SKIP, DONE, NESTED = range(5)
+_SKIPPING = (SKIP, DONE, NESTED)
+
+
+class OffsetMap():
+    """
+    前処理した後のコードの位置から元のコードの位置・行・列への対応
+    残した区間ごとに(前処理後の開始位置, 元の開始位置)を持つ
+    """
+    def __init__(self, code: str):
+        self.stripped_starts = []
+        self.original_starts = []
+        self.length = len(code)
+        self.line_starts = [0] + [m.end() for m in re.finditer("\n", code)]
+
+    def add(self, stripped_start: int, original_start: int):
+        self.stripped_starts.append(stripped_start)
+        self.original_starts.append(original_start)
+
+    def original(self, index: int):
+        i = bisect_right(self.stripped_starts, index) - 1
+        if i < 0:
+            return index
+        return min(self.original_starts[i] + index - self.stripped_starts[i], self.length)
+
+    def position(self, index: int):
+        """
+        元のコードの位置indexの(行, 列)．行は1から数える
+        """
+        line = bisect_right(self.line_starts, index)
+        return line, index - self.line_starts[line - 1]
+
+
+def strip_preprocessor(code: str, skip_if0: bool = False):
+    """
+    前処理の行(#include, #define, #ifなど)とコメントを取り除いたコードと，元のコードへのOffsetMapを返す
+    前処理の行は行末の改行だけを残す(文法のNewlineのトークンは変わらない)．
+    ブロックコメントは前後のトークンがつながらないよう空白1文字にする
+    skip_if0なら，条件が0/1/false/trueの#if・#elifで捨てられる分岐も取り除く
+    """
+    pieces = []
+    offsets = OffsetMap(code)
+    length = 0
+    stack = []
+    end = 0
+
+    def keep(start, stop):
+        nonlocal length
+        if start < stop:
+            offsets.add(length, start)
+            pieces.append(code[start:stop])
+            length += stop - start
+
+    for match in _SCAN.finditer(code):
+        kind = match.lastgroup
+        start, stop = match.span()
+        skipping = stack and stack[-1] in _SKIPPING
+        if kind in ("raw", "string", "char"):
+            # リテラルの中は触らない．捨てている分岐の中なら後で一緒に捨てる
+            continue
+        if not skipping:
+            keep(end, start)
+        if kind == "block_comment" and not skipping:
+            offsets.add(length, start)
+            pieces.append(" ")
+            length += 1
+        elif kind == "directive" and skip_if0:
+            conditional = _CONDITIONAL.match(match.group())
+            if conditional is not None:
+                update_conditional(stack, conditional.group(1), conditional.group(2))
+        end = stop
+    if not (stack and stack[-1] in _SKIPPING):
+        keep(end, len(code))
+    return "".join(pieces), offsets
+
+
+def update_conditional(stack, name, condition):
+    """
+    条件の指令nameで#ifの入れ子の状態stackを更新する
+    """
+    value = _CONSTANTS.get(_COMMENT.sub("", condition).strip().strip("()").strip())
+    if name in ("if", "ifdef", "ifndef"):
+        if stack and stack[-1] in _SKIPPING:
+            stack.append(NESTED)
+        elif name == "if" and value is not None:
+            stack.append(TAKEN if value else SKIP)
+        else:
+            stack.append(UNKNOWN)
+        return
+    if not stack:
+        return
+    state = stack[-1]
+    if name == "endif":
+        stack.pop()
+    elif state == TAKEN:
+        stack[-1] = DONE
+    elif state == SKIP:
+        if name == "else":
+            stack[-1] = TAKEN
+        elif value is not None:
+            stack[-1] = TAKEN if value else SKIP
+        else:
+            # 分からない#elifから後は，全ての分岐を残す
+            stack[-1] = UNKNOWN
+
+
+class PreprocessedTokenStream(CommonTokenStream):
+    """
+    strip_preprocessorで前処理したコードを字句解析するトークン列
+    字句解析器から受け取ったトークンの位置・行・列を元のコードのものに直し，
+    トークンの文字列も元のコードから切り出す
+    """
+    def __init__(self, lexer, code: str, offsets: OffsetMap, channel: int = Token.DEFAULT_CHANNEL):
+        super().__init__(lexer, channel)
+        self.offsets = offsets
+        self.source = (lexer, InputStream(code))
+        self.remapped = 0
+
+    def fetch(self, n: int):
+        fetched = super().fetch(n)
+        tokens = self.tokens
+        offsets = self.offsets
+        for i in range(self.remapped, len(tokens)):
+            token = tokens[i]
+            if token.type == Token.EOF:
+                start = offsets.length
+            else:
+                start = offsets.original(token.start)
+            token.stop = start + token.stop - token.start
+            token.start = start
+            token.line, token.column = offsets.position(start)
+            token.source = self.source
+        self.remapped = len(tokens)
+        return fetched
+
+    def setTokenSource(self, tokenSource):
+        super().setTokenSource(tokenSource)
+        self.remapped = 0
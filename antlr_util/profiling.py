@@ -0,0 +1,190 @@
+import os
+import re
+import sys
+import time
+from antlr4.PredictionContext import PredictionContextCache
+from antlr4.atn.ParserATNSimulator import ParserATNSimulator
+from antlr4.dfa.DFA import DFA
+
+# 報告の並べ替えに使える項目
+SORT_KEYS = ["time", "sll_max_look", "ll_max_look", "ll_fallbacks", "ambiguities", "invocations"]
+
+
+class DecisionInfo():
+    """
+    1つの決定(どの選択肢に進むかを先読みで決める箇所)の統計
+    ANTLRのJava版のDecisionInfoと同じ項目
+    """
+    __slots__ = ("decision", "invocations", "time", "sll_total_look", "sll_max_look",
+                 "ll_total_look", "ll_max_look", "ll_fallbacks", "context_sensitivities",
+                 "ambiguities", "errors", "sll_dfa_transitions", "sll_atn_transitions",
+                 "ll_atn_transitions")
+
+    def __init__(self, decision):
+        self.decision = decision
+        for name in self.__slots__[1:]:
+            setattr(self, name, 0)
+
+
+class ProfilingATNSimulator(ParserATNSimulator):
+    """
+    決定ごとに予測の時間，先読みの深さ，LL予測への切り替え，曖昧さを記録するATNシミュレータ
+    Pythonのランタイムにはないので，Java版のProfilingATNSimulatorと同じことをする
+    fresh_dfa: Trueなら構文解析器のクラスで共有しているDFAを使わず，空のDFAから始める
+    """
+    def __init__(self, parser, fresh_dfa=False):
+        interp = parser._interp
+        decision_to_dfa = interp.decisionToDFA
+        context_cache = interp.sharedContextCache
+        if fresh_dfa:
+            decision_to_dfa = [DFA(state, i) for i, state in enumerate(parser.atn.decisionToState)]
+            context_cache = PredictionContextCache()
+        super().__init__(parser, parser.atn, decision_to_dfa, context_cache)
+        self.predictionMode = interp.predictionMode
+        self.decisions = [DecisionInfo(i) for i in range(len(parser.atn.decisionToState))]
+        self._sll_stop_index = -1
+        self._ll_stop_index = -1
+        self._current_decision = 0
+        self._conflicting_alt_resolved_by_sll = 0
+
+    def adaptivePredict(self, input, decision, outerContext):
+        self._sll_stop_index = -1
+        self._ll_stop_index = -1
+        self._current_decision = decision
+        start = time.perf_counter()
+        try:
+            return super().adaptivePredict(input, decision, outerContext)
+        finally:
+            info = self.decisions[decision]
+            info.time += time.perf_counter() - start
+            info.invocations += 1
+            sll_look = self._sll_stop_index - self._startIndex + 1
+            info.sll_total_look += sll_look
+            info.sll_max_look = max(info.sll_max_look, sll_look)
+            if self._ll_stop_index >= 0:
+                ll_look = self._ll_stop_index - self._startIndex + 1
+                info.ll_total_look += ll_look
+                info.ll_max_look = max(info.ll_max_look, ll_look)
+
+    def getExistingTargetState(self, previousD, t):
+        # SLLの先読みはここで最後に見たトークンまで
+        self._sll_stop_index = self._input.index
+        existing = super().getExistingTargetState(previousD, t)
+        if existing is not None:
+            self.decisions[self._current_decision].sll_dfa_transitions += 1
+            if existing is self.ERROR:
+                self.decisions[self._current_decision].errors += 1
+        return existing
+
+    def computeReachSet(self, closure, t, fullCtx):
+        if fullCtx:
+            self._ll_stop_index = self._input.index
+        reach = super().computeReachSet(closure, t, fullCtx)
+        info = self.decisions[self._current_decision]
+        if fullCtx:
+            info.ll_atn_transitions += 1
+        else:
+            info.sll_atn_transitions += 1
+        if reach is None:
+            info.errors += 1
+        return reach
+
+    def reportAttemptingFullContext(self, dfa, conflictingAlts, configs, startIndex, stopIndex):
+        alts = conflictingAlts if conflictingAlts else {config.alt for config in configs}
+        self._conflicting_alt_resolved_by_sll = min(alts)
+        self.decisions[self._current_decision].ll_fallbacks += 1
+        super().reportAttemptingFullContext(dfa, conflictingAlts, configs, startIndex, stopIndex)
+
+    def reportContextSensitivity(self, dfa, prediction, configs, startIndex, stopIndex):
+        if prediction != self._conflicting_alt_resolved_by_sll:
+            self.decisions[self._current_decision].context_sensitivities += 1
+        super().reportContextSensitivity(dfa, prediction, configs, startIndex, stopIndex)
+
+    def reportAmbiguity(self, dfa, D, startIndex, stopIndex, exact, ambigAlts, configs):
+        prediction = min(ambigAlts) if ambigAlts else min(config.alt for config in configs)
+        info = self.decisions[self._current_decision]
+        if configs.fullCtx and prediction != self._conflicting_alt_resolved_by_sll:
+            info.context_sensitivities += 1
+        info.ambiguities += 1
+        super().reportAmbiguity(dfa, D, startIndex, stopIndex, exact, ambigAlts, configs)
+
+
+def rule_lines(parser_class):
+    """
+    構文解析器の文法ファイル(.g4)で各規則が定義されている行番号 {規則名: 行番号}
+    """
+    module = sys.modules[parser_class.__module__]
+    path = os.path.join(os.path.dirname(module.__file__), parser_class.grammarFileName)
+    names = set(parser_class.ruleNames)
+    lines = {}
+    if not os.path.exists(path):
+        return lines
+    pattern = re.compile(r"^(?:fragment\s+)?([a-z][A-Za-z0-9_]*)\b")
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            match = pattern.match(line)
+            if match and match.group(1) in names and match.group(1) not in lines:
+                lines[match.group(1)] = number
+    return lines
+
+
+def profile(tokenizer, codes, fresh_dfa=False):
+    """
+    tokenizerの構文解析器にProfilingATNSimulatorを差し込んでcodesを全て解析し，決定ごとの統計を返す
+    :return: {"language", "grammar", "files", "failures", "parse_time", "decisions": [決定ごとの辞書]}
+    """
+    parser = tokenizer.getParser("")
+    original = parser._interp
+    simulator = ProfilingATNSimulator(parser, fresh_dfa)
+    parser._interp = simulator
+    files = failures = 0
+    start = time.perf_counter()
+    try:
+        for code in codes:
+            files += 1
+            try:
+                tokenizer.getTree(code)
+            except Exception:
+                failures += 1
+    finally:
+        parser._interp = original
+    parse_time = time.perf_counter() - start
+
+    parser_class = type(parser)
+    lines = rule_lines(parser_class)
+    decisions = []
+    for info in simulator.decisions:
+        if not info.invocations:
+            continue
+        state = parser.atn.decisionToState[info.decision]
+        rule = parser_class.ruleNames[state.ruleIndex]
+        result = {name: getattr(info, name) for name in DecisionInfo.__slots__}
+        result.update({"rule": rule, "line": lines.get(rule), "state": state.stateNumber,
+                       "sll_mean_look": info.sll_total_look / info.invocations,
+                       "ll_mean_look": info.ll_total_look / info.ll_fallbacks if info.ll_fallbacks else 0.0})
+        decisions.append(result)
+    return {"language": tokenizer.LANGUAGE, "grammar": parser_class.grammarFileName, "files": files,
+            "failures": failures, "parse_time": parse_time, "decisions": decisions}
+
+
+def format_report(report, top=20, key="time"):
+    """
+    profileの結果から，keyの大きい順にtop個の決定を表にした文字列
+    """
+    if key not in SORT_KEYS:
+        raise ValueError("Unknown sort key: %s" % key)
+    decisions = sorted(report["decisions"], key=lambda x: x[key], reverse=True)[:top]
+    total = sum(x["time"] for x in report["decisions"])
+    lines = ["%s (%s): %d files, %d failed, parse %.3fs, prediction %.3fs" % (
+        report["language"], report["grammar"], report["files"], report["failures"],
+        report["parse_time"], total)]
+    total = total or 1.0
+    lines.append("%8s %-32s %6s %9s %9s %6s %8s %6s %8s %6s %6s %6s" % (
+        "decision", "rule", "line", "calls", "time(ms)", "share", "sll_mean", "sll_max",
+        "ll_fall", "ll_max", "ambig", "ctx"))
+    for x in decisions:
+        lines.append("%8d %-32s %6s %9d %9.3f %5.1f%% %8.2f %6d %8d %6d %6d %6d" % (
+            x["decision"], x["rule"][:32], x["line"] or "-", x["invocations"], x["time"] * 1000,
+            100 * x["time"] / total, x["sll_mean_look"], x["sll_max_look"], x["ll_fallbacks"],
+            x["ll_max_look"], x["ambiguities"], x["context_sensitivities"]))
+    return "\n".join(lines)
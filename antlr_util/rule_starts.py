@@ -0,0 +1,257 @@
+# 構文解析をせずに，構文木から作るトークン列と同じものを字句解析の結果だけで作るための表
+# makeTokensPythonはトークンの行を「親の規則の先頭のトークンの行(直前のトークンの行より前なら直前の行)」にするので，
+# トークンが親の規則の先頭かどうかが分かれば同じ行になる．Python3.g4の規則から分かるものをここに書く
+
+# 直後の演算子が二項演算子になるトークン(式の終わり)
+OPERAND_ENDS = frozenset(["NAME", "NUMBER", "STRING", "CLOSE_PAREN", "CLOSE_BRACK", "CLOSE_BRACE",
+                          "NONE", "TRUE", "FALSE", "ELLIPSIS"])
+# いつも規則の途中にあるトークン(区切り，二項演算子，複合文の続きのキーワード)
+NEVER_FIRST = frozenset([
+    "CLOSE_PAREN", "CLOSE_BRACK", "CLOSE_BRACE", "COMMA", "SEMI_COLON", "ASSIGN", "ARROW",
+    "ADD_ASSIGN", "SUB_ASSIGN", "MULT_ASSIGN", "AT_ASSIGN", "DIV_ASSIGN", "MOD_ASSIGN", "AND_ASSIGN",
+    "OR_ASSIGN", "XOR_ASSIGN", "LEFT_SHIFT_ASSIGN", "RIGHT_SHIFT_ASSIGN", "POWER_ASSIGN", "IDIV_ASSIGN",
+    "OR_OP", "XOR", "AND_OP", "LEFT_SHIFT", "RIGHT_SHIFT", "DIV", "MOD", "IDIV",
+    "AND", "OR", "AS", "INDENT", "EOF",
+    # 文の先頭でも，if_stmt, while_stmt, for_stmt, try_stmtの続き
+    "ELSE", "ELIF", "FINALLY",
+])
+# 直後のトークンが文の先頭になるトークン
+STATEMENT_ENDS = frozenset(["NEWLINE", "INDENT", "DEDENT", "SEMI_COLON"])
+# 名前が規則の途中になる直前のトークン(def f, class A, import a as b, global a)
+NAME_OWNERS = frozenset(["DOT", "DEF", "CLASS", "AS", "GLOBAL", "NONLOCAL"])
+# single_inputで，ブロックを持つ複合文の先頭のトークン(デコレータを含む)
+COMPOUND_STARTS = frozenset(["IF", "WHILE", "FOR", "TRY", "WITH", "DEF", "CLASS", "ASYNC", "AT"])
+# 複合文の続きの節
+CLAUSES = frozenset(["ELIF", "ELSE", "EXCEPT", "FINALLY"])
+# JavaScriptで，ブロックで終わり文末(eos)を持たない文の先頭のトークン
+BLOCK_STATEMENTS = frozenset(["Function", "If", "For", "While", "Try", "Switch", "With", "OpenBrace"])
+# JavaScriptで，直後の{がブロック(式のオブジェクトではない)になるトークン
+BLOCK_OPENERS = (None, "CloseParen", "Else", "Try", "Finally", "Do")
+# JavaScriptで，文の先頭のトークンと，その文のブロック・;の後に続けられるトークン
+CONTINUATIONS = {"If": ("Else",), "Try": ("Catch", "Finally"), "Do": ("While",)}
+
+
+class _Frame():
+    """
+    括弧1組(一番外側は文)の中の状態
+    """
+    __slots__ = ("params", "comprehension", "expect_in", "lambdas")
+
+    def __init__(self, params=False):
+        # 関数定義の引数の並び(typedargslist)の中か
+        self.params = params
+        # 内包表記のforの後か(ifがcomp_ifになる)
+        self.comprehension = False
+        # forの後でinを待っているか(inが比較演算子ではなくなる)
+        self.expect_in = False
+        # まだ:が来ていないlambdaの数
+        self.lambdas = 0
+
+
+class PythonRuleStarts():
+    """
+    Pythonの既定チャンネルのトークンを順に受け取り，それぞれが構文木で親の規則の先頭になるかを返す
+    構文エラーのないコードでは構文木と同じになる
+    """
+    def __init__(self):
+        self.frames = [_Frame()]
+        # 開いている括弧の種類
+        self.openers = []
+        self.previous = None
+        self.before_previous = None
+        # 文の先頭のトークン(import文・global文の中かを見分ける)
+        self.statement = None
+
+    def feed(self, name, next_name=None):
+        """
+        name: トークンの種類名．next_name: 次のトークンの種類名(NEWLINEの判定に使う)
+        """
+        first = self.isFirst(name, next_name)
+        self.update(name)
+        return first
+
+    def isFirst(self, name, next_name):
+        previous = self.previous
+        frame = self.frames[-1]
+        if previous is None:
+            return True
+        if name == "NEWLINE":
+            # suite: NEWLINE INDENT stmt+ DEDENT のNEWLINEだけが規則の先頭
+            return next_name == "INDENT"
+        if name in NEVER_FIRST:
+            return False
+        if previous in STATEMENT_ENDS and len(self.frames) == 1:
+            return True
+        if name in ("ADD", "MINUS", "STAR", "POWER", "AT") and previous in OPERAND_ENDS:
+            # 二項演算子
+            return False
+        if name in ("STAR", "POWER"):
+            if frame.params or frame.lambdas:
+                # typedargslist, varargslistの途中の*args, **kwargs
+                return previous in ("OPEN_PAREN", "LAMBDA")
+            if name == "POWER" and self.opener == "OPEN_BRACE":
+                return previous == "OPEN_BRACE"
+            return previous != "IMPORT"
+        if name == "COLON":
+            # a[:n]のように:で始まるsubscript
+            return self.opener == "OPEN_BRACK" and previous in ("OPEN_BRACK", "COMMA")
+        if name == "DOT":
+            return previous in OPERAND_ENDS and self.statement not in ("IMPORT", "FROM", "AT")
+        if name == "NAME":
+            if previous in NAME_OWNERS:
+                return False
+            return not (previous == "COMMA" and self.statement in ("GLOBAL", "NONLOCAL"))
+        if name == "STRING":
+            return previous != "STRING"
+        if name == "OPEN_PAREN":
+            return not (previous == "IMPORT" or (previous == "NAME" and self.before_previous == "CLASS"))
+        if name == "IF":
+            return frame.comprehension and not frame.expect_in
+        if name == "IN":
+            return not frame.expect_in
+        if name == "NOT":
+            return previous != "IS"
+        if name == "FROM":
+            return previous == "YIELD"
+        if name == "IMPORT":
+            return self.statement != "FROM"
+        if name == "ELLIPSIS":
+            return previous != "FROM"
+        return True
+
+    @property
+    def opener(self):
+        return self.openers[-1] if self.openers else None
+
+    def update(self, name):
+        frames = self.frames
+        frame = frames[-1]
+        if len(frames) == 1 and self.previous in STATEMENT_ENDS:
+            self.statement = name
+            frames[0] = frame = _Frame()
+        if name in ("OPEN_PAREN", "OPEN_BRACK", "OPEN_BRACE"):
+            params = name == "OPEN_PAREN" and self.previous == "NAME" and self.before_previous == "DEF"
+            frames.append(_Frame(params))
+            self.openers.append(name)
+        elif name in ("CLOSE_PAREN", "CLOSE_BRACK", "CLOSE_BRACE"):
+            if len(frames) > 1:
+                frames.pop()
+                self.openers.pop()
+        elif name == "FOR":
+            frame.comprehension = True
+            frame.expect_in = True
+        elif name == "IN":
+            frame.expect_in = False
+        elif name == "LAMBDA":
+            frame.lambdas += 1
+        elif name == "COLON" and frame.lambdas:
+            frame.lambdas -= 1
+        self.before_previous = self.previous
+        self.previous = name
+
+
+def python_statement_end(names):
+    """
+    single_inputで1文だけを構文解析したとき，文の最後のトークンの添字
+    names: 既定チャンネルのトークンの種類名(EOFを除く)
+    単純文は文末のNEWLINEまで，複合文はブロックを閉じるDEDENT(続くNEWLINEがあればそれ)まで．
+    elif, else, except, finallyの節とデコレータの後の定義は同じ文として続ける
+    """
+    compound = bool(names) and names[0] in COMPOUND_STARTS
+    depth = 0
+    for i, name in enumerate(names):
+        following = names[i + 1] if i + 1 < len(names) else None
+        if name == "INDENT":
+            depth += 1
+        elif name == "DEDENT":
+            depth -= 1
+            if depth == 0 and following not in CLAUSES:
+                return i + 1 if following == "NEWLINE" else i
+        elif name == "NEWLINE" and depth == 0:
+            if not compound or i == 0:
+                return i
+            # ブロックの前の改行，同じ行の単純文の後の節，デコレータの行
+            if following == "INDENT" or following in CLAUSES or following in COMPOUND_STARTS:
+                continue
+            return i
+    return len(names) - 1
+
+
+def javascript_label_end(names):
+    """
+    文の前のexportとラベル(label: for ...)を除いた，文の先頭の添字
+    """
+    start = 0
+    if names[:1] == ["Export"]:
+        start = 1
+    while names[start:start + 2] == ["Identifier", "Colon"]:
+        start += 2
+    return start
+
+
+def javascript_block_body(names, start, brace):
+    """
+    添字braceの{が，添字startから始まる文のブロック(関数の本体，if, forなどの本体)か
+    """
+    before = names[brace - 1] if brace > start else None
+    return before in BLOCK_OPENERS and names[start] in BLOCK_STATEMENTS
+
+
+def javascript_statement_end(names):
+    """
+    1文(sourceElement)だけを構文解析したとき，文の最後のトークンの添字
+    names: 既定チャンネルのトークンの種類名(EOFを除く)
+    ;か，ブロックで終わる文の}で終わる(else, catch, finally, do-whileのwhileが続けば続ける)．
+    この文法の改行(LineTerminator)は既定チャンネルなので，文が終わる前に改行が来たら決められずNone
+    """
+    start = javascript_label_end(names)
+    if start >= len(names):
+        return len(names) - 1
+    continuations = CONTINUATIONS.get(names[start], ())
+    depth = 0
+    braces = []
+    for i in range(start, len(names)):
+        name = names[i]
+        following = names[i + 1] if i + 1 < len(names) else None
+        if name in ("OpenParen", "OpenBracket", "OpenBrace"):
+            depth += 1
+            if name == "OpenBrace":
+                braces.append(i)
+        elif name in ("CloseParen", "CloseBracket", "CloseBrace"):
+            depth -= 1
+            if name == "CloseBrace" and braces:
+                brace = braces.pop()
+                if depth == 0 and javascript_block_body(names, start, brace) and following not in continuations:
+                    return i
+        elif name == "SemiColon" and depth == 0 and following not in continuations:
+            return i
+        elif name == "LineTerminator":
+            return None
+    return len(names) - 1
+
+
+def javascript_consumes_eof(names):
+    """
+    1文(sourceElement)だけを構文解析したとき，文末(eos)としてEOFを読むか
+    names: 既定チャンネルのトークンの種類名(EOFを除く)．1文だけのもの(javascript_statement_end)
+    ;で終わる文と，ブロックで終わる関数宣言・複合文(function, if, for, while, try, switch，ラベルつきも)は読まない
+    (この文法ではclassの宣言も式の文として解析され，eosを読む)
+    """
+    start = javascript_label_end(names)
+    if start >= len(names) or names[-1] == "SemiColon" or \
+            names.count("OpenBrace") > names.count("CloseBrace"):
+        # 閉じていない{があれば文が終わらない(構文エラー)
+        return False
+    if names[-1] != "CloseBrace":
+        return True
+    # 最後の}に対応する{の直前のトークンで，ブロックか式(オブジェクト，関数式)かを見分ける
+    depth = 0
+    for i in range(len(names) - 1, start - 1, -1):
+        if names[i] == "CloseBrace":
+            depth += 1
+        elif names[i] == "OpenBrace":
+            depth -= 1
+            if depth == 0:
+                # ブロックで終わる文．ただし式の文(var f = function () {})はeosが要る
+                return not javascript_block_body(names, start, i)
+    return True
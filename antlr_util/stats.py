@@ -0,0 +1,208 @@
+import threading
+import time
+from collections import Counter
+from antlr4 import TerminalNode
+from antlr4.error.ErrorListener import ErrorListener
+
+# 集計する処理段階
+PHASES = ["lex", "parse", "walk", "diff"]
+
+
+class PhaseSummary():
+    """
+    1つの処理段階の呼び出し回数，時間の合計，時間のヒストグラム，数(トークン数など)の合計
+    ヒストグラムはマイクロ秒の2の冪ごとの区間 {区間の番号: 回数}
+    """
+    __slots__ = ("calls", "wall", "cpu", "max_wall", "histogram", "counts")
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.max_wall = 0.0
+        self.histogram = Counter()
+        self.counts = Counter()
+
+    def add(self, wall, cpu, counts):
+        self.calls += 1
+        self.wall += wall
+        self.cpu += cpu
+        self.max_wall = max(self.max_wall, wall)
+        self.histogram[int(wall * 1e6).bit_length()] += 1
+        if counts:
+            self.counts.update(counts)
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.wall += other.wall
+        self.cpu += other.cpu
+        self.max_wall = max(self.max_wall, other.max_wall)
+        self.histogram.update(other.histogram)
+        self.counts.update(other.counts)
+
+    def percentile(self, rate):
+        """
+        ヒストグラムから求めた，呼び出しの割合rateが収まる時間の上限(秒)
+        """
+        if not self.calls:
+            return 0.0
+        seen = 0
+        for bucket in sorted(self.histogram):
+            seen += self.histogram[bucket]
+            if seen >= rate * self.calls:
+                return min((1 << bucket) / 1e6, self.max_wall)
+        return self.max_wall
+
+
+class _Phase():
+    """
+    with文の間の時間を測ってPhaseStatsに記録する．add()で数を足す
+    """
+    __slots__ = ("stats", "name", "counts", "wall", "cpu")
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+        self.counts = None
+
+    def add(self, **counts):
+        if self.counts is None:
+            self.counts = Counter()
+        self.counts.update(counts)
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.record(self.name, time.perf_counter() - self.wall, time.process_time() - self.cpu,
+                          self.counts)
+        return False
+
+
+class _NoPhase():
+    """
+    集計しないときのwith文．何もしない
+    """
+    __slots__ = ()
+
+    def add(self, **counts):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NO_PHASE = _NoPhase()
+
+
+class PhaseStats():
+    """
+    Tokenizerの処理段階(lex, parse, walk, diff)ごとに，呼び出しごとの実時間・CPU時間と
+    トークン数・ノード数・エラー回復の回数を集計する
+    Tokenizer(language, stats=PhaseStats())のように渡す．渡さなければ集計の処理はほぼ動かない
+
+    callback: 呼び出しごとにcallback(段階, 実時間, CPU時間, {数の名前: 数})を呼ぶ
+    複数のスレッドのTokenizerから同じPhaseStatsに記録してよい
+    """
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def record(self, name, wall, cpu, counts=None):
+        with self._lock:
+            summary = self.phases.get(name)
+            if summary is None:
+                summary = self.phases[name] = PhaseSummary()
+            summary.add(wall, cpu, counts)
+        if self.callback is not None:
+            self.callback(name, wall, cpu, dict(counts or {}))
+
+    def merge(self, other):
+        with self._lock:
+            for name, summary in other.phases.items():
+                self.phases.setdefault(name, PhaseSummary()).merge(summary)
+
+    def clear(self):
+        with self._lock:
+            self.phases = {}
+
+    def __getstate__(self):
+        # 別プロセスに渡すときはコールバックとロックを持たせない
+        return {"callback": None, "phases": self.phases}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def summary(self):
+        """
+        {段階: {"calls", "wall", "cpu", "mean", "p50", "p90", "p99", "max", "histogram", "counts"}}
+        histogramは{区間の上限(マイクロ秒): 回数}
+        """
+        result = {}
+        with self._lock:
+            names = PHASES + sorted(set(self.phases) - set(PHASES))
+            for name in names:
+                summary = self.phases.get(name)
+                if summary is None:
+                    continue
+                result[name] = {
+                    "calls": summary.calls, "wall": summary.wall, "cpu": summary.cpu,
+                    "mean": summary.wall / summary.calls, "p50": summary.percentile(0.5),
+                    "p90": summary.percentile(0.9), "p99": summary.percentile(0.99), "max": summary.max_wall,
+                    "histogram": {1 << bucket: count for bucket, count in sorted(summary.histogram.items())},
+                    "counts": dict(summary.counts),
+                }
+        return result
+
+    def format(self):
+        """
+        summary()を表にした文字列
+        """
+        summary = self.summary()
+        total = sum(x["wall"] for x in summary.values()) or 1.0
+        lines = ["%-6s %8s %10s %6s %10s %10s %10s %10s  %s" % (
+            "phase", "calls", "wall(s)", "share", "cpu(s)", "p50(ms)", "p99(ms)", "max(ms)", "counts")]
+        for name, x in summary.items():
+            counts = " ".join("%s=%d" % item for item in sorted(x["counts"].items()))
+            lines.append("%-6s %8d %10.3f %5.1f%% %10.3f %10.3f %10.3f %10.3f  %s" % (
+                name, x["calls"], x["wall"], 100 * x["wall"] / total, x["cpu"],
+                x["p50"] * 1000, x["p99"] * 1000, x["max"] * 1000, counts))
+        return "\n".join(lines)
+
+
+class ErrorCounter(ErrorListener):
+    """
+    字句解析器・構文解析器が報告したエラーの数を数える
+    """
+    def __init__(self):
+        self.count = 0
+
+    def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
+        self.count += 1
+
+
+def count_nodes(tree):
+    """
+    構文木の(規則のノード数, 終端ノード数)
+    """
+    rules = terminals = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, TerminalNode):
+            terminals += 1
+            continue
+        rules += 1
+        if node.children:
+            stack.extend(node.children)
+    return rules, terminals
@@ -0,0 +1,76 @@
+import threading
+from antlr4.dfa.DFA import DFA
+from antlr4.atn.LexerATNSimulator import LexerATNSimulator
+from antlr4.atn.ParserATNSimulator import ParserATNSimulator
+
+# 字句解析器・構文解析器のクラスで共有するDFAと予測文脈のキャッシュに書き込むときのロック
+# DFAの状態を足す処理の中でキャッシュにも書き込むので，同じスレッドから重ねて取れるRLockにする
+DFA_LOCK = threading.RLock()
+
+
+class SynchronizedLexerATNSimulator(LexerATNSimulator):
+    """
+    共有のDFAに状態と辺を足すときだけロックを取るLexerATNSimulator
+    DFAを辿るだけの処理(育った後はほとんどこれ)はロックを取らない．Java版のランタイムと同じ方針
+    matchATNでの開始状態(s0)の設定はロックを取らないが，addDFAStateがロックの中で同じ状態を返すので，
+    重なっても同じオブジェクトを代入するだけになる
+    """
+    def addDFAEdge(self, from_, tk, to=None, cfgs=None):
+        with DFA_LOCK:
+            return super().addDFAEdge(from_, tk, to, cfgs)
+
+    def addDFAState(self, configs):
+        with DFA_LOCK:
+            return super().addDFAState(configs)
+
+
+class SynchronizedParserATNSimulator(ParserATNSimulator):
+    """
+    共有のDFAと予測文脈のキャッシュに書き込むときだけロックを取るParserATNSimulator
+    """
+    def addDFAEdge(self, dfa, from_, t, to):
+        with DFA_LOCK:
+            return super().addDFAEdge(dfa, from_, t, to)
+
+    def addDFAState(self, dfa, D):
+        with DFA_LOCK:
+            return super().addDFAState(dfa, D)
+
+    def getCachedContext(self, context):
+        with DFA_LOCK:
+            return super().getCachedContext(context)
+
+
+class SynchronizedDFA(DFA):
+    """
+    左再帰の規則の優先度ごとの開始状態(s0.edges)を足すときにロックを取るDFA
+    adaptivePredictから直接呼ばれるので，シミュレータではなくDFAの側で差し替える
+    """
+    def setPrecedenceStartState(self, precedence: int, startState):
+        with DFA_LOCK:
+            super().setPrecedenceStartState(precedence, startState)
+
+
+def synchronize_lexer(lexer):
+    """
+    生成された字句解析器のATNシミュレータを，共有のDFAへの書き込みをロックするものに差し替える
+    """
+    interp = lexer._interp
+    lexer._interp = SynchronizedLexerATNSimulator(lexer, lexer.atn, interp.decisionToDFA,
+                                                  interp.sharedContextCache)
+    return lexer
+
+
+def synchronize_parser(parser):
+    """
+    生成された構文解析器のATNシミュレータを，共有のDFAへの書き込みをロックするものに差し替える
+    """
+    interp = parser._interp
+    # decisionToDFAは構文解析器のクラスで共有しているので，クラスを差し替えるだけにして中身は保つ
+    for dfa in interp.decisionToDFA:
+        if type(dfa) is DFA:
+            dfa.__class__ = SynchronizedDFA
+    parser._interp = SynchronizedParserATNSimulator(parser, parser.atn, interp.decisionToDFA,
+                                                    interp.sharedContextCache)
+    parser._interp.predictionMode = interp.predictionMode
+    return parser
@@ -0,0 +1,100 @@
+import threading
+from array import array
+
+# トークンの種類名と番号の対応表．全てのTokenBufferで共有する
+_NAMES = []
+_NAME_IDS = {}
+# 複数のスレッドから同じ名前を同時に登録して番号がずれないように，登録するときだけロックを取る
+_NAMES_LOCK = threading.Lock()
+
+
+def name_id(name):
+    i = _NAME_IDS.get(name)
+    if i is not None:
+        return i
+    with _NAMES_LOCK:
+        if name not in _NAME_IDS:
+            _NAMES.append(name)
+            _NAME_IDS[name] = len(_NAMES) - 1
+        return _NAME_IDS[name]
+
+
+class TokenBuffer():
+    """
+    (文字列, 種類, 空白数, 開始位置[, 行番号])のトークン列を列ごとのint32配列で持つ
+    文字列は元のコードの範囲として持ち，取り出すときに切り出す
+    元のコードと一致しない文字列(Pythonのnew_lineなど)だけは別に保存する
+
+    イテレートや添字アクセスでは従来と同じタプルを返す
+    """
+    def __init__(self, code: str, with_line: bool = False):
+        self.code = code
+        self.with_line = with_line
+        self.kinds = array("i")
+        self.starts = array("i")
+        self.lengths = array("i")
+        self.spaces = array("i")
+        self.lines = array("i")
+        # {トークンの番号: 文字列} 元のコードから切り出せない文字列
+        self.texts = {}
+
+    @classmethod
+    def from_tokens(cls, code: str, tokens):
+        tokens = list(tokens)
+        buffer = cls(code, with_line=bool(tokens) and len(tokens[0]) > 4)
+        buffer.extend(tokens)
+        return buffer
+
+    def append(self, token):
+        text, name, space, start = token[0], token[1], token[2], token[3]
+        if self.code[start:start + len(text)] != text:
+            self.texts[len(self.kinds)] = text
+        self.kinds.append(name_id(name))
+        self.starts.append(start)
+        self.lengths.append(len(text))
+        self.spaces.append(space)
+        if self.with_line:
+            self.lines.append(token[4])
+
+    def extend(self, tokens):
+        for token in tokens:
+            self.append(token)
+        return self
+
+    def text(self, i):
+        if i in self.texts:
+            return self.texts[i]
+        start = self.starts[i]
+        return self.code[start:start + self.lengths[i]]
+
+    def name(self, i):
+        return _NAMES[self.kinds[i]]
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("TokenBuffer index out of range")
+        if self.with_line:
+            return (self.text(i), _NAMES[self.kinds[i]], self.spaces[i], self.starts[i], self.lines[i])
+        return (self.text(i), _NAMES[self.kinds[i]], self.spaces[i], self.starts[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def nbytes(self):
+        """
+        列の配列と別保存の文字列が使うおおよそのバイト数(元のコードは含まない)
+        """
+        columns = [self.kinds, self.starts, self.lengths, self.spaces, self.lines]
+        return sum(column.itemsize * len(column) for column in columns) + \
+            sum(len(text) for text in self.texts.values())
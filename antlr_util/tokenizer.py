@@ -1,66 +1,286 @@
+import os
+import re
 import sys
+import threading
 from collections import Counter
-from antlr4 import TerminalNode, InputStream, CommonTokenStream
+from antlr4 import TerminalNode, InputStream, CommonTokenStream, Token
 from antlr4.error.ErrorListener import ConsoleErrorListener
-from difflib import ndiff, SequenceMatcher, Differ, ndiff
+from antlr4.error.ErrorStrategy import BailErrorStrategy, DefaultErrorStrategy
+from antlr4.error.Errors import ParseCancellationException
+from antlr4.atn.PredictionMode import PredictionMode
+from difflib import ndiff
+from bisect import bisect_right
+from functools import lru_cache
+from importlib import import_module
 from subprocess import Popen, PIPE
 import json
+from .dfa_snapshot import save_snapshot, load_snapshot, grammar_hash
+from .token_buffer import TokenBuffer
+from .diff import get_opcodes, DIFF_ENGINES
+from .tree_diff import build_tree, match_trees, edit_script
+from .incremental import enclosing_path, replace_text, relex_region, parse_region, splice
+from .stats import NO_PHASE, ErrorCounter, count_nodes
+from .threadsafe import synchronize_lexer, synchronize_parser
+from .preprocessor import strip_preprocessor, PreprocessedTokenStream
+from .rule_starts import PythonRuleStarts, python_statement_end, javascript_statement_end, javascript_consumes_eof
+
+# 拡張子から言語を推定するための対応表
+LANGUAGE_EXTENSIONS = {
+    "Python": [".py"],
+    "Java": [".java"],
+    "JavaScript": [".js", ".mjs", ".cjs"],
+    "CPP": [".cpp", ".cc", ".cxx", ".c++", ".hpp", ".hh", ".hxx", ".h", ".c"],
+    "PHP": [".php", ".phtml"],
+}
+
+GRAMMERS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "grammers")
+
+# Tokenizer.PARSE_STATSを数えるときのロック
+_PARSE_STATS_LOCK = threading.Lock()
+
+
+class _Recognizers(threading.local):
+    """
+    スレッドごとに持つ，入力だけ差し替えて使い回す字句解析器と構文解析器
+    """
+    def __init__(self):
+        self.lexer = None
+        self.parser = None
+        # updateで編集箇所だけを字句解析し直すための字句解析器
+        self.region_lexer = None
+        # 字句解析器が報告したエラーの数
+        self.lexer_errors = ErrorCounter()
+        # このスレッドでLLへ切り替えた回数
+        self.ll_fallbacks = 0
 
 
 class Tokenizer():
     IGNORE_CONTENTS = ["ENDMARKER","DEDENT"]
     IDENTIFIER_TAG = ""
+    # 終端にEOFを含む開始規則
+    EOF_RULES = ["file_input", "compilationUnit", "program", "translationunit", "htmlDocument"]
+    # ファイル全体を解析するときの開始規則
+    FILE_RULES = {"Python": "file_input", "Java": "compilationUnit", "JavaScript": "program",
+                  "CPP": "translationunit", "PHP": "htmlDocument"}
+    # updateで解析し直す単位にする文・宣言の規則
+    STATEMENT_RULES = {"Python": ["stmt"], "Java": ["blockStatement", "memberDeclaration"]}
+    # 言語ごとの構文解析の回数 {"sll": SLLで解析した回数, "ll": LLへ切り替えた回数,
+    #                          "incremental": updateで一部だけ解析し直した回数, "reparse": updateで全体を解析し直した回数}
+    PARSE_STATS = {}
+    # 構文解析器に渡すトークン列のクラス
+    TokenStream = CommonTokenStream
+    # make_change_set_lineで，変更のある行の前後に一緒に字句解析する行数
+    LINE_CONTEXT = 20
+    # 字句解析を始めてよい行(Pythonはインデントも括弧の中でもない行)．前の行から範囲を広げて合わせる
+    WINDOW_START_LINES = {"Python": re.compile(r"[^\s#)\]}]")}
 
-    def __init__(self, language: str):
+    def __init__(self, language: str, lexer_only: bool = False, two_stage: bool = False,
+                 dfa_snapshot: str = None, whole_file: bool = False, cache=None,
+                 diff_engine: str = "difflib", stats=None, skip_html: bool = False,
+                 preprocess: bool = False, skip_if0: bool = False):
         self.LANGUAGE = language
+        if diff_engine not in DIFF_ENGINES:
+            raise ValueError("Unknown diff engine: %s" % diff_engine)
+        # make_change_setなどでトークン列の差分に使うアルゴリズム(diff.DIFF_ENGINES)
+        self.DIFF_ENGINE = diff_engine
+        # getTokensの結果を保存するTokenCache(Noneなら保存しない)
+        self.cache = cache
+        # 処理段階ごとの時間と数を集計するstats.PhaseStats(Noneなら集計しない)
+        self.stats = stats
+        self._grammar_hash = None
+        # Trueなら構文解析をせず字句解析だけでトークンを作る
+        self.LEXER_ONLY = lexer_only
+        # TrueならまずSLLで解析し，失敗したときだけLLで解析し直す
+        self.TWO_STAGE = two_stage
+        # TrueならPHPのブロックの外のHTMLを字句解析せず，まとめて1つのトークン(HtmlText)にする
+        self.SKIP_HTML = skip_html and language == "PHP"
+        # TrueならC++の前処理の行とコメントを取り除いたコードを解析する(トークンの位置は元のコードのもの)
+        self.PREPROCESS = (preprocess or skip_if0) and language == "CPP"
+        # Trueなら前処理で#if 0などの使われない分岐も取り除く
+        self.SKIP_IF0 = skip_if0 and self.PREPROCESS
+        self.PARSE_STATS.setdefault(self.LANGUAGE, Counter())
+        # 構文解析器のモジュールは大きいので，getTreeで必要になるまで読み込まない
+        self._Parser = None
+        # 呼び出しごとに作り直さず，入力だけ差し替えて使い回す字句解析器と構文解析器
+        # 同じTokenizerを複数のスレッドから使えるよう，スレッドごとに持つ
+        self._recognizers = _Recognizers()
         if self.LANGUAGE == "Python":
-            from .grammers.Python.Python3Parser import Python3Parser as Parser
             from .grammers.Python.Python3Lexer import Python3Lexer as Lexer
+            self.PARSER_PATH = (".grammers.Python.Python3Parser", "Python3Parser")
             self.IDENTIFIER_TAG = "NAME"
             self.STRING_TAG = "STRING"  
             self.NUMBER_TAG = "NUMBER"
-            self.VOCABULARY = Parser.symbolicNames
+            self.VOCABULARY = load_vocabulary("Python/Python3.tokens")
+            self.START_RULE = "single_input"
         elif self.LANGUAGE == "Java":
-            from .grammers.Java.JavaParser import JavaParser as Parser
             from .grammers.Java.JavaLexer import JavaLexer as Lexer
+            self.PARSER_PATH = (".grammers.Java.JavaParser", "JavaParser")
             self.IDENTIFIER_TAG = "IDENTIFIER"
             self.STRING_TAG = "STRING_LITERAL"
             self.NUMBER_TAG = "DECIMAL_LITERAL"
-            self.VOCABULARY = Parser.symbolicNames
+            self.VOCABULARY = load_vocabulary("Java/JavaLexer.tokens")
+            self.START_RULE = "compilationUnit"
         elif self.LANGUAGE == "JavaScript":
-            from .grammers.JavaScript.JavaScriptParser import JavaScriptParser as Parser
             from .grammers.JavaScript.JavaScriptLexer import JavaScriptLexer as Lexer
-            self.VOCABULARY = Parser.symbolicNames
+            from .grammers.JavaScript.JavaScriptBaseParser import JavaScriptTokenStream
+            # 改行の有無を調べる述語のため，トークンごとに直前の改行の有無を記録するトークン列
+            self.TokenStream = JavaScriptTokenStream
+            self.PARSER_PATH = (".grammers.JavaScript.JavaScriptParser", "JavaScriptParser")
+            self.VOCABULARY = load_vocabulary("JavaScript/JavaScriptLexer.tokens")
             self.IDENTIFIER_TAG = "Identifier"
             self.STRING_TAG = "StringLiteral"
             self.NUMBER_TAG = "DecimalLiteral"
+            self.START_RULE = "sourceElement"
         elif self.LANGUAGE == "CPP":
-            from .grammers.CPP.CPP14Parser import CPP14Parser as Parser
             from .grammers.CPP.CPP14Lexer import CPP14Lexer as Lexer
-            self.VOCABULARY = Parser.symbolicNames
+            self.PARSER_PATH = (".grammers.CPP.CPP14Parser", "CPP14Parser")
+            self.VOCABULARY = load_vocabulary("CPP/CPP14.tokens")
             self.IDENTIFIER_TAG = "Identifier"
             self.STRING_TAG = "Stringliteral"
             self.NUMBER_TAG = "Integerliteral"
+            self.START_RULE = "translationunit"
         elif self.LANGUAGE == "PHP":
-            from .grammers.PHP.PhpParser import PhpParser as Parser
             from .grammers.PHP.PhpLexer import PhpLexer as Lexer
-            self.VOCABULARY = Parser.symbolicNames
+            self.PARSER_PATH = (".grammers.PHP.PhpParser", "PhpParser")
+            self.VOCABULARY = load_vocabulary("PHP/PhpLexer.tokens")
             self.IDENTIFIER_TAG = "VarName"
             self.STRING_TAG = "StringPart"
             self.NUMBER_TAG = "Decimal"
+            self.START_RULE = "htmlDocument"
         else:
             print("Unknown Language, so solve as Python")
-            from .grammers.Python.Python3Parser import Python3Parser as Parser
             from .grammers.Python.Python3Lexer import Python3Lexer as Lexer
-            self.VOCABULARY = Parser.symbolicNames
+            self.PARSER_PATH = (".grammers.Python.Python3Parser", "Python3Parser")
+            self.VOCABULARY = load_vocabulary("Python/Python3.tokens")
+            self.START_RULE = "single_input"
 
-        self.Parser = Parser
         self.Lexer = Lexer
+        # 1行ずつではなくファイル全体を1回で解析する
+        if whole_file:
+            self.START_RULE = self.FILE_RULES.get(self.LANGUAGE, "file_input")
+        # 以前の実行で育てたDFAを読み込み，最初の数百ファイルの遅さを避ける
+        if dfa_snapshot is not None:
+            self.loadDFA(dfa_snapshot)
+
+    @property
+    def Parser(self):
+        if self._Parser is None:
+            module_name, class_name = self.PARSER_PATH
+            self._Parser = getattr(import_module(module_name, __package__), class_name)
+        return self._Parser
+
+    def grammarHash(self):
+        """
+        トークン化に使う文法のハッシュ．キャッシュのキーに使う
+        """
+        if self._grammar_hash is None:
+            classes = [self.Lexer] if self.LEXER_ONLY else [self.Lexer, self.Parser]
+            self._grammar_hash = ":".join(grammar_hash(x) for x in classes)
+        return self._grammar_hash
+
+    def saveDFA(self, path: str):
+        """
+        これまでに構築されたDFAの状態をpathに保存する
+        """
+        save_snapshot(path, self.Lexer, None if self.LEXER_ONLY else self.Parser)
+
+    def loadDFA(self, path: str):
+        """
+        saveDFAで保存したDFAを読み込む．文法やランタイムが違うときはFalseを返す
+        """
+        return load_snapshot(path, self.Lexer, None if self.LEXER_ONLY else self.Parser)
+
+    def getLexer(self, code: str):
+        recognizers = self._recognizers
+        if recognizers.lexer is None:
+            lexer = synchronize_lexer(self.Lexer(InputStream(code)))
+            lexer.removeErrorListeners()
+            lexer.addErrorListener(recognizers.lexer_errors)
+            if self.SKIP_HTML:
+                lexer.SkipHtml = True
+            recognizers.lexer = lexer
+        else:
+            recognizers.lexer.inputStream = InputStream(code)
+        return recognizers.lexer
+
+    def phase(self, name):
+        """
+        statsがあれば処理段階name(lex, parse, walk, diff)の時間を測るwith文，なければ何もしないwith文
+        """
+        if self.stats is None:
+            return NO_PHASE
+        return self.stats.phase(name)
+
+    def countParse(self, key):
+        """
+        PARSE_STATSのこの言語のkey(sll, ll, incremental, reparse)を1つ増やす．複数のスレッドから呼んでよい
+        """
+        with _PARSE_STATS_LOCK:
+            self.PARSE_STATS[self.LANGUAGE][key] += 1
+
+    def fillTokens(self, stream):
+        """
+        トークン列を最後まで字句解析する．statsがあればlexの段階として記録する
+        """
+        if self.stats is None:
+            stream.fill()
+            return
+        lexer_errors = self._recognizers.lexer_errors
+        errors = lexer_errors.count
+        with self.stats.phase("lex") as phase:
+            stream.fill()
+            phase.add(tokens=len(stream.tokens), errors=lexer_errors.count - errors)
+
+    def getTokenStream(self, code: str, TokenStream=None):
+        """
+        codeを字句解析するトークン列．PREPROCESSなら前処理の行とコメントを取り除いてから字句解析する
+        """
+        if not self.PREPROCESS:
+            return (TokenStream or self.TokenStream)(self.getLexer(code))
+        with self.phase("preprocess") as phase:
+            stripped, offsets = strip_preprocessor(code, self.SKIP_IF0)
+            phase.add(chars=len(code), removed=len(code) - len(stripped))
+        return PreprocessedTokenStream(self.getLexer(stripped), code, offsets)
+
+    def getParser(self, code: str):
+        stream = self.getTokenStream(code)
+        # 集計するときは，字句解析と構文解析の時間を分けるため先に字句解析を済ませる
+        if self.stats is not None:
+            self.fillTokens(stream)
+        recognizers = self._recognizers
+        if recognizers.parser is None:
+            parser = synchronize_parser(self.Parser(stream))
+            parser.removeErrorListeners()
+            recognizers.parser = parser
+        else:
+            recognizers.parser.setInputStream(stream)
+        return recognizers.parser
 
     def getTokens(self, code):
-        if self.LANGUAGE == "Python":
-            return self.makeTokensPython(self.getTree(code), [])
-        return self.makeTokens(self.getTree(code), [])
+        if self.cache is not None:
+            return self.cache.get_tokens(self, code, self.makeTokensFromCode)
+        return self.makeTokensFromCode(code)
+
+    def makeTokensFromCode(self, code):
+        if self.LEXER_ONLY:
+            return self.getLexerTokens(code)
+        return self.makeTokensFromTree(code)
+
+    def makeTokensFromTree(self, code):
+        tree = self.getTree(code)
+        with self.phase("walk") as phase:
+            if self.LANGUAGE == "Python":
+                tokens = self.makeTokensPython(tree, [])
+            else:
+                tokens = self.makeTokens(tree, [])
+            phase.add(tokens=len(tokens))
+        return tokens
+
+    def getTokenBuffer(self, code):
+        """
+        getTokensと同じトークン列を，省メモリなTokenBufferとして返す
+        """
+        return TokenBuffer.from_tokens(code, self.getTokens(code))
 
     def getPureTokens(self, code):
         try:
@@ -70,66 +290,286 @@ class Tokenizer():
 
     def getTree(self, code: str):
         # code = code_trip(code)
-        parser = self.Parser(CommonTokenStream(self.Lexer(InputStream(code))))
-        parser.removeErrorListeners()
-        if self.LANGUAGE == "Python":
-            tree = parser.single_input()
-        elif self.LANGUAGE == "Java":
-            tree = parser.compilationUnit()
-        elif self.LANGUAGE == "JavaScript":
-            tree = parser.sourceElement()
-        elif self.LANGUAGE == "CPP":
-            tree = parser.translationunit()
-        elif self.LANGUAGE == "PHP":
-            tree = parser.htmlDocument()
+        if self.stats is not None:
+            return self.getTreeWithStats(code)
+        if self.TWO_STAGE:
+            tree = self.getTreeTwoStage(code)
         else:
-            tree = parser.single_input()
+            parser = self.getParser(code)
+            tree = getattr(parser, self.START_RULE)()
+        # updateで使うため，隠しチャネルも含めた全トークンと構文エラーの数を木に持たせる
+        tree.tokens = self._recognizers.parser.getTokenStream().tokens
+        tree.syntax_errors = self._recognizers.parser.getNumberOfSyntaxErrors()
 
         return tree
 
+    def getTreeWithStats(self, code: str):
+        """
+        getTreeと同じ木を作り，構文解析の時間，ノード数，エラー回復の回数，LLへ切り替えた回数を記録する
+        """
+        parser = self.getParser(code)
+        fallbacks = self._recognizers.ll_fallbacks
+        with self.stats.phase("parse") as phase:
+            if self.TWO_STAGE:
+                tree = self.getTreeTwoStage(code, parser)
+            else:
+                tree = getattr(parser, self.START_RULE)()
+            tree.tokens = parser.getTokenStream().tokens
+            tree.syntax_errors = parser.getNumberOfSyntaxErrors()
+            rules, terminals = count_nodes(tree)
+            phase.add(rule_nodes=rules, terminal_nodes=terminals, errors=tree.syntax_errors,
+                      ll_fallbacks=self._recognizers.ll_fallbacks - fallbacks)
+        return tree
+
+    def update(self, tree, edit_range, new_text: str):
+        """
+        getTreeで作った木のコードのedit_range=(start, stop)の文字をnew_textに置き換え，構文木を更新する
+        編集箇所を含む最小の文・宣言の規則(STATEMENT_RULES)だけを字句解析・構文解析し直し，
+        残りの木はそのまま使う．結果はいつもgetTree(編集後のコード)と同じ木になる
+        次のときは全体を解析し直す(statsの"update"の段階に，理由ごとの数をreparse_*として記録する)
+        - errors: 木に構文エラーがある(エラーの回復は木全体に依存するため)．
+          空白を既定チャネルに持つこの文法のJavaは，いつもこれになる
+        - no_rule: 編集箇所を含む規則がSTATEMENT_RULESにない(文の外の編集，Python・Java以外の言語)
+        - region: 外側の規則まで試しても，規則の後ろで字句解析の状態が元に戻らないか(文字列・コメントを開く編集など)，
+          規則として構文エラーなく解析できない
+        編集箇所より後ろのトークンの位置をずらすので，1回の更新にファイルのトークン数に比例する時間がかかる
+        渡した木はその場で書き換えるので，以後は返り値の木を使う
+        """
+        start, stop = edit_range
+        tokens = getattr(tree, "tokens", None)
+        if not tokens or tokens[-1].type != Token.EOF:
+            raise ValueError("tree must be created by getTree with a whole file rule")
+        stream = tokens[-1].getInputStream()
+        code = stream.strdata[:start] + new_text + stream.strdata[stop:]
+        rules = self.STATEMENT_RULES.get(self.LANGUAGE, [])
+        candidates = [ctx for ctx in reversed(enclosing_path(tree, start, stop))
+                      if self.Parser.ruleNames[ctx.getRuleIndex()] in rules]
+        with self.phase("update") as phase:
+            if tree.syntax_errors:
+                reason = "errors"
+            elif not candidates:
+                reason = "no_rule"
+            elif self.updateRegion(stream, tokens, candidates, start, stop, new_text):
+                reason = None
+            else:
+                reason = "region"
+            if reason is None:
+                phase.add(incremental=1)
+            else:
+                phase.add(reparse=1, **{"reparse_" + reason: 1})
+        if reason is None:
+            self.countParse("incremental")
+            return tree
+        self.countParse("reparse")
+        return self.getTree(code)
+
+    def updateRegion(self, stream, tokens, candidates, start, stop, new_text):
+        """
+        updateで，candidatesの規則を内側から順に解析し直す．差し替えられればTrue
+        """
+        delta = len(new_text) - (stop - start)
+        replace_text(stream, start, stop, new_text)
+        parser = self._recognizers.parser
+        if parser is None:
+            parser = self.getParser("")
+        prediction_mode, error_handler = parser._interp.predictionMode, parser._errHandler
+        try:
+            for ctx in candidates:
+                first, last = ctx.start.tokenIndex, ctx.stop.tokenIndex
+                lexer = self.getRegionLexer(stream, ctx, tokens[first - 1] if first > 0 else None)
+                relexed = relex_region(lexer, tokens, first, last, delta)
+                if relexed is None or not relexed[0]:
+                    continue
+                region, matched = relexed
+                new_ctx = parse_region(parser, self.Parser.ruleNames[ctx.getRuleIndex()], region)
+                if new_ctx is None:
+                    continue
+                splice(tokens, ctx, new_ctx, region, tokens[last + 1], matched, delta)
+                return True
+        finally:
+            parser._interp.predictionMode, parser._errHandler = prediction_mode, error_handler
+        return False
+
+    def getRegionLexer(self, stream, ctx, previous_token):
+        """
+        ctxの先頭から字句解析を始める字句解析器．ctxの外側から分かる状態(Pythonのインデント)を設定する
+        """
+        recognizers = self._recognizers
+        if recognizers.region_lexer is None:
+            recognizers.region_lexer = synchronize_lexer(self.Lexer(stream))
+            recognizers.region_lexer.removeErrorListeners()
+        lexer = recognizers.region_lexer
+        lexer.inputStream = stream
+        stream.seek(ctx.start.start)
+        lexer.line = ctx.start.line
+        lexer.column = ctx.start.column
+        if self.LANGUAGE == "Python":
+            indents = []
+            node = ctx.parentCtx
+            while node is not None:
+                if node.getRuleIndex() == self.Parser.RULE_suite:
+                    indent = node.getToken(self.Parser.INDENT, 0)
+                    if indent is not None:
+                        indents.append(lexer.getIndentationCount(indent.getText()))
+                node = node.parentCtx
+            lexer.indents = indents[::-1]
+            lexer.lastToken = previous_token
+        return lexer
+
+    def getTreeTwoStage(self, code: str, parser=None):
+        """
+        SLL予測と即時中断のエラー戦略で解析し，構文エラーのときだけ
+        通常のLL予測とエラー回復で解析し直す
+        parser: codeを入力に設定済みの構文解析器(省略時は作る)
+        """
+        if parser is None:
+            parser = self.getParser(code)
+        self.countParse("sll")
+
+        parser._interp.predictionMode = PredictionMode.SLL
+        parser._errHandler = BailErrorStrategy()
+        try:
+            return getattr(parser, self.START_RULE)()
+        except ParseCancellationException:
+            self.countParse("ll")
+            self._recognizers.ll_fallbacks += 1
+
+        parser._interp.predictionMode = PredictionMode.LL
+        parser._errHandler = DefaultErrorStrategy()
+        parser.reset()
+        return getattr(parser, self.START_RULE)()
+
+    def getLexerTokens(self, code: str):
+        """
+        構文木を作らず，字句解析器のトークン列から直接トークンを作る
+        開始規則が受理するのと同じ既定チャネルのトークンだけを返す
+        開始規則の文がどこで終わるかを字句だけで決められないとき(JavaScriptの文の途中の改行)は構文解析する
+        """
+        stream = self.getTokenStream(code, CommonTokenStream)
+        self.fillTokens(stream)
+        with self.phase("walk") as phase:
+            tokens = self.makeLexerTokens(stream.tokens, [])
+            if tokens is not None:
+                phase.add(tokens=len(tokens))
+        if tokens is None:
+            return self.makeTokensFromTree(code)
+        return tokens
+
+    def makeLexerTokens(self, lexer_tokens, tokens: list):
+        """
+        字句解析器のトークン列から，構文木から作るのと同じ形のトークン列を作る(構文エラーのないコードなら同じになる)
+        Pythonの行番号は，makeTokensPythonと同じく親の規則の先頭のトークンの行にする(rule_starts.py)
+        開始規則が1文だけ(single_input, sourceElement)なら最初の文の後は読まない．文の終わりを決められなければNone
+        """
+        default_tokens = [token for token in lexer_tokens if token.channel == Token.DEFAULT_CHANNEL]
+        eof = None
+        if default_tokens and default_tokens[-1].type == Token.EOF:
+            eof = default_tokens.pop()
+        names = [self.VOCABULARY[token.type] for token in default_tokens]
+        with_eof = self.START_RULE in self.EOF_RULES
+        if not with_eof:
+            end = self.statementEnd(names)
+            if end is None:
+                return None
+            if end < len(names) - 1:
+                eof = None
+            del default_tokens[end + 1:], names[end + 1:]
+        # 開始規則のEOFの前に，最後の文の文末(eos)としてEOFを読む(JavaScript)
+        eos_eof = self.LANGUAGE == "JavaScript" and eof is not None and javascript_consumes_eof(names)
+        if eof is not None:
+            default_tokens.append(eof)
+            names.append(self.VOCABULARY[eof.type])
+        is_python = self.LANGUAGE == "Python"
+        rule_starts = PythonRuleStarts() if is_python else None
+        for i, token in enumerate(default_tokens):
+            if token.type == Token.EOF:
+                if eos_eof:
+                    tokens.append((token.text, names[i], token.start - self.tokensEnd(tokens), token.start))
+                if not with_eof:
+                    break
+            symbollic_name = names[i]
+            if is_python:
+                first = rule_starts.feed(symbollic_name, names[i + 1] if i + 1 < len(names) else None)
+            if symbollic_name in self.IGNORE_CONTENTS:
+                continue
+            if len(tokens) > 0:
+                previous_token = tokens[-1]
+            start = token.start
+            space = start - self.tokensEnd(tokens)
+            string = token.text
+            if not is_python:
+                tokens.append((string, symbollic_name, space, start))
+                continue
+            line = token.line
+            if len(tokens) > 0:
+                # 親の規則の先頭でなければ，直前のトークンの行に含める
+                if line < previous_token[4] or not first:
+                    line = previous_token[4]
+                elif line > previous_token[4]:
+                    tokens.append(("\n" * (line - previous_token[4]), "new_line", 0, previous_token[3], previous_token[4]))
+            tokens.append((string, symbollic_name, space, start, line))
+        return tokens
+
+    def statementEnd(self, names):
+        """
+        開始規則が1文だけのとき，その文の最後のトークンの添字(namesはEOFを除く種類名)．決められなければNone
+        """
+        if self.START_RULE == "single_input":
+            return python_statement_end(names)
+        if self.START_RULE == "sourceElement":
+            return javascript_statement_end(names)
+        return len(names) - 1
+
+    @staticmethod
+    def tokensEnd(tokens):
+        """
+        トークン列の最後のトークンの終わりの位置(空白数の計算に使う)
+        """
+        if not tokens:
+            return 0
+        return tokens[-1][3] + len(tokens[-1][0])
+
     def makeTokens(self, tree, tokens: list):
-        if isinstance(tree, TerminalNode):
-            symbollic_name = self.VOCABULARY[tree.symbol.type]
-            if symbollic_name not in self.IGNORE_CONTENTS:
-                if len(tokens) > 0:
-                    previous_token = tokens[-1]
-                    before_index = previous_token[3] + len(previous_token[0])
-                else:
-                    before_index = 0
-                start = tree.getPayload().start
-                space = start - before_index
-                string = tree.getText()
-                if not string.startswith("<missing"):
-                    tokens.append((string, symbollic_name, space, start))
-        for i in range(tree.getChildCount()):
-            tree2 = tree.getChild(i)
-            self.makeTokens(tree2, tokens)
+        for node in iter_terminals(tree):
+            symbol = node.symbol
+            symbollic_name = self.VOCABULARY[symbol.type]
+            if symbollic_name in self.IGNORE_CONTENTS:
+                continue
+            if len(tokens) > 0:
+                previous_token = tokens[-1]
+                before_index = previous_token[3] + len(previous_token[0])
+            else:
+                before_index = 0
+            start = symbol.start
+            space = start - before_index
+            string = symbol.text
+            if not string.startswith("<missing"):
+                tokens.append((string, symbollic_name, space, start))
         return tokens
 
 
     def makeTokensPython(self, tree, tokens: list):
-        if isinstance(tree, TerminalNode):
-            symbollic_name = self.VOCABULARY[tree.symbol.type]
-            if symbollic_name not in self.IGNORE_CONTENTS:
-                line = tree.parentCtx.start.line
-                if len(tokens) > 0:
-                    previous_token = tokens[-1]
-                    before_index = previous_token[3] + len(previous_token[0])
-
-                    if line < previous_token[4]:
-                        line = previous_token[4]
-                    elif line > previous_token[4]:
-                        tokens.append(("\n" * (line - previous_token[4]), "new_line", 0, previous_token[3], previous_token[4]))
-                else:
-                    before_index = 0
-                start = tree.getPayload().start
-                space = start - before_index
-                string = tree.getText()
-                if not string.startswith("<missing"):
-                    tokens.append((string, symbollic_name, space, start, line))
-        for i in range(tree.getChildCount()):
-            tree2 = tree.getChild(i)
-            self.makeTokensPython(tree2, tokens)
+        for node in iter_terminals(tree):
+            symbol = node.symbol
+            symbollic_name = self.VOCABULARY[symbol.type]
+            if symbollic_name in self.IGNORE_CONTENTS:
+                continue
+            line = node.parentCtx.start.line
+            if len(tokens) > 0:
+                previous_token = tokens[-1]
+                before_index = previous_token[3] + len(previous_token[0])
+
+                if line < previous_token[4]:
+                    line = previous_token[4]
+                elif line > previous_token[4]:
+                    tokens.append(("\n" * (line - previous_token[4]), "new_line", 0, previous_token[3], previous_token[4]))
+            else:
+                before_index = 0
+            start = symbol.start
+            space = start - before_index
+            string = symbol.text
+            if not string.startswith("<missing"):
+                tokens.append((string, symbollic_name, space, start, line))
         return tokens
 
     def make_change_set(self, source, target):
@@ -145,7 +585,9 @@ class Tokenizer():
                 change_set["a"] == change_set["b"]:
             return -1
 
-        opcodes = SequenceMatcher(None, change_set["a"], change_set["b"]).get_opcodes()
+        with self.phase("diff") as phase:
+            opcodes = get_opcodes(change_set["a"], change_set["b"], self.DIFF_ENGINE)
+            phase.add(tokens=len(change_set["a"]) + len(change_set["b"]))
         diffs = []
 
         for tag, a_i1, a_i2, b_i1, b_i2 in opcodes:
@@ -174,21 +616,110 @@ class Tokenizer():
             diffs.extend(sequence)            
         return diffs
 
+    def getLineTokens(self, code, needed=None):
+        """
+        行ごとにgetPureTokensと同じ形のトークン列を返す
+        行の区切りはsplitlines(keepends=True)と同じで，トークンは開始位置の行に入る
+        複数行にまたがるトークンは行ごとに分けるので，行単位で解析したときと同じ形になる
+        needed(0から数える行番号の集合)を渡すと，その前後LINE_CONTEXT行の範囲だけを字句解析し，neededの行だけを埋める．
+        範囲の端をまたぐLINE_CONTEXT行より長いコメント・文字列があると，ファイル全体を字句解析したときと違うことがある
+        字句解析の結果はcacheに範囲のコードのハッシュで保存する
+        """
+        lines = code.splitlines(keepends=True)
+        line_tokens = [[] for _ in lines]
+        line_starts = [0]
+        for line in lines:
+            line_starts.append(line_starts[-1] + len(line))
+        if needed is None:
+            windows = [(0, len(lines))]
+        else:
+            windows = line_windows(sorted(needed), len(lines), self.LINE_CONTEXT,
+                                   lambda first: self.windowStart(lines, first))
+        for first, last in windows:
+            base = line_starts[first]
+            prefix = self.windowPrefix(code, base)
+            try:
+                tokens = self.getCachedLexerTokens(prefix + code[base:line_starts[last]])
+            except:
+                continue
+            for token in tokens:
+                start = token[3] - len(prefix)
+                # new_lineは行の区切りを表すだけの補助トークン
+                if start < 0 or token[1] == "new_line" or (token[0].startswith("<") and token[0].endswith(">")):
+                    continue
+                line = bisect_right(line_starts, base + start) - 1
+                # 複数行にまたがるトークン(改行を含む空白など)は行ごとに分ける
+                for text in token[0].splitlines(keepends=True):
+                    if first <= line < last and (needed is None or line in needed):
+                        line_tokens[line].append(text)
+                    line += 1
+        return line_tokens
+
+    def windowStart(self, lines, first):
+        """
+        first行目から字句解析を始めると状態(インデント・括弧)が違うなら，始めてよい行まで前に戻す
+        """
+        pattern = self.WINDOW_START_LINES.get(self.LANGUAGE)
+        if pattern is None:
+            return first
+        while first > 0 and not (pattern.match(lines[first]) and not lines[first - 1].endswith("\\\n")):
+            first -= 1
+        return first
+
+    def windowPrefix(self, code, base):
+        """
+        code[base:]から字句解析するとき前に付けるコード．PHPのブロックの中から始まるなら開始タグを付ける
+        """
+        if self.LANGUAGE == "PHP" and code.rfind("<?", 0, base) > code.rfind("?>", 0, base):
+            return "<?php "
+        return ""
+
+    def getCachedLexerTokens(self, code):
+        """
+        getLexerTokensの結果．cacheがあればコードのハッシュをキーにして保存する
+        """
+        if self.cache is not None:
+            return self.cache.get_tokens(self, code, self.getLexerTokens, kind="lexer")
+        return self.getLexerTokens(code)
+
     def make_change_set_line(self, source, target):
-        differ = Differ().compare(source, target)
-        differ = ndiff(source.splitlines(keepends=True),
-                       target.splitlines(keepends=True))
+        # 変更のある行とその前後(LINE_CONTEXT行)だけを字句解析し，行ごとのトークンは添字で取り出す
+        with self.phase("diff") as phase:
+            differ = list(ndiff(source.splitlines(keepends=True),
+                                target.splitlines(keepends=True)))
+            phase.add(lines=len(differ))
+        source_needed = set()
+        target_needed = set()
+        source_index = 0
+        target_index = 0
+        for diff in differ:
+            symbol = diff[0]
+            if symbol == "-":
+                source_needed.add(source_index)
+            elif symbol == "+":
+                target_needed.add(target_index)
+            if symbol in " -":
+                source_index += 1
+            if symbol in " +":
+                target_index += 1
+        source_tokens = self.getLineTokens(source, source_needed) if source_needed else None
+        target_tokens = self.getLineTokens(target, target_needed) if target_needed else None
+        source_index = 0
+        target_index = 0
         previous_symbol = " "
         previous_tokens = []
         out = []
         for diff in differ:
             symbol = diff[0]
-            if len(diff) < 3 or symbol == "?":
+            if symbol == "?":
                 continue
             if symbol == " ":
+                source_index += 1
+                target_index += 1
                 continue
             elif symbol == "-":
-                token = self.getPureTokens(diff[2:])
+                token = source_tokens[source_index]
+                source_index += 1
                 if token == []:
                     continue
                 if previous_symbol == "-":
@@ -199,7 +730,8 @@ class Tokenizer():
                     if changed_tokens != []:
                         out.append(changed_tokens)
             elif symbol == "+":
-                token = self.getPureTokens(diff[2:])
+                token = target_tokens[target_index]
+                target_index += 1
                 if token == []:
                     continue
                 if previous_symbol == "+":
@@ -217,9 +749,10 @@ class Tokenizer():
     
     def get_lines_diff(self, previous_tokens, token):
         changed_tokens = []
-        matcher = SequenceMatcher(None,
-        previous_tokens, token)
-        for tag, a_i1, a_i2, b_i1, b_i2 in matcher.get_opcodes():
+        with self.phase("diff") as phase:
+            opcodes = get_opcodes(previous_tokens, token, self.DIFF_ENGINE)
+            phase.add(tokens=len(previous_tokens) + len(token))
+        for tag, a_i1, a_i2, b_i1, b_i2 in opcodes:
             symbol2 = opt_tag2symbol(tag)
             if symbol2 == "*":
                 changed_tokens.append({"tag": symbol2, "tokens": [previous_tokens[b_i1:b_i2], token[a_i1:a_i2]]})
@@ -233,29 +766,54 @@ class Tokenizer():
                 continue
         return changed_tokens
 
+    def make_tree_diff(self, source, target):
+        """
+        構文木同士を比較し，insert/delete/update/moveの編集操作のリストを返す(tree_diff.py)
+        規則のノードは規則の番号で，終端ノードはトークンの種類と文字列で比較する
+        """
+        tree_a = self.getTree(source)
+        tree_b = self.getTree(target)
+        with self.phase("diff") as phase:
+            nodes_a = build_tree(tree_a)
+            nodes_b = build_tree(tree_b)
+            mapping = match_trees(nodes_a, nodes_b)
+            actions = edit_script(nodes_a, nodes_b, mapping, self.describeNode)
+            phase.add(nodes=len(nodes_a) + len(nodes_b), actions=len(actions))
+        return actions
+
+    def describeNode(self, node):
+        if node.label >= 0:
+            name = self.Parser.ruleNames[node.label]
+        elif node.label == -1 - Token.EOF:
+            name = "EOF"
+        else:
+            token_type = -1 - node.label
+            name = self.Parser.symbolicNames[token_type]
+            if name == "<INVALID>" and token_type < len(self.Parser.literalNames):
+                name = self.Parser.literalNames[token_type]
+        return {"type": name, "text": node.text, "start": node.start}
+
     def get_abstract_tree_diff(self, source, target):
         tokens_a = clean_symbol(self.getTokens(source))
         tokens_b = clean_symbol(self.getTokens(target))
 
-        abstract_index = 0
+        # 識別子・文字列・数値を，両方に現れる文字列ごとに${番号:種類}へ置き換える
+        # 番号はtokens_aで最初に対応がついた順．tokens_bは文字列ごとの辞書で引くので線形時間
+        abstract_tags = {self.IDENTIFIER_TAG, self.STRING_TAG, self.NUMBER_TAG}
+        texts_b = {token_b[0] for token_b in tokens_b if token_b[1] in abstract_tags}
         abstracted_identifiers = {}
-        for i, token_a in [x for x in enumerate(tokens_a)
-                        if x[1][1] in [self.IDENTIFIER_TAG, self.STRING_TAG, self.NUMBER_TAG]]:
-            if token_a[0] in abstracted_identifiers:
-                tokens_a[i] = (f"${{{abstracted_identifiers[token_a[0]]}:{token_a[1]}}}", "ABSTRACT_SNIPPET", token_a[2], token_a[3])
+        for i, token_a in enumerate(tokens_a):
+            if token_a[1] not in abstract_tags:
                 continue
-
-            for j, token_b in [x for x in enumerate(tokens_b)
-                            if x[1][1] in [self.IDENTIFIER_TAG, self.STRING_TAG, self.NUMBER_TAG]]:
-                if token_b[0] in abstracted_identifiers:
-                    tokens_b[j] = (f"${{{abstracted_identifiers[token_b[0]]}:{token_b[1]}}}", "ABSTRACT_SNIPPET", token_b[2], token_b[3])
-                    continue
+            if token_a[0] not in abstracted_identifiers:
                 # if identifiers looks function
-                elif token_a[0] == token_b[0] and i + 1 < len(tokens_a) and tokens_a[i+1][0] != "(":
-                    tokens_a[i] = (f"${{{abstract_index}:{token_a[1]}}}", "ABSTRACT_SNIPPET", token_a[2], token_a[3])
-                    tokens_b[j] = (f"${{{abstract_index}:{token_b[1]}}}", "ABSTRACT_SNIPPET", token_b[2], token_b[3])
-                    abstracted_identifiers[token_a[0]] = abstract_index
-                    abstract_index += 1
+                if token_a[0] not in texts_b or i + 1 >= len(tokens_a) or tokens_a[i+1][0] == "(":
+                    continue
+                abstracted_identifiers[token_a[0]] = len(abstracted_identifiers)
+            tokens_a[i] = (f"${{{abstracted_identifiers[token_a[0]]}:{token_a[1]}}}", "ABSTRACT_SNIPPET", token_a[2], token_a[3])
+        for j, token_b in enumerate(tokens_b):
+            if token_b[1] in abstract_tags and token_b[0] in abstracted_identifiers:
+                tokens_b[j] = (f"${{{abstracted_identifiers[token_b[0]]}:{token_b[1]}}}", "ABSTRACT_SNIPPET", token_b[2], token_b[3])
         non_abstracted_identifiers = {"condition": list(set([x[0] for x in tokens_a
                                                     if x[1] == self.IDENTIFIER_TAG])),
                                       "consequent": list(set([x[0] for x in tokens_b
@@ -271,6 +829,81 @@ class Tokenizer():
                 "consequent": real_consequent,
                 "abstracted": {v: k for k, v in abstracted_identifiers.items()}}
 
+def detect_language(path):
+    """
+    拡張子から言語名を推定する．対応していなければNoneを返す
+    """
+    extension = os.path.splitext(path)[1].lower()
+    for language, extensions in LANGUAGE_EXTENSIONS.items():
+        if extension in extensions:
+            return language
+    return None
+
+
+@lru_cache(maxsize=None)
+def load_vocabulary(tokens_file):
+    """
+    ANTLRが出力する.tokensファイルから，構文解析器のsymbolicNamesと同じ表を作る
+    (構文解析器のモジュールを読み込まずに済ませるため)
+    """
+    names = {}
+    max_type = 0
+    with open(os.path.join(GRAMMERS_DIR, tokens_file), "r") as f:
+        for line in f:
+            name, _, token_type = line.rstrip("\n").rpartition("=")
+            token_type = int(token_type)
+            max_type = max(max_type, token_type)
+            # 'xxx'はリテラル名，T__nは文法中に直接書かれた無名のトークン
+            if not name.startswith("'") and not name.startswith("T__"):
+                names[token_type] = name
+    return ["<INVALID>"] + [names.get(i, "<INVALID>") for i in range(1, max_type + 1)]
+
+
+def iter_terminals(tree):
+    """
+    構文木の終端ノードを行きがけ順に返す
+    再帰せずに明示的なスタックでたどるので，深い木でも再帰の上限に達しない
+    """
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, TerminalNode):
+            yield node
+            continue
+        children = getattr(node, "children", None)
+        if children:
+            stack.extend(reversed(children))
+
+
+def group_tokens_by_line(code, tokens):
+    """
+    トークン列を開始位置で行ごとに分ける
+    :return: {行番号(1始まり): その行から始まるトークンのリスト}
+    """
+    line_starts = [0] + [i + 1 for i, char in enumerate(code) if char == "\n"]
+    lines = {}
+    for token in tokens:
+        lines.setdefault(bisect_right(line_starts, token[3]), []).append(token)
+    return lines
+
+
+def line_windows(lines, count, context, start=None):
+    """
+    昇順の行番号linesの前後context行を，重なる範囲をまとめた[(開始行, 終了行の次), ...]にする(countは行数)
+    start: 範囲の開始行を受け取り，字句解析を始めてよい行を返す関数
+    """
+    windows = []
+    for line in lines:
+        first, last = max(0, line - context), min(count, line + context + 1)
+        if start is not None:
+            first = start(first)
+        if windows and first <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], last))
+        else:
+            windows.append((first, last))
+    return windows
+
+
 def tokens2Realcode(tokens):
     return "".join([" " * x[2] + x[0] for x in tokens])
 
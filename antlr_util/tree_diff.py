@@ -0,0 +1,290 @@
+from bisect import bisect_left
+from collections import Counter, deque
+from antlr4 import TerminalNode
+from .diff import get_opcodes
+
+# 上から下への照合で対応づける部分木の高さの下限
+# 終端ノードは候補が1つだけのときに限って対応づけ，複数あるものは下から上への照合に任せる
+MIN_HEIGHT = 1
+# 下から上への照合で対応づけるのに必要な，対応済みの子孫の割合(Dice係数)
+MIN_DICE = 0.5
+# 対応づけた後，子孫全体を照合し直す部分木の大きさの上限
+MAX_RECOVERY_SIZE = 100
+
+
+class TreeNode():
+    """
+    構文木の1ノード．ANTLRの木を比較しやすい形に写したもの
+    label: 規則ならその番号(0以上)，終端ならトークンの種類を-1-typeにしたもの
+    text: 終端の文字列(規則ならNone)
+    index, end: 行きがけ順の番号と，部分木の終わりの番号(子孫はindex < i < end)
+    """
+    __slots__ = ("label", "text", "start", "parent", "children",
+                 "index", "end", "size", "height", "hash")
+
+    def __init__(self, label, text, start, parent):
+        self.label = label
+        self.text = text
+        self.start = start
+        self.parent = parent
+        self.children = []
+
+    def is_descendant(self, node):
+        return self.index < node.index < self.end
+
+
+def build_tree(tree):
+    """
+    ANTLRの構文木をTreeNodeに写し，行きがけ順のノードのリストを返す(先頭が根)
+    再帰せずにスタックでたどる
+    """
+    nodes = []
+    stack = [(tree, None)]
+    while stack:
+        ctx, parent = stack.pop()
+        if isinstance(ctx, TerminalNode):
+            symbol = ctx.symbol
+            node = TreeNode(-1 - symbol.type, symbol.text, symbol.start, parent)
+        else:
+            start = ctx.start.start if ctx.start is not None else -1
+            node = TreeNode(ctx.getRuleIndex(), None, start, parent)
+            if ctx.children:
+                stack.extend((child, node) for child in reversed(ctx.children))
+        node.index = len(nodes)
+        nodes.append(node)
+        if parent is not None:
+            parent.children.append(node)
+    # 行きがけ順の逆なら，子は必ず親より先に来る
+    for node in reversed(nodes):
+        node.size = 1 + sum(child.size for child in node.children)
+        node.height = 1 + max((child.height for child in node.children), default=0)
+        node.hash = hash((node.label, node.text, tuple(child.hash for child in node.children)))
+        node.end = node.index + node.size
+    return nodes
+
+
+def match_trees(nodes_a, nodes_b):
+    """
+    GumTreeと同じ考え方で2つの木のノードを対応づけ，{aのノード: bのノード}を返す
+    1. 上から下へ，ハッシュが同じ部分木を丸ごと対応づける
+    2. 下から上へ，対応済みの子孫を多く共有するノード同士を対応づける
+    3. 対応済みのノード同士の残った子を，規則やトークンの種類が同じものから対応づける
+    """
+    mapping = {}
+    reverse = {}
+    _match_top_down(nodes_a, nodes_b, mapping, reverse)
+    _match_bottom_up(nodes_a, nodes_b, mapping, reverse)
+    _match_children(nodes_a, mapping, reverse)
+    return mapping
+
+
+def _match_subtree(nodes_a, nodes_b, a, b, mapping, reverse):
+    # 同じハッシュの部分木は形が同じなので，行きがけ順に並べれば1対1に対応する
+    for x, y in zip(nodes_a[a.index:a.end], nodes_b[b.index:b.end]):
+        mapping[x] = y
+        reverse[y] = x
+
+
+def _match_top_down(nodes_a, nodes_b, mapping, reverse):
+    counts_a = Counter(node.hash for node in nodes_a if node.height >= MIN_HEIGHT)
+    index_b = {}
+    for node in nodes_b:
+        if node.height >= MIN_HEIGHT:
+            index_b.setdefault(node.hash, []).append(node)
+    queue = deque([nodes_a[0]])
+    while queue:
+        ambiguous = {}
+        while queue:
+            a = queue.popleft()
+            if a.height < MIN_HEIGHT:
+                continue
+            candidates = index_b.get(a.hash)
+            if not candidates:
+                queue.extend(a.children)
+            elif len(candidates) == 1 and counts_a[a.hash] == 1:
+                if candidates[0] not in reverse:
+                    _match_subtree(nodes_a, nodes_b, a, candidates[0], mapping, reverse)
+                else:
+                    queue.extend(a.children)
+            elif a.height > 1:
+                ambiguous.setdefault(a.hash, []).append(a)
+        # 候補が複数ある部分木は，木全体の中での相対的な位置が近いもの同士を対応づける
+        for hash_value, group in ambiguous.items():
+            candidates = [b for b in index_b[hash_value] if b not in reverse]
+            positions = [b.index / len(nodes_b) for b in candidates]
+            for a in group:
+                if not candidates:
+                    queue.extend(a.children)
+                    continue
+                k = bisect_left(positions, a.index / len(nodes_a))
+                if k == len(candidates) or (k > 0 and a.index / len(nodes_a) - positions[k - 1] <
+                                            positions[k] - a.index / len(nodes_a)):
+                    k -= 1
+                b = candidates.pop(k)
+                positions.pop(k)
+                if b in reverse:
+                    # 別の候補の部分木の一部として対応済みになっていた
+                    queue.append(a)
+                    continue
+                _match_subtree(nodes_a, nodes_b, a, b, mapping, reverse)
+
+
+def _match_bottom_up(nodes_a, nodes_b, mapping, reverse):
+    for a in reversed(nodes_a):
+        if a in mapping:
+            continue
+        if a.parent is None:
+            b = nodes_b[0]
+            if b not in reverse and b.label == a.label:
+                _add_match(a, b, nodes_a, nodes_b, mapping, reverse)
+            continue
+        matched = [d for d in nodes_a[a.index + 1:a.end] if d in mapping]
+        if not matched:
+            continue
+        # 対応済みの子孫の相手の祖先のうち，同じ規則で未対応のものが候補
+        candidates = []
+        seen = set()
+        for d in matched:
+            node = mapping[d].parent
+            while node is not None and node not in seen:
+                seen.add(node)
+                if node.label == a.label and node not in reverse:
+                    candidates.append(node)
+                node = node.parent
+        best = None
+        best_dice = MIN_DICE
+        for b in candidates:
+            common = sum(1 for d in matched if b.is_descendant(mapping[d]))
+            dice = 2 * common / max(a.size + b.size - 2, 1)
+            if dice >= best_dice:
+                best, best_dice = b, dice
+        if best is not None:
+            _add_match(a, best, nodes_a, nodes_b, mapping, reverse)
+
+
+def _add_match(a, b, nodes_a, nodes_b, mapping, reverse):
+    """
+    aとbを対応づけ，小さな部分木ならまだ対応のない子孫を順序を保って対応づける
+    """
+    mapping[a] = b
+    reverse[b] = a
+    if max(a.size, b.size) < MAX_RECOVERY_SIZE:
+        rest_a = [x for x in nodes_a[a.index + 1:a.end] if x not in mapping]
+        rest_b = [y for y in nodes_b[b.index + 1:b.end] if y not in reverse]
+        _match_in_order(rest_a, rest_b, mapping, reverse)
+
+
+def _match_children(nodes_a, mapping, reverse):
+    """
+    対応済みのノード同士の，まだ対応のない子を順序を保って対応づける
+    行きがけ順にたどるので，ここで対応づけた子の子も続けて対応づく
+    """
+    for a in nodes_a:
+        b = mapping.get(a)
+        if b is None:
+            continue
+        rest_a = [x for x in a.children if x not in mapping]
+        if rest_a:
+            _match_in_order(rest_a, [y for y in b.children if y not in reverse], mapping, reverse)
+
+
+def _match_in_order(rest_a, rest_b, mapping, reverse):
+    # 文字列まで同じものを先に，次に種類だけ同じもの(更新)を対応づける
+    for key in [lambda x: (x.label, x.text), lambda x: x.label]:
+        opcodes = get_opcodes([key(x) for x in rest_a], [key(y) for y in rest_b], "myers")
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag != "equal":
+                continue
+            for x, y in zip(rest_a[i1:i2], rest_b[j1:j2]):
+                mapping[x] = y
+                reverse[y] = x
+        rest_a = [x for x in rest_a if x not in mapping]
+        rest_b = [y for y in rest_b if y not in reverse]
+
+
+def edit_script(nodes_a, nodes_b, mapping, describe):
+    """
+    対応づけから編集操作のリストを作る
+    bの行きがけ順に挿入(insert)，更新(update)，移動(move)を，続いてaの行きがけ順に削除(delete)を並べる
+    子孫が全て挿入(削除)される部分木は，根の1操作にまとめる(subtree: True)
+    describe: TreeNodeを表示用の辞書にする関数
+    """
+    reverse = {b: a for a, b in mapping.items()}
+    moved = _reordered_children(nodes_b, mapping, reverse)
+    actions = []
+    inserted = _unmatched_subtrees(nodes_b, reverse)
+    for b in nodes_b:
+        a = reverse.get(b)
+        if a is None:
+            if b.parent is not None and b.parent in inserted:
+                continue
+            actions.append({"action": "insert", "node": describe(b), "subtree": b in inserted,
+                            "parent": describe(b.parent) if b.parent is not None else None,
+                            "position": b.parent.children.index(b) if b.parent is not None else 0})
+            continue
+        if a.text != b.text:
+            actions.append({"action": "update", "node": describe(a), "from": a.text, "to": b.text})
+        if b.parent is not None and (mapping.get(a.parent) is not b.parent or b in moved):
+            actions.append({"action": "move", "node": describe(a), "parent": describe(b.parent),
+                            "position": b.parent.children.index(b)})
+    deleted = _unmatched_subtrees(nodes_a, mapping)
+    for a in nodes_a:
+        if a in mapping or (a.parent is not None and a.parent in deleted):
+            continue
+        actions.append({"action": "delete", "node": describe(a), "subtree": a in deleted})
+    return actions
+
+
+def _unmatched_subtrees(nodes, mapping):
+    """
+    子孫も含めて全く対応のない部分木の根(と，その中のノード)の集合
+    """
+    unmatched = set()
+    for node in reversed(nodes):
+        if node not in mapping and all(child in unmatched for child in node.children):
+            unmatched.add(node)
+    return unmatched
+
+
+def _reordered_children(nodes_b, mapping, reverse):
+    """
+    親が対応したままで，兄弟の中での順番が変わったbのノードの集合
+    (aでの順番の最長増加部分列に入らないものを移動とみなす)
+    """
+    moved = set()
+    for parent in nodes_b:
+        if len(parent.children) < 2 or parent not in reverse:
+            continue
+        a_parent = reverse[parent]
+        stay = [child for child in parent.children
+                if child in reverse and reverse[child].parent is a_parent]
+        if len(stay) < 2:
+            continue
+        order = [reverse[child].index for child in stay]
+        keep = _longest_increasing(order)
+        moved.update(child for i, child in enumerate(stay) if i not in keep)
+    return moved
+
+
+def _longest_increasing(values):
+    """
+    最長増加部分列をなす添字の集合
+    """
+    tails = []
+    tail_indexes = []
+    previous = [-1] * len(values)
+    for index, value in enumerate(values):
+        k = bisect_left(tails, value)
+        if k == len(tails):
+            tails.append(value)
+            tail_indexes.append(index)
+        else:
+            tails[k] = value
+            tail_indexes[k] = index
+        previous[index] = tail_indexes[k - 1] if k > 0 else -1
+    result = set()
+    index = tail_indexes[-1] if tail_indexes else -1
+    while index >= 0:
+        result.add(index)
+        index = previous[index]
+    return result
@@ -0,0 +1,175 @@
+import gzip
+import io
+import json
+import lzma
+import sys
+
+# 出力をまとめて書き出すバッファの大きさ(バイト)
+BUFFER_SIZE = 1 << 20
+COMPRESSIONS = {None: "", "gzip": ".gz", "lzma": ".xz"}
+FORMATS = {"jsonl": ".jsonl", "binary": ".bin"}
+# バイナリ形式の先頭に書くマジックナンバー
+BINARY_MAGIC = b"ATK2"
+# 開始位置と行番号を符号なしで書いていた以前のバイナリ形式(読み込みだけ対応する)
+BINARY_MAGIC_V1 = b"ATK1"
+
+
+class RecordWriter():
+    """
+    1ファイル(または1行)ごとのレコードをJSONLかバイナリ形式で書き出す
+    pathがNoneか"-"なら標準出力に書く
+
+    バイナリ形式は，レコードごとに
+    メタデータ(JSON)の長さとバイト列，トークン数，各トークン(文字列, 種類の番号, 空白数, 開始位置, 行番号)
+    を可変長整数で並べたもの．トークンの種類の名前は初めて現れたときだけ書く
+    空白数・開始位置・行番号は負のこともある(PythonのNEWLINE, INDENTの開始位置は-1)ので，zigzag符号化する
+    行番号は，ないときを0で表すため1を足して書く
+    """
+    def __init__(self, path=None, format="jsonl", compression=None, buffer_size=BUFFER_SIZE):
+        if format not in FORMATS:
+            raise ValueError("Unknown format: %s" % format)
+        if compression not in COMPRESSIONS:
+            raise ValueError("Unknown compression: %s" % compression)
+        self.format = format
+        self.path = path
+        if path is None or path == "-":
+            self._raw = sys.stdout.buffer
+            self._close_raw = False
+        else:
+            self._raw = open(path, "wb", buffering=buffer_size)
+            self._close_raw = True
+        if compression == "gzip":
+            self._out = io.BufferedWriter(gzip.GzipFile(fileobj=self._raw, mode="wb"), buffer_size)
+        elif compression == "lzma":
+            self._out = io.BufferedWriter(lzma.LZMAFile(self._raw, mode="wb"), buffer_size)
+        else:
+            self._out = self._raw
+        self._names = {}
+        if self.format == "binary":
+            self._out.write(BINARY_MAGIC)
+
+    def write(self, record: dict):
+        """
+        record: {"tokens": [トークンのタプル], ...その他のメタデータ}
+        """
+        if self.format == "jsonl":
+            self._out.write(json.dumps(record, ensure_ascii=False).encode("utf-8"))
+            self._out.write(b"\n")
+            return
+        tokens = record.get("tokens") or []
+        meta = json.dumps({k: v for k, v in record.items() if k != "tokens"},
+                          ensure_ascii=False).encode("utf-8")
+        chunks = [encode_varint(len(meta)), meta, encode_varint(len(tokens))]
+        for token in tokens:
+            text = token[0].encode("utf-8", "surrogatepass")
+            name = token[1]
+            name_id = self._names.get(name)
+            if name_id is None:
+                # 新しい種類は番号のあとに名前を書く
+                name_id = self._names[name] = len(self._names)
+                encoded_name = name.encode("utf-8")
+                chunks.extend([encode_varint(name_id), encode_varint(len(encoded_name)), encoded_name])
+            else:
+                chunks.append(encode_varint(name_id))
+            chunks.extend([encode_varint(len(text)), text,
+                           encode_varint(zigzag(token[2])), encode_varint(zigzag(token[3])),
+                           encode_varint(zigzag(token[4]) + 1 if len(token) > 4 else 0)])
+        self._out.write(b"".join(chunks))
+
+    def close(self):
+        if self._out is not self._raw:
+            # 圧縮ストリームを閉じて末尾を書き出す(下のファイルは閉じない)
+            self._out.close()
+        if self._close_raw:
+            self._raw.close()
+        else:
+            self._raw.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def open_records(path):
+    """
+    RecordWriterで書いたファイルを開く．拡張子から圧縮形式を判断する
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".xz"):
+        return lzma.open(path, "rb")
+    return open(path, "rb")
+
+
+def read_records(path):
+    """
+    RecordWriterで書いたJSONLまたはバイナリのファイルからレコードを順に返す
+    """
+    with open_records(path) as f:
+        magic = f.read(len(BINARY_MAGIC))
+        if magic not in (BINARY_MAGIC, BINARY_MAGIC_V1):
+            f.seek(0)
+            for line in f:
+                yield json.loads(line)
+            return
+        names = []
+        while True:
+            meta_length = decode_varint(f, eof_ok=True)
+            if meta_length is None:
+                return
+            record = json.loads(f.read(meta_length))
+            tokens = []
+            for _ in range(decode_varint(f)):
+                name_id = decode_varint(f)
+                if name_id == len(names):
+                    names.append(f.read(decode_varint(f)).decode("utf-8"))
+                text = f.read(decode_varint(f)).decode("utf-8", "surrogatepass")
+                space = unzigzag(decode_varint(f))
+                start = decode_varint(f)
+                line = decode_varint(f)
+                if magic == BINARY_MAGIC:
+                    start = unzigzag(start)
+                    line = unzigzag(line - 1) if line else None
+                elif not line:
+                    line = None
+                if line is None:
+                    tokens.append([text, names[name_id], space, start])
+                else:
+                    tokens.append([text, names[name_id], space, start, line])
+            record["tokens"] = tokens
+            yield record
+
+
+def zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def encode_varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def decode_varint(f, eof_ok=False):
+    result = 0
+    shift = 0
+    while True:
+        byte = f.read(1)
+        if not byte:
+            if eof_ok and shift == 0:
+                return None
+            raise EOFError("truncated varint")
+        byte = byte[0]
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result
+        shift += 7
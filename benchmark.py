@@ -0,0 +1,904 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from antlr4 import ParserRuleContext, InputStream, Token
+from antlr4.Token import CommonToken
+from antlr_util.tokenizer import Tokenizer, LANGUAGE_EXTENSIONS
+from antlr_util.diff import get_opcodes, DIFF_ENGINES
+from antlr_util.corpus import generate, generate_nested, generate_template, generate_macro_header, mutate
+from antlr_util.parallel import find_files
+from antlr_util.profiling import profile, format_report, SORT_KEYS
+from antlr_util.stats import PhaseStats
+from antlr_util.grammers.Python.Python3Lexer import Python3Lexer
+from antlr_util.grammers.PHP.PhpLexer import PhpLexer
+
+# 言語ごとの計測用コード片
+SAMPLES = {
+    "Python": "for i in range(len(my_array)):\n    element = my_array[i]\n    total += element * 2\n",
+    "Java": "class A { int f(int x) { return x * 2 + 1; } }",
+    "JavaScript": "function f(a, b) { return a + b * 2; }",
+    "CPP": "int f(int x) { return x * 2 + 1; }",
+    "PHP": "<?php function f($a) { return $a * 2; } ?>",
+}
+
+
+def measure(func, code, repeat):
+    """
+    funcをrepeat回呼び出し，1回あたりの秒数を返す
+    """
+    func(code)  # DFAを温める
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(code)
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_tokens(language, repeat):
+    code = SAMPLES[language]
+    parser_tk = Tokenizer(language)
+    lexer_tk = Tokenizer(language, lexer_only=True)
+    parse_time = measure(parser_tk.getTokens, code, repeat)
+    lex_time = measure(lexer_tk.getTokens, code, repeat)
+    print(f"{language:<10} getTokens parser: {parse_time * 1000:8.3f}ms  "
+          f"lexer_only: {lex_time * 1000:8.3f}ms  x{parse_time / lex_time:.1f}")
+
+
+def bench_tree(language, repeat):
+    code = SAMPLES[language]
+    ll_tk = Tokenizer(language)
+    two_stage_tk = Tokenizer(language, two_stage=True)
+    ll_time = measure(ll_tk.getTree, code, repeat)
+    two_stage_time = measure(two_stage_tk.getTree, code, repeat)
+    print(f"{language:<10} getTree   LL:     {ll_time * 1000:8.3f}ms  "
+          f"two_stage:  {two_stage_time * 1000:8.3f}ms  x{ll_time / two_stage_time:.1f}  "
+          f"{dict(Tokenizer.PARSE_STATS[language])}")
+
+
+def make_deep_tree(depth):
+    """
+    depth段の規則ノードの下に終端ノードが1つだけある木を作る
+    """
+    root = node = ParserRuleContext()
+    for _ in range(depth):
+        child = ParserRuleContext(node)
+        node.addChild(child)
+        node = child
+    token = CommonToken(type=1)
+    token.text = "x"
+    token.start = 0
+    node.addTokenNode(token)
+    return root
+
+
+def bench_walk(language, repeat):
+    """
+    構文木からトークンを取り出す処理だけの，トークンあたりの時間を測る
+    """
+    tk = Tokenizer(language)
+    tree = tk.getTree(SAMPLES[language] * 1)
+    make_tokens = tk.makeTokensPython if language == "Python" else tk.makeTokens
+    count = len(make_tokens(tree, []))
+    walk_time = measure(lambda _: make_tokens(tree, []), None, repeat)
+    print(f"{language:<10} makeTokens {walk_time / max(count, 1) * 1e6:8.3f}us/token")
+
+
+def bench_deep_walk(depth=10000):
+    tk = Tokenizer("Java")
+    tree = make_deep_tree(depth)
+    start = time.perf_counter()
+    tokens = tk.makeTokens(tree, [])
+    print(f"deep tree  makeTokens depth={depth}: {(time.perf_counter() - start) * 1000:8.3f}ms  {tokens}")
+
+
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+from antlr_util.tokenizer import Tokenizer, LANGUAGE_EXTENSIONS
+from antlr_util.diff import get_opcodes, DIFF_ENGINES
+tk = Tokenizer(sys.argv[1], lexer_only=sys.argv[2] == "1")
+constructed = time.perf_counter()
+tk.getTokens(sys.argv[3])
+print(constructed - start, time.perf_counter() - constructed)
+"""
+
+
+def bench_startup(language):
+    """
+    新しいプロセスでTokenizerの生成と最初のトークン化にかかる時間を測る
+    """
+    for lexer_only in ["0", "1"]:
+        out = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, language, lexer_only, SAMPLES[language]],
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+        construct_time, first_time = [float(x) for x in out.split()]
+        print(f"{language:<10} startup   lexer_only={lexer_only}: construct {construct_time * 1000:8.3f}ms  "
+              f"first token {first_time * 1000:8.3f}ms")
+
+
+def git(repository, *args):
+    return subprocess.run(["git", "-C", repository] + list(args), stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+
+
+def commit_pairs(language, repository=".", limit=10):
+    """
+    gitの履歴から，対象言語のファイルの(変更前, 変更後)のコードの組を集める
+    """
+    pairs = []
+    for line in git(repository, "log", "--format=commit %H", "--name-only", "--diff-filter=M").splitlines():
+        if line.startswith("commit "):
+            commit = line.split()[1]
+            continue
+        if os.path.splitext(line)[1].lower() not in LANGUAGE_EXTENSIONS[language]:
+            continue
+        pairs.append((git(repository, "show", f"{commit}^:{line}"), git(repository, "show", f"{commit}:{line}")))
+        if len(pairs) >= limit:
+            break
+    return pairs
+
+
+def bench_diff(language, repository="."):
+    """
+    実際のコミットの変更前後のトークン列で，差分のアルゴリズムごとの時間と一致トークン数を比べる
+    """
+    pairs = commit_pairs(language, repository)
+    if not pairs:
+        return
+    tk = Tokenizer(language, lexer_only=True, whole_file=True)
+    token_pairs = [(tk.getPureTokens(a), tk.getPureTokens(b)) for a, b in pairs]
+    total = sum(len(a) + len(b) for a, b in token_pairs)
+    for engine in DIFF_ENGINES:
+        start = time.perf_counter()
+        equal = 0
+        for a, b in token_pairs:
+            equal += sum(i2 - i1 for tag, i1, i2, _, _ in get_opcodes(a, b, engine) if tag == "equal")
+        print(f"{language:<10} diff {engine:<9} {len(pairs)} pairs / {total} tokens: "
+              f"{(time.perf_counter() - start) * 1000:8.3f}ms  equal tokens {equal}")
+
+
+# ベンチマークスイートで計測する行数
+SUITE_SIZES = [1, 10, 100, 1000, 10000, 50000]
+# 1回の呼び出しがこの秒数を超えた処理は，それより大きい行数を飛ばす
+SUITE_BUDGET = 60.0
+# 1つの計測で呼び出しを繰り返す合計時間の目安(秒)
+SUITE_MIN_TIME = 0.5
+# Tokenizerの生成オプション．ファイル全体を解析するのでwhole_fileはいつもTrue
+SUITE_MODES = {
+    "parser": {},
+    "lexer_only": {"lexer_only": True},
+    "two_stage": {"two_stage": True},
+}
+# 計測する処理 {名前: (2ファイルの組を処理するか, 構文木を使うか)}
+SUITE_PATHS = {
+    "getTokens": (False, False),
+    "getTree": (False, True),
+    "makeTokens": (False, True),
+    "make_change_set": (True, False),
+    "make_change_set_line": (True, False),
+    "get_abstract_tree_diff": (True, False),
+    "make_tree_diff": (True, True),
+}
+
+
+def suite_call(tk, path, source, target):
+    """
+    pathの処理を1回呼び出す関数を返す．makeTokensは構文木を作るところを計測に含めない
+    """
+    if path == "makeTokens":
+        tree = tk.getTree(source)
+        make_tokens = tk.makeTokensPython if tk.LANGUAGE == "Python" else tk.makeTokens
+        return lambda: make_tokens(tree, [])
+    if SUITE_PATHS[path][0]:
+        return lambda: getattr(tk, path)(source, target)
+    return lambda: getattr(tk, path)(source)
+
+
+def suite_measure(func, min_time=SUITE_MIN_TIME):
+    """
+    合計min_time秒を超えるまで(少なくとも1回)funcを呼び出し，(1回あたりの秒数, 回数)を返す
+    """
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / calls, calls
+
+
+def run_suite(languages, sizes, paths, modes, budget=SUITE_BUDGET, min_time=SUITE_MIN_TIME, log=print):
+    """
+    言語・行数・処理・Tokenizerの生成オプションの組み合わせごとに速さを測り，結果の辞書のリストを返す
+    コードはcorpus.generateで作るので，同じ引数なら同じ入力になる
+    """
+    results = []
+    for language in languages:
+        for mode in modes:
+            tk = Tokenizer(language, whole_file=True, **SUITE_MODES[mode])
+            # 最初の数回はDFAを作る時間が大きいので，小さな入力で温めておく
+            try:
+                tk.getTokens(generate(language, 20))
+            except Exception:
+                pass
+            over_budget = set()
+            for lines in sizes:
+                source = generate(language, lines)
+                target = mutate(source)
+                try:
+                    token_count = len(tk.getTokens(source))
+                except Exception:
+                    token_count = None
+                for path in paths:
+                    pair, needs_tree = SUITE_PATHS[path]
+                    if needs_tree and tk.LEXER_ONLY:
+                        continue
+                    result = {"language": language, "path": path, "mode": mode, "lines": lines,
+                              "bytes": len(source.encode("utf-8")), "tokens": token_count}
+                    if path in over_budget:
+                        result["skipped"] = True
+                        results.append(result)
+                        continue
+                    try:
+                        seconds, calls = suite_measure(suite_call(tk, path, source, target), min_time)
+                    except Exception as e:
+                        result["error"] = repr(e)
+                        results.append(result)
+                        log(f"{language:<10} {mode:<10} {path:<22} {lines:>6} lines: failed {e!r}")
+                        continue
+                    files = 2 if pair else 1
+                    result.update({"seconds": seconds, "calls": calls, "files_per_sec": files / seconds,
+                                   "tokens_per_sec": files * token_count / seconds if token_count else None})
+                    results.append(result)
+                    if seconds > budget:
+                        over_budget.add(path)
+                    log(f"{language:<10} {mode:<10} {path:<22} {lines:>6} lines: {seconds * 1000:10.3f}ms  "
+                        f"{result['files_per_sec']:10.2f} files/s  "
+                        f"{result['tokens_per_sec'] or 0:12.1f} tokens/s")
+    return results
+
+
+def suite_environment():
+    """
+    結果を比べるときに必要な実行環境の情報
+    """
+    try:
+        from importlib.metadata import version
+        antlr_version = version("antlr4-python3-runtime")
+    except Exception:
+        antlr_version = None
+    commit = subprocess.run(["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            universal_newlines=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    return {"python": platform.python_version(), "implementation": platform.python_implementation(),
+            "machine": platform.machine(), "antlr4": antlr_version, "commit": commit or None,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def compare_suite(old, new, log=print):
+    """
+    2回分の結果を同じ(言語, 処理, オプション, 行数)ごとに比べ，速くなった倍率を表示する
+    """
+    def key(result):
+        return result["language"], result["path"], result["mode"], result["lines"]
+    old_results = {key(x): x for x in old["results"] if "seconds" in x}
+    for result in new["results"]:
+        previous = old_results.get(key(result))
+        if previous is None or "seconds" not in result:
+            continue
+        log("%-10s %-22s %-10s %6d lines: %10.3fms -> %10.3fms  x%.2f" % (
+            key(result) + (previous["seconds"] * 1000, result["seconds"] * 1000,
+                           previous["seconds"] / result["seconds"])))
+
+
+def suite_main(argv):
+    arg_parser = argparse.ArgumentParser(prog="benchmark.py suite",
+                                         description="合成コードで全ての言語と処理の速さを測り，JSONに書き出す")
+    arg_parser.add_argument("--languages", nargs="+", default=list(SAMPLES), choices=list(SAMPLES))
+    arg_parser.add_argument("--sizes", nargs="+", type=int, default=SUITE_SIZES)
+    arg_parser.add_argument("--paths", nargs="+", default=list(SUITE_PATHS), choices=list(SUITE_PATHS))
+    arg_parser.add_argument("--modes", nargs="+", default=list(SUITE_MODES), choices=list(SUITE_MODES))
+    arg_parser.add_argument("--budget", type=float, default=SUITE_BUDGET,
+                            help="1回の呼び出しがこの秒数を超えたら，それより大きい行数を飛ばす")
+    arg_parser.add_argument("--min-time", type=float, default=SUITE_MIN_TIME,
+                            help="1つの計測で呼び出しを繰り返す合計時間の目安(秒)")
+    arg_parser.add_argument("--output", default="benchmark_results.json")
+    arg_parser.add_argument("--compare", default=None, help="比べる以前の結果のJSON")
+    args = arg_parser.parse_args(argv)
+
+    results = run_suite(args.languages, sorted(args.sizes), args.paths, args.modes, args.budget, args.min_time)
+    report = {"environment": suite_environment(), "sizes": sorted(args.sizes), "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare_suite(json.load(f), report)
+
+
+def profile_main(argv):
+    arg_parser = argparse.ArgumentParser(prog="benchmark.py profile",
+                                         description="決定ごとの予測の時間・先読み・LLへの切り替え・曖昧さを表示する")
+    arg_parser.add_argument("languages", nargs="+", choices=list(SAMPLES))
+    arg_parser.add_argument("--paths", nargs="+", default=None,
+                            help="解析するファイル・ディレクトリ・glob．省略時は合成コードを使う")
+    arg_parser.add_argument("--lines", type=int, default=1000, help="合成コードの行数")
+    arg_parser.add_argument("--files", type=int, default=5, help="合成コードのファイル数")
+    arg_parser.add_argument("--sort", default="time", choices=SORT_KEYS)
+    arg_parser.add_argument("--top", type=int, default=20)
+    arg_parser.add_argument("--fresh-dfa", action="store_true",
+                            help="育ったDFAを使わず，空のDFAから解析したときの統計を取る")
+    arg_parser.add_argument("--two-stage", action="store_true")
+    arg_parser.add_argument("--by-line", action="store_true",
+                            help="main.pyの既定と同じく1行ずつ解析する(改行を既定チャネルに持つ文法向け)")
+    arg_parser.add_argument("--output", default=None, help="全ての決定の統計を書き出すJSON")
+    args = arg_parser.parse_args(argv)
+
+    reports = []
+    for language in args.languages:
+        tk = Tokenizer(language, whole_file=not args.by_line, two_stage=args.two_stage)
+        if args.paths:
+            paths = [path for target in args.paths for path in find_files(target, language)]
+            codes = (open(path, "r", encoding="utf-8", errors="replace").read() for path in paths)
+        else:
+            codes = (generate(language, args.lines, seed) for seed in range(args.files))
+        if args.by_line:
+            codes = (line for code in codes for line in code.splitlines() if line.strip())
+        report = profile(tk, codes, args.fresh_dfa)
+        reports.append(report)
+        print(format_report(report, args.top, args.sort))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=1)
+
+
+# indentで測る入れ子の深さ
+INDENT_DEPTHS = [1, 10, 50, 100]
+
+
+def load_lexer(path):
+    """
+    path(別の版のPython3Lexer.py)を今の字句解析器と同じパッケージのモジュールとして読み込み，そのクラスを返す
+    sys.modulesには登録しないので，今の字句解析器は置き換わらない
+    """
+    spec = importlib.util.spec_from_file_location(Python3Lexer.__module__, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.Python3Lexer
+
+
+def lex_all(lexer_class, code):
+    """
+    EOFまで字句解析したトークンの(種類, 開始, 終了, 行, 列, チャネル, 文字列)のリスト
+    """
+    lexer = lexer_class(InputStream(code))
+    lexer.removeErrorListeners()
+    tokens = []
+    while True:
+        token = lexer.nextToken()
+        tokens.append((token.type, token.start, token.stop, token.line, token.column, token.channel,
+                       token.text))
+        if token.type == Token.EOF:
+            return tokens
+
+
+def indent_codes(depths, blocks, files):
+    """
+    比べるPythonのコード {名前: コード}．入れ子のコード(スペースとタブ，末尾の改行の有無)と合成コード
+    """
+    codes = {}
+    for depth in depths:
+        for name, indent in [("spaces", "    "), ("tabs", "\t"), ("mixed", " \t")]:
+            code = generate_nested(depth, blocks, indent=indent)
+            codes["nested/%s/%d" % (name, depth)] = code
+            codes["nested/%s/%d/noeol" % (name, depth)] = code.rstrip("\n")
+    for seed in range(files):
+        codes["corpus/%d" % seed] = generate("Python", 200, seed)
+    codes["empty"] = ""
+    codes["spaces_only"] = "   "
+    return codes
+
+
+def indent_main(argv):
+    arg_parser = argparse.ArgumentParser(prog="benchmark.py indent",
+                                         description="Pythonの字句解析器のINDENT/DEDENTの処理を，"
+                                                     "深く入れ子にしたコードで測る")
+    arg_parser.add_argument("--depths", nargs="+", type=int, default=INDENT_DEPTHS)
+    arg_parser.add_argument("--blocks", type=int, default=5, help="1つのコードに並べる入れ子のブロックの数")
+    arg_parser.add_argument("--files", type=int, default=5, help="比べる合成コードのファイル数")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--reference", default=None,
+                            help="比べる別の版のPython3Lexer.py(例: git showで取り出した変更前のもの)．"
+                                 "全てのコードでトークン列が同じかを確かめ，速さの倍率を表示する")
+    args = arg_parser.parse_args(argv)
+
+    lexers = [("current", Python3Lexer)]
+    if args.reference is not None:
+        lexers.append(("reference", load_lexer(args.reference)))
+    codes = indent_codes(args.depths, args.blocks, args.files)
+    mismatches = 0
+    for name, code in codes.items():
+        results = {}
+        for label, lexer_class in lexers:
+            results[label] = lex_all(lexer_class, code)
+        if args.reference is not None and results["current"] != results["reference"]:
+            mismatches += 1
+            first = next((i for i, (x, y) in enumerate(zip(results["current"], results["reference"])) if x != y),
+                         min(len(results["current"]), len(results["reference"])))
+            print("mismatch %s at token %d: %r != %r" % (
+                name, first, results["current"][first:first + 1], results["reference"][first:first + 1]))
+    if args.reference is not None:
+        print("%d codes compared, %d mismatches" % (len(codes), mismatches))
+
+    print("%-22s %8s %10s %12s" % ("code", "tokens", "time(ms)", "tokens/s") +
+          ("  %10s %7s" % ("ref(ms)", "speedup") if args.reference is not None else ""))
+    for depth in args.depths:
+        code = codes["nested/spaces/%d" % depth]
+        times = {}
+        for label, lexer_class in lexers:
+            count = len(lex_all(lexer_class, code))
+            times[label] = min(timed(lex_all, lexer_class, code) for _ in range(args.repeat))
+        line = "%-22s %8d %10.3f %12.0f" % ("nested/spaces/%d" % depth, count, times["current"] * 1000,
+                                            count / times["current"])
+        if args.reference is not None:
+            line += "  %10.3f %6.2fx" % (times["reference"] * 1000, times["reference"] / times["current"])
+        print(line)
+    if mismatches:
+        sys.exit(1)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+# threadsで測るスレッド数
+THREAD_COUNTS = [1, 2, 4, 8]
+
+
+def gil_enabled():
+    # free-threadedのビルド(3.13t)でなければいつもTrue
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+
+def clear_dfa(recognizer_class):
+    """
+    クラスで共有しているDFAを空に戻す．シミュレータは同じリストを参照しているので，中身を入れ替える
+    ロックを取るDFA(threadsafe.SynchronizedDFA)に差し替え済みのものは同じクラスで作り直す
+    """
+    dfas = recognizer_class.decisionsToDFA
+    for i, dfa in enumerate(dfas):
+        dfas[i] = type(dfa)(dfa.atnStartState, dfa.decision)
+    cache = getattr(recognizer_class, "sharedContextCache", None)
+    if cache is not None:
+        cache.cache.clear()
+
+
+def tokenize_or_error(tk, code):
+    try:
+        return tk.getTokens(code)
+    except Exception as e:
+        return repr(e)
+
+
+def run_threads(tk, codes, threads):
+    """
+    codesをthreads個のスレッドから同じTokenizerでトークン化する
+    :return: (秒数, 入力の順の結果)
+    """
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        start = time.perf_counter()
+        results = list(executor.map(lambda code: tokenize_or_error(tk, code), codes))
+        return time.perf_counter() - start, results
+
+
+def threads_main(argv):
+    arg_parser = argparse.ArgumentParser(prog="benchmark.py threads",
+                                         description="1つのTokenizerを複数のスレッドから使ったときの速さと，"
+                                                     "結果が1スレッドのときと同じかを確かめる")
+    arg_parser.add_argument("--languages", nargs="+", default=list(SAMPLES), choices=list(SAMPLES))
+    arg_parser.add_argument("--threads", nargs="+", type=int, default=THREAD_COUNTS)
+    arg_parser.add_argument("--files", type=int, default=16)
+    arg_parser.add_argument("--lines", type=int, default=50, help="合成コード1ファイルの行数")
+    arg_parser.add_argument("--cold", action="store_true",
+                            help="スレッド数ごとにDFAを空に戻す(DFAへの書き込みが同時に起きる場合を試す)")
+    args = arg_parser.parse_args(argv)
+
+    print("python %s, GIL %s" % (platform.python_version(), "enabled" if gil_enabled() else "disabled"))
+    print("%-10s %7s %9s %9s %8s %10s" % ("language", "threads", "time(s)", "files/s", "speedup", "mismatches"))
+    failed = False
+    for language in args.languages:
+        tk = Tokenizer(language, whole_file=True)
+        codes = [generate(language, args.lines, seed) for seed in range(args.files)]
+        # 1スレッドで作った正解(DFAも温まる)
+        expected = [tokenize_or_error(tk, code) for code in codes]
+        base = None
+        for threads in args.threads:
+            if args.cold:
+                clear_dfa(tk.Lexer)
+                clear_dfa(tk.Parser)
+            elapsed, results = run_threads(tk, codes, threads)
+            mismatches = sum(result != answer for result, answer in zip(results, expected))
+            failed = failed or mismatches > 0
+            base = base or elapsed
+            print("%-10s %7d %9.3f %9.1f %7.2fx %10d" % (
+                language, threads, elapsed, len(codes) / elapsed, base / elapsed, mismatches))
+    if failed:
+        sys.exit(1)
+
+
+# htmlで測るテンプレートの行数
+HTML_SIZES = [100, 1000, 5000]
+# PhpLexerでPHPのブロックの中で作られるトークン(開始タグとPHPEnd以降の種類)
+PHP_START_TYPES = {PhpLexer.PHPStart, PhpLexer.PHPStartInside, PhpLexer.PHPStartInsideQuoteString,
+                   PhpLexer.PHPStartDoubleQuoteString, PhpLexer.PHPStartInsideScript}
+
+
+def php_tokens(tokens):
+    """
+    lex_allのトークンのうち，PHPのブロックの中のもの
+    """
+    return [token for token in tokens if token[0] >= PhpLexer.PHPEnd or token[0] in PHP_START_TYPES]
+
+
+def skip_html_lexer(input):
+    lexer = PhpLexer(input)
+    lexer.SkipHtml = True
+    return lexer
+
+
+def html_main(argv):
+    arg_parser = argparse.ArgumentParser(prog="benchmark.py html",
+                                         description="HTMLが大部分のPHPのテンプレートで，HTMLを読み飛ばす字句解析の"
+                                                     "速さと，PHPのブロックのトークンが変わらないかを確かめる")
+    arg_parser.add_argument("--sizes", nargs="+", type=int, default=HTML_SIZES, help="テンプレートの行数")
+    arg_parser.add_argument("--php-rate", type=float, default=0.2, help="PHPを含む行の割合")
+    arg_parser.add_argument("--files", type=int, default=3, help="大きさごとのテンプレートの数")
+    arg_parser.add_argument("--paths", nargs="+", default=None, help="合成コードの代わりに使うPHPのファイル・ディレクトリ")
+    args = arg_parser.parse_args(argv)
+
+    if args.paths:
+        paths = [path for target in args.paths for path in find_files(target, "PHP")]
+        codes = {path: open(path, "r", encoding="utf-8", errors="replace").read() for path in paths}
+    else:
+        codes = {"template/%d/%d" % (size, seed): generate_template(size, args.php_rate, seed)
+                 for size in args.sizes for seed in range(args.files)}
+    print("%-24s %8s %8s %10s %10s %8s %10s" % (
+        "code", "tokens", "coarse", "full(ms)", "skip(ms)", "speedup", "php_same"))
+    mismatches = 0
+    for name, code in codes.items():
+        full, full_time = lex_all(PhpLexer, code), min(timed(lex_all, PhpLexer, code) for _ in range(3))
+        skip, skip_time = lex_all(skip_html_lexer, code), min(timed(lex_all, skip_html_lexer, code) for _ in range(3))
+        same = php_tokens(full) == php_tokens(skip)
+        mismatches += not same
+        print("%-24s %8d %8d %10.3f %10.3f %7.2fx %10s" % (
+            name[-24:], len(full), len(skip), full_time * 1000, skip_time * 1000, full_time / skip_time, same))
+    if mismatches:
+        sys.exit(1)
+
+
+# preprocessで測るヘッダの行数
+MACRO_SIZES = [100, 1000]
+# preprocessで比べるTokenizerのオプション
+PREPROCESS_MODES = {"none": {}, "preprocess": {"preprocess": True}, "skip_if0": {"skip_if0": True}}
+
+
+def preprocess_main(argv):
+    arg_parser = argparse.ArgumentParser(prog="benchmark.py preprocess",
+                                         description="前処理の行とコメントの多いC++のヘッダで，前処理の行を"
+                                                     "取り除いてから解析する速さと構文エラーの数を比べる")
+    arg_parser.add_argument("--sizes", nargs="+", type=int, default=MACRO_SIZES, help="ヘッダの行数")
+    arg_parser.add_argument("--files", type=int, default=2, help="大きさごとのヘッダの数")
+    arg_parser.add_argument("--paths", nargs="+", default=None, help="合成コードの代わりに使うC++のファイル・ディレクトリ")
+    args = arg_parser.parse_args(argv)
+
+    if args.paths:
+        paths = [path for target in args.paths for path in find_files(target, "CPP")]
+        codes = {path: open(path, "r", encoding="utf-8", errors="replace").read() for path in paths}
+    else:
+        codes = {"header/%d/%d" % (size, seed): generate_macro_header(size, seed)
+                 for size in args.sizes for seed in range(args.files)}
+    tokenizers = {mode: Tokenizer("CPP", whole_file=True, **options) for mode, options in PREPROCESS_MODES.items()}
+    print("%-24s %-10s %8s %8s %10s %8s %8s" % ("code", "mode", "tokens", "errors", "parse(ms)", "speedup", "same"))
+    mismatches = 0
+    for name, code in codes.items():
+        base_time = None
+        base_tokens = None
+        for mode, tokenizer in tokenizers.items():
+            tree = tokenizer.getTree(code)
+            elapsed = min(timed(tokenizer.getTree, code) for _ in range(3))
+            tokens = tokenizer.getTokens(code)
+            if base_tokens is None:
+                base_time, base_tokens = elapsed, tokens
+            if mode == "preprocess":
+                # 前処理の行とコメントを取り除くだけなら，元のコードを解析したときと同じトークン列になる
+                same = tokens == base_tokens
+            else:
+                # 位置が元のコードを指しているか
+                same = all(code[token[3]:token[3] + len(token[0])] == token[0]
+                           for token in tokens if token[0] != "<EOF>")
+            mismatches += not same
+            print("%-24s %-10s %8d %8d %10.3f %7.2fx %8s" % (
+                name[-24:], mode, len(tokens), tree.syntax_errors, elapsed * 1000, base_time / elapsed, same))
+    if mismatches:
+        sys.exit(1)
+
+
+# snapshotで確かめる合成コードの行数
+SNAPSHOT_SIZES = [1, 20, 200]
+
+
+def snapshot_outputs(tk, codes):
+    """
+    codesそれぞれの(トークン列, 構文木の文字列)．途中で切ったコードはエラー回復の経路(DFAのERROR)を通る
+    """
+    outputs = []
+    for code in codes:
+        try:
+            tree = tk.getTree(code)
+            outputs.append((tk.makeTokens(tree, []) if tk.LANGUAGE != "Python" else tk.makeTokensPython(tree, []),
+                            tree.toStringTree(recog=tk._recognizers.parser)))
+        except Exception as e:
+            outputs.append(repr(e))
+    return outputs
+
+
+def snapshot_main(argv):
+    arg_parser = argparse.ArgumentParser(prog="benchmark.py snapshot",
+                                         description="空のDFAから解析した結果と，保存したDFAを読み込んでから"
+                                                     "解析した結果が同じかを言語ごとに確かめる")
+    arg_parser.add_argument("--languages", nargs="+", default=list(LANGUAGE_EXTENSIONS), help="確かめる言語")
+    arg_parser.add_argument("--sizes", nargs="+", type=int, default=SNAPSHOT_SIZES, help="合成コードの行数")
+    arg_parser.add_argument("--files", type=int, default=3, help="行数ごとのコードの数")
+    arg_parser.add_argument("--path", default="out/snapshot_check.pkl", help="DFAを保存するファイル")
+    args = arg_parser.parse_args(argv)
+
+    os.makedirs(os.path.dirname(args.path) or ".", exist_ok=True)
+    mismatches = 0
+    print("%-10s %6s %8s %10s %8s" % ("language", "files", "loaded", "restored", "same"))
+    for language in args.languages:
+        codes = []
+        for size in args.sizes:
+            for seed in range(args.files):
+                code = generate(language, size, seed)
+                codes.extend([code, code[:len(code) // 2]])
+        tk = Tokenizer(language, whole_file=True)
+        clear_dfa(tk.Lexer)
+        clear_dfa(tk.Parser)
+        cold = snapshot_outputs(tk, codes)
+        tk.saveDFA(args.path)
+        clear_dfa(tk.Lexer)
+        clear_dfa(tk.Parser)
+        loaded = tk.loadDFA(args.path)
+        restored = snapshot_outputs(tk, codes)
+        same = sum(a == b for a, b in zip(cold, restored))
+        mismatches += len(codes) - same
+        print("%-10s %6d %8s %10d %8s" % (language, len(codes), loaded, same, same == len(codes)))
+    if mismatches:
+        sys.exit(1)
+
+
+# lexerで確かめる，複数行にまたがる構文のコード片(構文木では行が親の規則の先頭の行になる)
+LEXER_SAMPLES = {
+    "Python": [
+        "if a:\n    b\nelse:\n    c\n",
+        "if a:\n    b\n\nelif c:\n    d\nelse:\n    e\n",
+        "try:\n    a\nexcept E as e:\n    b\nelse:\n    c\nfinally:\n    d\n",
+        "x = f(a,\n      *b,\n      **c)\ny = (a\n     + b\n     - c)\n",
+        "s = ('a'\n     'b')\nt = [x\n     for x in y\n     if x\n     in z]\n",
+        "@dec.name\ndef f(a,\n      *args, b=1,\n      **kwargs) -> int:\n    return a\n",
+        "from a.b import (c,\n                 d)\nimport e.f as g\n",
+        "x = {\n    'a': 1,\n    **b,\n}[\n    :2]\ny = obj\\\n    .method()\n",
+    ],
+    "JavaScript": ["var a = 1", "a = f(1)", "if (a) b()", "function f() { return 1 }",
+                   "var f = function () { return 1; }", "class A { }", "x = {a: 1}",
+                   "label: for (;;) { }", "a: { b }"],
+}
+# lexerで1文の開始規則(single_input, sourceElement)に渡す，複数の文を含むコード(最初の文の後は読まない)
+LEXER_STATEMENT_SAMPLES = {
+    "Python": ["x = 1\ny = 2\n", "x = 1; y = 2\nz = 3\n", "f(a,\n  b)\ng()\n", "    x = 1\ny = 2\n"],
+    "JavaScript": ["function f() {}\nf()", "function f() {} f()", "a(); b()", "label: for (;;) {}\nx()",
+                   "a: { b } c()", "if (a) b(); else c(); d()", "try {} catch (e) {} finally {} x()",
+                   "do x(); while (a); y()", "x = {a: 1}; y"],
+}
+
+
+def lexer_codes(language, sizes, files):
+    codes = [generate(language, size, seed) for size in sizes for seed in range(files)]
+    codes += LEXER_SAMPLES.get(language, [])
+    lines = sorted({line for code in codes for line in code.splitlines() if line.strip()})
+    return codes, lines + LEXER_STATEMENT_SAMPLES.get(language, [])
+
+
+def lexer_mismatches(language, codes, whole_file):
+    """
+    :return: (構文エラーのないコードの数, そのうちlexer_onlyのトークン列が違う数, 構文エラーのあるコードで違う数)
+    """
+    parser_tk = Tokenizer(language, whole_file=whole_file)
+    lexer_tk = Tokenizer(language, whole_file=whole_file, lexer_only=True)
+    valid = mismatches = error_mismatches = 0
+    for code in codes:
+        errors = parser_tk.getTree(code).syntax_errors
+        same = parser_tk.getTokens(code) == lexer_tk.getTokens(code)
+        if errors:
+            error_mismatches += not same
+        else:
+            valid += 1
+            mismatches += not same
+    return valid, mismatches, error_mismatches
+
+
+def lexer_main(argv):
+    arg_parser = argparse.ArgumentParser(prog="benchmark.py lexer",
+                                         description="lexer_onlyのトークン列が構文木から作るトークン列と同じかを，"
+                                                     "言語ごとにファイル全体と1行ずつで確かめる")
+    arg_parser.add_argument("--languages", nargs="+", default=list(LANGUAGE_EXTENSIONS), help="確かめる言語")
+    arg_parser.add_argument("--sizes", nargs="+", type=int, default=[1, 20, 60], help="合成コードの行数")
+    arg_parser.add_argument("--files", type=int, default=3, help="行数ごとのコードの数")
+    arg_parser.add_argument("--paths", nargs="+", default=None, help="合成コードに加えて使うファイル・ディレクトリ")
+    args = arg_parser.parse_args(argv)
+
+    total = 0
+    print("%-10s %-6s %6s %6s %10s %12s" % ("language", "mode", "codes", "valid", "mismatch", "error_diff"))
+    for language in args.languages:
+        codes, lines = lexer_codes(language, args.sizes, args.files)
+        if args.paths:
+            paths = [path for target in args.paths for path in find_files(target, language)]
+            codes += [open(path, "r", encoding="utf-8", errors="replace").read() for path in paths]
+        for mode, inputs, whole_file in (("whole", codes, True), ("line", lines, False)):
+            valid, mismatches, error_mismatches = lexer_mismatches(language, inputs, whole_file)
+            total += mismatches
+            print("%-10s %-6s %6d %6d %10d %12d" % (language, mode, len(inputs), valid, mismatches, error_mismatches))
+    # 構文エラーのあるコードは，構文解析器のエラー回復でトークンが変わるので数えるだけ
+    if total:
+        sys.exit(1)
+
+
+# linesで測るコードの行数と，書き換える数値リテラルの割合
+LINES_SIZES = [1000]
+LINES_RATES = [0.001, 0.01, 0.2]
+
+
+def lines_main(argv):
+    arg_parser = argparse.ArgumentParser(prog="benchmark.py lines",
+                                         description="make_change_set_lineで変更のある行の前後だけを字句解析する速さと，"
+                                                     "ファイル全体を字句解析したときと結果が同じかを確かめる")
+    arg_parser.add_argument("--languages", nargs="+", default=list(LANGUAGE_EXTENSIONS), help="測る言語")
+    arg_parser.add_argument("--sizes", nargs="+", type=int, default=LINES_SIZES, help="合成コードの行数")
+    arg_parser.add_argument("--rates", nargs="+", type=float, default=LINES_RATES, help="書き換える数値リテラルの割合")
+    args = arg_parser.parse_args(argv)
+
+    print("%-10s %6s %6s %8s %10s %10s %8s %6s" % (
+        "language", "lines", "rate", "changes", "whole(s)", "window(s)", "speedup", "same"))
+    mismatches = 0
+    for language in args.languages:
+        tk = Tokenizer(language)
+        for size in args.sizes:
+            source = generate(language, size)
+            for rate in args.rates:
+                target = mutate(source, rate)
+                # 前後の行数をファイルの行数にすると，ファイル全体を1回で字句解析する
+                tk.LINE_CONTEXT = size
+                whole, whole_time = tk.make_change_set_line(source, target), timed(tk.make_change_set_line, source, target)
+                del tk.LINE_CONTEXT
+                window, window_time = tk.make_change_set_line(source, target), timed(tk.make_change_set_line, source, target)
+                same = whole == window
+                mismatches += not same
+                print("%-10s %6d %6.3f %8d %10.3f %10.3f %7.2fx %6s" % (
+                    language, size, rate, len(whole), whole_time, window_time, whole_time / window_time, same))
+    if mismatches:
+        sys.exit(1)
+
+
+# updateで編集する箇所(正規表現)と，置き換える文字列を作る関数
+UPDATE_EDITS = [
+    (r"\b\d+\b", lambda match, k: str(k + 1)),
+    (r"\b[a-z_]+_\d+\b", lambda match, k: match.group() + "x"),
+    (r"(?<= )[-+*] (?=\w)", lambda match, k: "- " if match.group() != "- " else "+ "),
+]
+
+
+def update_outputs(tk, tree):
+    return ([(t.start, t.stop, t.type, t.line, t.column, t.tokenIndex) for t in tree.tokens],
+            tree.toStringTree(recog=tk._recognizers.parser))
+
+
+def update_main(argv):
+    arg_parser = argparse.ArgumentParser(prog="benchmark.py update",
+                                         description="Tokenizer.updateで編集箇所だけを解析し直せた数と，全体を解析し直した"
+                                                     "理由の数，結果がgetTreeと同じかを確かめる")
+    arg_parser.add_argument("--languages", nargs="+", default=["Python", "Java"], help="確かめる言語")
+    arg_parser.add_argument("--size", type=int, default=120, help="合成コードの行数")
+    arg_parser.add_argument("--edits", type=int, default=40, help="編集の回数")
+    args = arg_parser.parse_args(argv)
+
+    mismatches = 0
+    print("%-10s %6s %6s %12s %10s %10s  %s" % (
+        "language", "edits", "same", "incremental", "update(ms)", "full(ms)", "reparse"))
+    for language in args.languages:
+        stats = PhaseStats()
+        tk = Tokenizer(language, whole_file=True, stats=stats)
+        fresh_tk = Tokenizer(language, whole_file=True)
+        code = generate(language, args.size)
+        tree = tk.getTree(code)
+        rng = random.Random(0)
+        same = 0
+        full_time = 0.0
+        stats.clear()
+        for k in range(args.edits):
+            pattern, replace = UPDATE_EDITS[k % len(UPDATE_EDITS)]
+            match = rng.choice(list(re.finditer(pattern, code)))
+            text = replace(match, k)
+            code = code[:match.start()] + text + code[match.end():]
+            tree = tk.update(tree, match.span(), text)
+            start = time.perf_counter()
+            fresh = fresh_tk.getTree(code)
+            full_time += time.perf_counter() - start
+            same += update_outputs(tk, tree) == update_outputs(fresh_tk, fresh)
+        mismatches += args.edits - same
+        summary = stats.summary()
+        counts = summary["update"]["counts"]
+        update_time = sum(x["wall"] for x in summary.values())
+        reparse = " ".join("%s=%d" % (name[len("reparse_"):], count)
+                           for name, count in sorted(counts.items()) if name.startswith("reparse_"))
+        print("%-10s %6d %6d %12d %10.1f %10.1f  %s" % (
+            language, args.edits, same, counts.get("incremental", 0),
+            update_time / args.edits * 1000, full_time / args.edits * 1000, reparse or "-"))
+    if mismatches:
+        sys.exit(1)
+
+
+def main():
+    if sys.argv[1:2] == ["suite"]:
+        suite_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["profile"]:
+        profile_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["indent"]:
+        indent_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["threads"]:
+        threads_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["html"]:
+        html_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["preprocess"]:
+        preprocess_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["snapshot"]:
+        snapshot_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["lexer"]:
+        lexer_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["lines"]:
+        lines_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["update"]:
+        update_main(sys.argv[2:])
+        return
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    languages = sys.argv[2:] or list(SAMPLES)
+    for language in languages:
+        try:
+            bench_tokens(language, repeat)
+            bench_tree(language, repeat)
+            bench_walk(language, repeat)
+            bench_startup(language)
+            bench_diff(language, os.environ.get("BENCH_REPOSITORY", "."))
+        except Exception as e:
+            print(f"{language:<10} failed: {e!r}")
+    bench_deep_walk()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,14 @@
+import argparse
 import csv
 import os
 import re
 import sys
 import json
-from antlr_util.tokenizer import Tokenizer
+from antlr_util.tokenizer import Tokenizer, group_tokens_by_line, detect_language, LANGUAGE_EXTENSIONS
+from antlr_util.parallel import find_files, tokenize_files
+from antlr_util.mining import mine_pairs, MODES
+from antlr_util.stats import PhaseStats
+from antlr_util.writer import RecordWriter, FORMATS, COMPRESSIONS
 import logging
 from pylint import epylint as lint
 from collections import Counter
@@ -13,34 +18,168 @@ logging.basicConfig(filename='ANTLR_STYLE.log',level=logging.DEBUG)
 
 OUT_JSON_NAME = "out/out"
 
+def tokenizer_options(args):
+    """
+    コマンドライン引数から，どの処理でもTokenizerに渡すオプション
+    """
+    return {"lexer_only": args.lexer_only, "dfa_snapshot": args.dfa_snapshot, "skip_html": args.skip_html,
+            "preprocess": args.preprocess, "skip_if0": args.skip_if0}
+
+
+def tokenize_by_line(code_contents, language="Python", writer=None, stats=None, **options):
+    """
+    1行ずつ解析してトークンと構文木を表示する(lexer_onlyならトークンだけ)
+    writerを渡したときは1行ごとに1レコードとして書き出す
+    """
+    TK = Tokenizer(language, stats=stats, **options)
+    splitted_contents = code_contents.splitlines()
+    for line_number, line in enumerate(splitted_contents, 1):
+        # 行単位でトークン化
+        tokens = TK.getTokens(line)
+        if TK.LEXER_ONLY:
+            if writer is not None:
+                writer.write({"line": line_number, "tokens": tokens})
+            else:
+                print(tokens)
+            continue
+
+        # 抽象構文木を生成
+        tree = TK.getTree(line)
+        # 構文木からトークンを生成
+        tokens2 = TK.makeTokens(tree, [])
+        if writer is not None:
+            writer.write({"line": line_number, "tokens": tokens,
+                          "tree": tree.toStringTree(recog=TK.Parser), "tree_tokens": tokens2})
+            continue
+        print(tree)
+        print(tokens)
+        print(tokens2)
+
+
+def tokenize_whole_file(code_contents, language="Python", writer=None, stats=None, **options):
+    """
+    ファイル全体を1回だけ字句解析・構文解析し，トークンを行ごとに表示する
+    options: Tokenizerに渡すオプション(tokenizer_options)
+    """
+    TK = Tokenizer(language, whole_file=True, stats=stats, **options)
+    tokens = TK.getTokens(code_contents)
+    for line_number, line_tokens in sorted(group_tokens_by_line(code_contents, tokens).items()):
+        if writer is not None:
+            writer.write({"line": line_number, "tokens": line_tokens})
+            continue
+        print(line_number, line_tokens)
+
+
+def tokenize_corpus(args, writer=None, stats=None):
+    """
+    ディレクトリやglobに含まれるファイルをプロセスプールでトークン化して表示する
+    writerを渡したときは1ファイルごとに1レコードとして書き出す
+    """
+    paths = find_files(args.target_code_path, args.lang)
+    results = tokenize_files(paths, jobs=args.jobs, language=args.lang, ordered=not args.unordered,
+                             stats=stats, **tokenizer_options(args))
+    for path, language, tokens, error in results:
+        if writer is not None:
+            writer.write({"path": path, "language": language, "tokens": tokens, "error": error})
+            continue
+        if error is not None:
+            logging.warning("%s: %s", path, error)
+            continue
+        print(path, language)
+        print(tokens)
+
+
+def mine_pair_file(args, stats=None):
+    """
+    before/afterの組のJSONLから差分を求めて書き出す
+    """
+    output = args.output or OUT_JSON_NAME + FORMATS["jsonl"]
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    language = "Python" if args.lang == "auto" else args.lang
+    count = mine_pairs(args.target_code_path, output, jobs=args.jobs, mode=args.pairs,
+                       checkpoint=args.checkpoint, language=language,
+                       stats=stats, **tokenizer_options(args))
+    logging.info("%d pairs written to %s", count, output)
+
+
 def main():
     """
     The main
     """
-    if len(sys.argv) > 1:
-        target_code_path = sys.argv[1]
+    arg_parser = argparse.ArgumentParser(
+        usage="python %(prog)s target_code_path [--whole-file] [--jobs N] [--lang LANG] "
+              "[--format {print,jsonl,binary}] [--output PATH] [--compress {gzip,lzma}] "
+              "[--pairs {abstract,change_set}] [--checkpoint PATH] [--stats]")
+    arg_parser.add_argument("target_code_path", help="ファイル，ディレクトリ，またはglobパターン")
+    arg_parser.add_argument("--whole-file", action="store_true",
+                            help="ファイル全体を1回で解析し，トークンを行ごとにまとめて表示する")
+    arg_parser.add_argument("--jobs", type=int, default=1,
+                            help="ディレクトリやglobを処理するプロセス数")
+    arg_parser.add_argument("--lang", default="auto", choices=["auto"] + list(LANGUAGE_EXTENSIONS),
+                            help="対象の言語．autoなら拡張子から推定する")
+    arg_parser.add_argument("--unordered", action="store_true",
+                            help="入力順ではなく処理が終わった順に出力する")
+    arg_parser.add_argument("--lexer-only", action="store_true",
+                            help="構文解析をせず字句解析だけでトークン化する")
+    arg_parser.add_argument("--dfa-snapshot", default=None,
+                            help="各プロセスで読み込むDFAのスナップショット")
+    arg_parser.add_argument("--format", default="print", choices=["print"] + list(FORMATS),
+                            help="printなら従来どおり表示し，jsonl/binaryならレコードとして書き出す")
+    arg_parser.add_argument("--output", default=None,
+                            help="jsonl/binaryの出力先．省略時は%s.<形式>，-なら標準出力" % OUT_JSON_NAME)
+    arg_parser.add_argument("--compress", default=None, choices=[x for x in COMPRESSIONS if x],
+                            help="出力を圧縮する")
+    arg_parser.add_argument("--pairs", default=None, choices=list(MODES),
+                            help="target_code_pathを{before, after, language}の組のJSONLとして読み，"
+                                 "組ごとの差分をJSONLで書き出す")
+    arg_parser.add_argument("--checkpoint", default=None,
+                            help="--pairsの進み具合を保存するファイル．あれば続きから処理する")
+    arg_parser.add_argument("--skip-html", action="store_true",
+                            help="PHPのブロックの外のHTMLを字句解析せず，まとめて1つのトークンにする(速い)")
+    arg_parser.add_argument("--preprocess", action="store_true",
+                            help="C++の前処理の行とコメントを取り除いてから解析する(トークンの位置は元のファイルのもの)")
+    arg_parser.add_argument("--skip-if0", action="store_true",
+                            help="--preprocessに加え，#if 0などの使われない分岐も取り除く")
+    arg_parser.add_argument("--stats", action="store_true",
+                            help="字句解析・構文解析・木の走査・差分の時間と数の集計を標準エラー出力に表示する")
+    args = arg_parser.parse_args()
+    stats = PhaseStats() if args.stats else None
+
+    if args.pairs is not None:
+        mine_pair_file(args, stats)
+    elif args.format == "print":
+        run(args, None, stats)
     else:
-        print("""Usage: python %s target_code_path""" % sys.argv[0])
-        sys.exit()
+        output = args.output
+        if output is None:
+            output = OUT_JSON_NAME + FORMATS[args.format] + COMPRESSIONS[args.compress]
+        if output != "-" and os.path.dirname(output):
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+        with RecordWriter(output, args.format, args.compress) as writer:
+            run(args, writer, stats)
+    if stats is not None:
+        print(stats.format(), file=sys.stderr)
+
+
+def run(args, writer, stats=None):
+    if not os.path.isfile(args.target_code_path):
+        tokenize_corpus(args, writer, stats)
+        return
 
-    TK = Tokenizer("Python")
+    language = args.lang
+    if language == "auto":
+        language = detect_language(args.target_code_path) or "Python"
 
     # 対象ファイルを読み込む
-    with open(target_code_path, "r") as target_file:
+    with open(args.target_code_path, "r") as target_file:
         code_contents = target_file.read()
-        splitted_contents = code_contents.splitlines()
-        for line in splitted_contents:
-            # 行単位でトークン化
-            tokens = TK.getTokens(line)
-
-            # 抽象構文木を生成
-            tree = TK.getTree(line)
-            # 構文木からトークンを生成
-            tokens2 = TK.makeTokens(tree, [])
-            print(tree)
-            print(tokens)
-            print(tokens2)
-        
+
+    if args.whole_file:
+        tokenize_whole_file(code_contents, language, writer, stats, **tokenizer_options(args))
+    else:
+        tokenize_by_line(code_contents, language, writer, stats, **tokenizer_options(args))
+
 
 if __name__ == '__main__':
     main()